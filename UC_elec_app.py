@@ -5,53 +5,76 @@ import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 
+import os
 from datetime import datetime, timezone
 
 from clean_vreg_functions import *
+from registr_dt_functions import REGISTR_FREQS
+from turnout_rate_functions import turnout_rates, TURNOUT_GROUP_COLS
+from clean_cache_functions import CleanCache
+from county_data_functions import CountyStore, NC_COUNTIES, UNION_COUNTY_ID, get_county_name
+from model_registry_functions import ModelRegistry
 
 # import request_ucvreg_data as rud
 
 
 ## Settings for app page
 st.set_page_config(
-    page_title='Union County Registered Voters',
+    page_title='NC Registered Voters',
     layout='centered',
     initial_sidebar_state='auto',
     page_icon=':us:'
 )
 
 ## Import DataFrames
-gen_elecs_df = pd.read_csv('App_Data/UC_gen_elecs.gz')
+GEN_ELECS_PATH = 'App_Data/UC_gen_elecs.gz'
+gen_elecs_df = pd.read_csv(GEN_ELECS_PATH)
+
+## Turnout rates and confidence intervals for every year, group and subgroup,
+  # computed once per version of the general elections file (keyed by its
+  # modification time rather than by hashing the data on every rerun)
+@st.cache(allow_output_mutation=True)
+def get_file_turnout_rates(path, mtime):
+    return turnout_rates(pd.read_csv(path))
+
+turnout_rates_df = get_file_turnout_rates(GEN_ELECS_PATH, os.path.getmtime(GEN_ELECS_PATH))
 
 # uc_vreg_df = pd.read_csv('App_Data/UC_vreg_Jan4.gz')
-url = "https://s3.amazonaws.com/dl.ncsbe.gov/data/ncvoter90.zip"
 
 # sunday = 0
 # if datetime.today().weekday() == 6:
 #     sunday = datetime.now(timezone.utc).strftime("%m/%d/%Y")
 
-@st.cache
-def get_ucvreg_data(url):
-    
-    uc_vreg_data = pd.read_table(url, encoding='ISO-8859-1')
-    uc_vreg_df = clean_vreg(uc_vreg_data)
-
-    dt_retrieved = datetime.now(
-        timezone.utc
-    ).astimezone().strftime(
-        "%m/%d/%Y %H:%M:%S %Z"
+## Voter registration data is loaded per county only once a county is selected,
+  # keeping the most recently selected counties in memory up to the budget
+@st.cache(allow_output_mutation=True)
+def get_county_store():
+    return CountyStore(
+        mem_budget_mb=float(os.environ.get('VREG_MEM_BUDGET_MB', 1024)),
+        clean_cache=CleanCache()
     )
 
-    return uc_vreg_df, dt_retrieved
+county_store = get_county_store()
+
+## The turnout model is loaded from the model registry once per process, as its
+  # table of predictions (and SHAP values) for every combination of demographics,
+  # so each prediction is a table lookup rather than a model call
+TURNOUT_MODEL_NAME = os.environ.get('TURNOUT_MODEL_NAME', 'union_rf_bin')
 
+@st.cache(allow_output_mutation=True)
+def get_turnout_model(name):
+    registry = ModelRegistry(os.environ.get('MODEL_REGISTRY_DIR', 'App_Data/models'))
+    meta = registry.load_meta(name)
+    scorer = registry.load_lookup(name, meta['version'])
 
-uc_vreg_df, dt_retrieved = get_ucvreg_data(url)
-# uc_vreg_df = rud.vreg_data.clean_df
-# uc_vreg_data.sched_retrieval(url)
-# uc_vreg_df = uc_vreg_data.clean_df
+    # The SHAP breakdown is optional, since it has to be compiled separately
+      # (OSError if its file is missing from the version's directory)
+    try:
+        category_shap = registry.load_shap(name, meta['version'])
+    except (ValueError, OSError):
+        category_shap = None
 
-## Recast registr_dt as datetime variable
-uc_vreg_df['registr_dt'] = pd.to_datetime(uc_vreg_df['registr_dt'])
+    return meta, scorer, category_shap
 
 
 ##########################################################################
@@ -114,6 +137,8 @@ def norm_label(arg):
         return 'Count'
     if arg=='percent':
         return 'Percent'
+    if arg=='rate':
+        return 'Turnout Rate'
 
 
 
@@ -1109,6 +1134,127 @@ def grp_yr_hist(df, group_col_1, title=None, barmode='group',
 
 
 
+#################################################################################
+#################################################################################
+#################################################################################
+#################################################################################
+#################################################################################
+#################################################################################
+
+
+def rate_yr_bar(rates, group_col_1, title=None, template='seaborn'):
+    """Takes a turnout rate table (from turnout_rates), filters it to 
+        the specified column, then color-codes by election year to create a 
+        Plotly bar chart of turnout rates with 95% confidence interval error bars.
+
+    Args:
+        rates (DataFrame): Turnout rate table with columns 'year', 'group_col',
+            'subgroup', 'rate', 'ci_low', and 'ci_high'
+        group_col_1 (str): Name of the column by which to group
+        title (str, optional): Title for the resulting plot. If none is provided,
+            defaults to 'Turnout Rate by labels[{group_col_1}] and Election Year'.
+        template (str, optional): Plotly style template. Defaults to 'seaborn'.
+
+    Returns:
+        Figure: Plotly bar chart of turnout rates grouped by group_col_1 and 
+            color-coded by election year. 
+    """    
+
+    title_dict = {
+        'font' : {
+            'family':'Arial Black',
+            'size':24
+        },
+        'y': 0.85
+    }
+
+    leg_dict = {
+        'font' : {
+            'family':'Arial Black',
+            'size':13
+        },
+        'title': ''
+    }
+
+    ax_title_font_dict = {
+        'family':'Arial Black',
+        'size':18
+    }
+
+    ax_tick_font_dict = {
+        'family':'Arial Black',
+        'size':15
+    }
+
+
+    cat_orders = {
+        'year': ['2012', '2016', '2020'],
+        'gen_grp': ['GenZ', 'Millennial', 'GenX',
+                    'Boomer', 'Greatest-Silent'],
+        'party_grp': ['Dem', 'Rep', 'Other'],
+        'race_grp': ['White', 'Black', 'Undesig.', 'Other'],
+        'gender_code': ['F', 'M', 'U'],
+        'birth_reg_other': ['South', 'Missing', 'Northeast',
+                            'Midwest', 'Other', 'West'],
+        'drivers_lic': ['License', 'No License'],
+        'city_grp': ['Monroe', 'Waxhaw', 'Indian Trail',
+                     'Matthews', 'Other']
+    }
+
+    color_map = {
+            '2012': 'darkviolet',
+            '2016': 'limegreen',
+            '2020': 'orangered'
+        }
+
+
+    col_rates = rates[rates['group_col']==group_col_1].copy()
+    col_rates['year'] = col_rates['year'].astype(str)
+    col_rates['pct'] = col_rates['rate'] * 100
+    col_rates['err_plus'] = (col_rates['ci_high'] - col_rates['rate']) * 100
+    col_rates['err_minus'] = (col_rates['rate'] - col_rates['ci_low']) * 100
+
+    if title is None:
+        title = 'Turnout Rate by {}'.format(format_col_names(group_col_1))
+
+    fig = px.bar(col_rates, x='subgroup', y='pct', color='year',
+                 error_y='err_plus', error_y_minus='err_minus',
+                 color_discrete_map=color_map, barmode='group',
+                 title=title,
+                 category_orders={'year': cat_orders['year'],
+                                  'subgroup': cat_orders.get(group_col_1, [])},
+                 hover_data={'n': True, 'n_voted': True,
+                             'err_plus': False, 'err_minus': False},
+                 labels={'subgroup': format_col_names(group_col_1),
+                         'year': 'Election Year',
+                         'pct': 'Turnout Rate (%)',
+                         'n': 'Registered Voters',
+                         'n_voted': 'Voted'},
+                 template=template
+                )
+
+    fig.update_yaxes(title='Percent of Registered Voters Who Voted')
+
+    fig.update_layout(
+        title=title_dict,
+        legend=leg_dict
+        )
+
+    fig.update_yaxes(
+        title_font=ax_title_font_dict,
+        tickfont=ax_tick_font_dict
+    )
+
+    fig.update_xaxes(
+        title_font=ax_title_font_dict,
+        tickfont=ax_tick_font_dict
+    )
+
+
+    return fig
+
+
+
 #################################################################################
 #################################################################################
 #################################################################################
@@ -2404,6 +2550,32 @@ def multi_grp_pie(df, group_col_1, group_col_2, col_1_cat,
 ##########################################################################
 ##########################################################################
 
+## Colours of a county's city groups, largest city first (the first four are
+  # those of Monroe, Waxhaw, Indian Trail and Matthews in Union County)
+CITY_COLORS = ['#FD3216', '#00FE35', '#6A76FC', '#0DF9FF', '#FE00CE', '#FF9616',
+               '#479B55', '#DC587D', '#D626FF', '#6E899C', '#00B5F7', '#B68E00']
+
+## Define function for ordering and colour-coding the city groups of a county
+def get_city_map(df):
+    """Takes a county's voter registration DataFrame and returns the order of
+        its city groups (largest first, followed by 'Other' and 'Missing')
+        and a color_discrete_map giving each a colour.
+    """
+
+    city_counts = df['city_grp'].value_counts()
+    cities = [city for city in city_counts.index if city not in ['Other', 'Missing']]
+
+    city_order = cities + [city for city in ['Other', 'Missing'] if city in city_counts.index]
+
+    color_map = {city: CITY_COLORS[i % len(CITY_COLORS)] for i, city in enumerate(cities)}
+    color_map.update({
+        'Other': '#F6F926',
+        'Missing': '#EEA6FB'
+    })
+
+    return city_order, color_map
+
+
 @st.cache
 def registr_pie(df, col, title=None,
                   template='seaborn', showlegend=True):
@@ -2519,14 +2691,7 @@ def registr_pie(df, col, title=None,
         
     
     if col == 'city_grp':
-        color_map = {
-            'Monroe': '#FD3216',
-            'Waxhaw': '#00FE35',
-            'Indian Trail': '#6A76FC',
-            'Matthews': '#0DF9FF',
-            'Other': '#F6F926',
-            'Missing': '#EEA6FB'
-        }
+        color_map = get_city_map(df)[1]
         labels.update({'city_grp': 'City'})
     
     
@@ -2703,20 +2868,8 @@ def registr_hist(df, col, title=None, template='seaborn'):
         
     
     if col == 'city_grp':
-        color_map = {
-            'Monroe': '#FD3216',
-            'Waxhaw': '#00FE35',
-            'Indian Trail': '#6A76FC',
-            'Matthews': '#0DF9FF',
-            'Other': '#F6F926',
-            'Missing': '#EEA6FB'
-        }
-        cat_orders.update({'city_grp': ['Monroe',
-                                        'Waxhaw',
-                                        'Indian Trail',
-                                        'Matthews',
-                                        'Other',
-                                        'Missing']})
+        city_order, color_map = get_city_map(df)
+        cat_orders.update({'city_grp': city_order})
         labels.update({'city_grp': 'City'})
         
    
@@ -2909,21 +3062,9 @@ def registr_stack_bar(df, group_col_1, group_col_2, title=None,
 
 
     if group_col_2 == 'city_grp':
-        color_map = {
-            'Monroe': '#FD3216',
-            'Waxhaw': '#00FE35',
-            'Indian Trail': '#6A76FC',
-            'Matthews': '#0DF9FF',
-            'Other': '#F6F926',
-            'Missing': '#EEA6FB'
-        }
+        color_map = get_city_map(df)[1]
     if (group_col_1 == 'city_grp') | (group_col_2 == 'city_grp'):
-        cat_orders.update({'city_grp': ['Monroe',
-                                        'Waxhaw',
-                                        'Indian Trail',
-                                        'Matthews',
-                                        'Other',
-                                        'Missing']})
+        cat_orders.update({'city_grp': get_city_map(df)[0]})
         labels.update({'city_grp': 'City'})
 
 
@@ -3154,20 +3295,8 @@ def compare_age_distr(df, group_col, group_cats, all_reg_voters=True,
 
 
     if group_col == 'city_grp':
-        color_map = {
-            'Monroe': '#FD3216',
-            'Waxhaw': '#00FE35',
-            'Indian Trail': '#6A76FC',
-            'Matthews': '#0DF9FF',
-            'Other': '#F6F926',
-            'Missing': '#EEA6FB'
-        }
-        cat_orders.update({'city_grp': ['Monroe',
-                                        'Waxhaw',
-                                        'Indian Trail',
-                                        'Matthews',
-                                        'Other',
-                                        'Missing']})
+        city_order, color_map = get_city_map(df)
+        cat_orders.update({'city_grp': city_order})
         labels.update({'city_grp': 'City'})
         
     
@@ -3253,6 +3382,214 @@ def compare_age_distr(df, group_col, group_cats, all_reg_voters=True,
 #################################################################################
 
 
+def registr_dt_line(ts, group_col=None, freq='M', cumulative=False,
+                    start=None, end=None, title=None, template='seaborn'):
+    """Takes a RegistrTimeSeries and returns a Plotly line chart of the number
+        of voters registered over time, optionally color-coded by a column.
+
+    Args:
+        ts (RegistrTimeSeries): Precomputed registration counts by date
+        group_col (str, optional): Name of the column by which to group. If None,
+            plots all registered voters. Defaults to None.
+        freq (str, optional): 'D' (daily), 'W' (weekly) or 'M' (monthly).
+            Defaults to 'M'.
+        cumulative (bool, optional): Whether to plot the running total of registered
+            voters instead of the number registered in each period. Defaults to False.
+        start (date, optional): First registration date to display. Defaults to None.
+        end (date, optional): Last registration date to display. Defaults to None.
+        title (str, optional): Title for the resulting plot. If none is provided,
+            defaults to '{freq} Voter Registrations by {group_col}'.
+        template (str, optional): Plotly style template. Defaults to 'seaborn'
+
+    Returns:
+        Figure: Plotly line chart of registrations over time.
+    """
+
+    title_dict = {
+        'font' : {
+            'family':'Arial Black',
+            'size':24
+        }
+    }
+
+    leg_dict = {
+        'font' : {
+            'family':'Arial Black',
+            'size':13
+        },
+        'title': ''
+    }
+
+    ax_title_font_dict = {
+        'family':'Arial Black',
+        'size':18
+    }
+
+    ax_tick_font_dict = {
+        'family':'Arial Black',
+        'size':15
+    }
+
+
+    counts = ts.query(group_col, start=start, end=end,
+                      freq=freq, cumulative=cumulative)
+    counts.columns = [format_cat_names(cat) for cat in counts.columns]
+
+    if title is None:
+        if cumulative:
+            title = 'Total Registered Voters'
+        else:
+            title = '{} Voter Registrations'.format(REGISTR_FREQS[freq])
+        if group_col is not None:
+            title += ' by {}'.format(format_col_names(group_col))
+
+    fig = px.line(counts, x=counts.index, y=list(counts.columns),
+                  title=title, template=template)
+
+    if cumulative:
+        fig.update_yaxes(title='Number of Registered Voters')
+    else:
+        fig.update_yaxes(title='Number of New Registrations')
+
+    fig.update_xaxes(title=format_col_names('registr_dt'))
+
+    fig.update_layout(
+        title=title_dict,
+        legend=leg_dict,
+        showlegend=group_col is not None
+        )
+
+    fig.update_yaxes(
+        title_font=ax_title_font_dict,
+        tickfont=ax_tick_font_dict
+    )
+
+    fig.update_xaxes(
+        title_font=ax_title_font_dict,
+        tickfont=ax_tick_font_dict
+    )
+
+
+    return fig
+
+
+#################################################################################
+#################################################################################
+#################################################################################
+#################################################################################
+#################################################################################
+#################################################################################
+
+
+##########################################################################
+##########################################################################
+##########################################################################
+##########################################################################
+###### Turnout Prediction Page Functions
+##########################################################################
+##########################################################################
+
+def shap_waterfall(expected_value, shap_values, feature_cols, values, p_vote,
+                   output='probability', title=None, template='seaborn'):
+    """Takes the SHAP values of a single voter (one per demographic column)
+        and returns a Plotly waterfall chart of how each of the voter's
+        categories moves the model's prediction away from that of the
+        average voter.
+
+    Args:
+        expected_value (float): The model's average output (the SHAP
+            explainer's expected value).
+        shap_values (array): SHAP value of each demographic column.
+        feature_cols (list of str): Names of the demographic columns.
+        values (list of str): The voter's category of each column.
+        p_vote (float): The voter's predicted probability of voting.
+        output (str, optional): 'probability' or 'log_odds', the units the
+            SHAP values add up to. Defaults to 'probability'.
+        title (str, optional): Title for the resulting plot. If none is provided,
+            defaults to 'What Drives the Prediction'.
+        template (str, optional): Plotly style template. Defaults to 'seaborn'
+
+    Returns:
+        Figure: Plotly waterfall chart of the voter's SHAP values.
+    """
+
+    title_dict = {
+        'font' : {
+            'family':'Arial Black',
+            'size':24
+        }
+    }
+
+    ax_title_font_dict = {
+        'family':'Arial Black',
+        'size':18
+    }
+
+    ax_tick_font_dict = {
+        'family':'Arial Black',
+        'size':15
+    }
+
+
+    if output=='probability':
+        val_fmt = '{:+.1%}'
+        base_text = '{:.1%}'.format(expected_value)
+        ax_title = 'Probability of Voting'
+    else:
+        val_fmt = '{:+.2f}'
+        base_text = '{:.2f}'.format(expected_value)
+        ax_title = 'Log Odds of Voting'
+
+    labels = [
+        '{}: {}'.format(format_col_names(col), format_cat_names(val))
+        for col, val in zip(feature_cols, values)
+    ]
+
+    if title is None:
+        title = 'What Drives the Prediction'
+
+    fig = go.Figure(go.Waterfall(
+        orientation='h',
+        measure=['absolute'] + ['relative']*len(labels) + ['total'],
+        y=['Average Voter'] + labels + ['This Voter'],
+        x=[expected_value] + [float(val) for val in shap_values] + [0],
+        text=[base_text] + [val_fmt.format(val) for val in shap_values]
+            + ['{:.1%} chance of voting'.format(p_vote)],
+        textposition='outside',
+        connector={'line': {'color': 'gray'}}
+    ))
+
+    fig.update_layout(
+        title=title,
+        template=template,
+        showlegend=False
+        )
+
+    fig.update_layout(title=title_dict)
+
+    fig.update_yaxes(
+        autorange='reversed',
+        tickfont=ax_tick_font_dict
+    )
+
+    fig.update_xaxes(
+        title=ax_title,
+        title_font=ax_title_font_dict,
+        tickfont=ax_tick_font_dict
+    )
+
+
+    return fig
+
+
+#################################################################################
+#################################################################################
+#################################################################################
+#################################################################################
+#################################################################################
+#################################################################################
+
+
 ##########################################################################
 ##########################################################################
 ##########################################################################
@@ -3269,15 +3606,42 @@ def compare_age_distr(df, group_col, group_cats, all_reg_voters=True,
 ###### Define Sidebar for Navigation
 ##########################################################################
 ##########################################################################
+side_title = st.sidebar.header(
+    'Choose County:'
+)
+
+## Choose county to explore, only loading its data once selected
+side_county = st.sidebar.selectbox(
+    label='',
+    options=list(range(1, len(NC_COUNTIES) + 1)),
+    index=UNION_COUNTY_ID - 1,
+    format_func=get_county_name,
+    key='county_sel'
+)
+
+county_data = county_store.get(side_county)
+county_name = county_data.name
+vreg_df = county_data.vreg_df
+dt_retrieved = county_data.dt_retrieved
+registr_ts = county_data.registr_ts
+
+st.sidebar.markdown('***')
+
 side_title = st.sidebar.header(
     'Choose Page to Display:'
 )
 st.sidebar.write('')
 
-## Choose to explore Voter Turnout or Voter Registration trends
+## Choose to explore Voter Turnout or Voter Registration trends, or predict turnout
+  # (voter turnout data and the turnout model are only available for Union County)
+if side_county==UNION_COUNTY_ID:
+    side_main_opts = ['Voter Turnout', 'Voter Registration', 'Turnout Prediction']
+else:
+    side_main_opts = ['Voter Registration']
+
 side_main_radio = st.sidebar.radio(
     label='',
-    options=['Voter Turnout', 'Voter Registration'],
+    options=side_main_opts,
     index=0,
     key='main_radio_sel'
 )
@@ -3346,11 +3710,23 @@ if side_main_radio=='Voter Registration':
         key='registr_stat_age'
     )
 
-    # side_registr_dt = st.sidebar.checkbox(
-    #     label='Registration Date',
-    #     value=True,
-    #     key='registr_date'
-    # )
+    side_registr_dt = st.sidebar.checkbox(
+        label='Registration Date',
+        value=True,
+        key='registr_date'
+    )
+
+## Section options for predicting Voter Turnout
+if side_main_radio=='Turnout Prediction':
+    side_predict = st.sidebar.subheader(
+        'Predict Voter Turnout'
+    )
+
+    side_pred_shap = st.sidebar.checkbox(
+        label='Explain Prediction',
+        value=True,
+        key='pred_shap'
+    )
     
 
 st.sidebar.write('')
@@ -3378,7 +3754,11 @@ st.sidebar.markdown(
 if side_main_radio=='Voter Turnout':
     st.title('Registered Voter Participation in Union County, North Carolina')
 if side_main_radio=='Voter Registration':
-    st.title('Registered Voter Demographics in Union County, North Carolina')
+    st.title('Registered Voter Demographics in {} County, North Carolina'.format(
+        county_name
+    ))
+if side_main_radio=='Turnout Prediction':
+    st.title('Predicted Voter Turnout in Union County, North Carolina')
 
 ## Introduction 
 # Define container for the section
@@ -3396,7 +3776,8 @@ intro.markdown(
         This dashboard allows you to interactively explore and visualize 
         trends in registered voter turnout in Union County, NC for the
         2012, 2016, and 2020 general elections. You can also explore the demographics
-        of the current population of voters registered within the county. 
+        of the current population of voters registered within Union County
+        or any other North Carolina county. 
         Use the sidebar selection menu to choose to explore either voter turnout
         or voter registration and to display/hide sections.
         """
@@ -3449,6 +3830,24 @@ if side_main_radio=='Voter Registration':
 
     data_note.markdown('**Data last retrieved: {}**'.format(dt_retrieved))
 
+if side_main_radio=='Turnout Prediction':
+    data_note = intro.beta_expander(
+        'Important Note for Interpreting Predictions:',
+        expanded=True
+    )
+    data_note.markdown(
+        """
+        Predictions come from a classifier trained on whether registered 
+        voters in Union County voted in the 2012, 2016, and 2020 general 
+        elections, using only the demographics you can choose below. They
+        describe how often voters like the one you choose have voted, 
+        **NOT** whether any particular person will vote.\n\n The 
+        explanation breaks the prediction down into how much each of the 
+        voter's characteristics raises or lowers it compared to the average 
+        voter, using [SHAP values](https://shap.readthedocs.io/).
+        """
+    )
+
 plotly_note = intro.beta_expander(
     'Interactive Graph Functionality:'
 )
@@ -3709,23 +4108,42 @@ if side_main_radio=='Voter Turnout':
             key='gyr_col'
         )
 
-        # Choose raw count or percent
+        # Choose raw count, percent or (for demographic columns) turnout rate
+        gyrhist_norm_opt = [None, 'percent']
+        if gyrhist_group_col in TURNOUT_GROUP_COLS:
+            gyrhist_norm_opt.append('rate')
+
         gyrhist_norm = gyr_col_2.radio(
             label='Display as: ',
-            options = [None, 'percent'],
+            options = gyrhist_norm_opt,
             index=0,
             format_func=norm_label,
             key='gyr_norm'
         )
 
+        # Plot turnout rates with confidence intervals straight from the rate table
+        if gyrhist_norm=='rate':
+            gyr_hist = rate_yr_bar(
+                turnout_rates_df,
+                gyrhist_group_col
+            )
+
         # Plot histogram grouped by election year
-        gyr_hist = grp_yr_hist(
-            gen_elecs_df,
-            gyrhist_group_col,
-            histnorm=gyrhist_norm
-        )
+        else:
+            gyr_hist = grp_yr_hist(
+                gen_elecs_df,
+                gyrhist_group_col,
+                histnorm=gyrhist_norm
+            )
         grpby_yr.plotly_chart(gyr_hist, use_container_width=True)
 
+        if gyrhist_norm=='rate':
+            grpby_yr.markdown(
+                '''
+                Error bars show 95% Wilson confidence intervals for the turnout rate.
+                '''
+            )
+
         grpby_yr.markdown('***')
 
 
@@ -3931,14 +4349,14 @@ if side_main_radio=='Voter Registration':
         if svd_chart_type=='Bar':
             # Plot basic histogram
             svd_hist = registr_hist(
-                uc_vreg_df, svd_group_col
+                vreg_df, svd_group_col
             )
             single_var_demog.plotly_chart(svd_hist, use_container_width=True)
         
         if svd_chart_type=='Pie':
             # Plot basic pie chart
             svd_pie = registr_pie(
-                uc_vreg_df, svd_group_col
+                vreg_df, svd_group_col
             )
             single_var_demog.plotly_chart(svd_pie, use_container_width=True)
 
@@ -3996,7 +4414,7 @@ if side_main_radio=='Voter Registration':
 
         # Plot stacked bar chart
         gbd_bar = registr_stack_bar(
-            uc_vreg_df,
+            vreg_df,
             gbd_group_col_1,
             gbd_group_col_2
         )
@@ -4037,7 +4455,7 @@ if side_main_radio=='Voter Registration':
         adistr_col_cat_opt = ['All']
         for opt in adistr_col_opt:
             if adistr_group_col==opt:
-                for label in uc_vreg_df[adistr_group_col].unique():
+                for label in vreg_df[adistr_group_col].unique():
                     adistr_col_cat_opt.append(label)
 
         adistr_col_cats = adistr_col_2.multiselect(
@@ -4062,7 +4480,7 @@ if side_main_radio=='Voter Registration':
         
         if len(adistr_col_cats)!=0:
             adistr_hist = compare_age_distr(
-                uc_vreg_df,
+                vreg_df,
                 adistr_group_col,
                 adistr_col_cats,
                 all_reg_voters=all_reg_voters
@@ -4074,14 +4492,163 @@ if side_main_radio=='Voter Registration':
         age_distr_demog.markdown('***')
 
     
-    # if side_registr_dt:
-    #     ##########################################################################
-    #     ##########################################################################
-    #     ##########################################################################
-    #     ## Explore registration date trends
-    #     # Define container for section
-    #     registr_dt_demog = st.beta_container()
-    #     registr_dt_demog.header('Explore registered voter demographics:')
-    #     registr_dt_demog.subheader('Trends in registration date:')
-    #     registr_dt_demog.title('Section Coming Soon!')
+    if side_registr_dt:
+        ##########################################################################
+        ##########################################################################
+        ##########################################################################
+        ## Explore registration date trends
+        # Define container for section
+        registr_dt_demog = st.beta_container()
+        registr_dt_demog.header('Explore registered voter demographics:')
+        registr_dt_demog.subheader('Trends in registration date:')
+        rdt_col_1, rdt_col_2, rdt_col_3 = registr_dt_demog.beta_columns(3)
+
+        # Choose column to group by/ investigate
+        rdt_col_opt = [
+            None, 'voter_status_desc', 'gen_grp',
+            'party_grp', 'gender_code', 'race_grp',
+            'birth_reg_other', 'drivers_lic', 'city_grp'
+        ]
+
+        rdt_group_col = rdt_col_1.selectbox(
+            label='Group by: ',
+            options = rdt_col_opt,
+            index=0,
+            format_func=lambda col: 'All Voters' if col is None else format_col_names(col),
+            key='rdt_col'
+        )
+
+        # Choose daily, weekly or monthly counts
+        rdt_freq = rdt_col_2.radio(
+            label='Count registrations: ',
+            options = list(REGISTR_FREQS),
+            index=2,
+            format_func=lambda freq: REGISTR_FREQS[freq],
+            key='rdt_freq'
+        )
+
+        # Choose new registrations or running total
+        rdt_cumulative = rdt_col_3.radio(
+            label='Display as: ',
+            options = [False, True],
+            index=0,
+            format_func=lambda cum: 'Running Total' if cum else 'New Registrations',
+            key='rdt_cumulative'
+        )
+
+        # Choose range of registration dates
+        rdt_range = registr_dt_demog.date_input(
+            label='Registration dates: ',
+            value=(
+                pd.Timestamp(registr_ts.start).date(),
+                pd.Timestamp(registr_ts.end).date()
+            ),
+            min_value=pd.Timestamp(registr_ts.start).date(),
+            max_value=pd.Timestamp(registr_ts.end).date(),
+            key='rdt_range'
+        )
+
+        # Plot registrations over time once both ends of the range are chosen
+        if len(rdt_range)!=2:
+            registr_dt_demog.subheader('''
+            Please select both a start and end date.
+            ''')
+
+        if len(rdt_range)==2:
+            rdt_line = registr_dt_line(
+                registr_ts,
+                rdt_group_col,
+                freq=rdt_freq,
+                cumulative=rdt_cumulative,
+                start=rdt_range[0],
+                end=rdt_range[1]
+            )
+
+            registr_dt_demog.plotly_chart(rdt_line, use_container_width=True)
+
+        registr_dt_demog.markdown('***')
+
+
+
+##########################################################################
+##########################################################################
+##########################################################################
+##########################################################################
+###### TURNOUT PREDICTION SECTION
+##########################################################################
+##########################################################################
+if side_main_radio=='Turnout Prediction':
+    # Define container for section
+    predict = st.beta_container()
+    predict.header('Predict whether a registered voter will vote:')
+
+    # Load the registered model's lookup tables (only once per process); a missing
+      # registry directory or file means no model is available either
+    try:
+        model_meta, model_scorer, model_shap = get_turnout_model(TURNOUT_MODEL_NAME)
+    except (ValueError, OSError):
+        model_scorer = None
+        predict.subheader('''
+        No turnout model named "{}" has been registered with a lookup table.
+        '''.format(TURNOUT_MODEL_NAME))
+
+    if model_scorer is not None:
+        predict.subheader('Choose the demographics of a voter:')
+        pred_cols = predict.beta_columns(2)
+
+        # Choose a category of each of the model's features
+        pred_values = {}
+        for i, (pred_col, pred_cats) in enumerate(zip(model_scorer.feature_cols,
+                                                      model_scorer.categories)):
+            pred_values[pred_col] = pred_cols[i % 2].selectbox(
+                label='{}: '.format(format_col_names(pred_col)),
+                options=pred_cats,
+                index=0,
+                format_func=format_cat_names,
+                key='pred_{}'.format(pred_col)
+            )
+
+        # Look up the prediction for the chosen voter
+        pred_idx = model_scorer.flat_index(pred_values)
+        p_vote = float(model_scorer.flat_proba[pred_idx, -1])
+
+        predict.markdown('## Predicted probability of voting: **{:.1%}**'.format(p_vote))
+        predict.markdown(
+            '_Model: {} (version {}{})_'.format(
+                TURNOUT_MODEL_NAME,
+                model_meta['version'],
+                ', balanced accuracy {:.3f}'.format(model_meta['metrics']['balanced_accuracy'])
+                if 'balanced_accuracy' in model_meta['metrics'] else ''
+            )
+        )
+
+        predict.markdown('***')
+
+
+        if side_pred_shap:
+            ##########################################################################
+            ##########################################################################
+            ## SHAP breakdown of the prediction
+            # Define container for section
+            pred_shap = st.beta_container()
+            pred_shap.header('Explain the prediction:')
+
+            if model_shap is None:
+                pred_shap.subheader('''
+                SHAP values have not been compiled for this version of the model.
+                ''')
+
+            else:
+                # Look up the chosen voter's precomputed SHAP values
+                shap_fig = shap_waterfall(
+                    model_shap.expected_value,
+                    model_shap.values[pred_idx],
+                    model_scorer.feature_cols,
+                    [pred_values[pred_col] for pred_col in model_scorer.feature_cols],
+                    p_vote,
+                    output=model_shap.output
+                )
+
+                pred_shap.plotly_chart(shap_fig, use_container_width=True)
 
+            pred_shap.markdown('***')
@@ -132,13 +132,120 @@ def compare_age_distr(df1, df1_label, df2, df2_label, stat='density'):
 
 
 
+def eval_scores(clf, X_test, y_test, target_labels=None):
+    
+    """Given an sklearn classification model (already fit to training data), test features, and test labels,
+       gets the predicted class probabilities for the test set with a single call to predict_proba and 
+       derives every evaluation metric from them, so the model's pipeline only runs over the test data once.
+       Nothing is printed or plotted, so this can be used headless (e.g. in batch jobs); eval_classifier
+       and eval_bin_clf display the results.
+       
+       
+    Args:
+        clf (estimator): Fitted classifier with a predict_proba method.
+        X_test (series or array): Subset of X data used for testing.
+        y_test (series or array): Subset of y data used for testing.
+        target_labels (list of strings, optional): List of class labels (in the order of clf.classes_) 
+            used for the classification report. Defaults to the class values.
+    
+    Returns:
+        dict: Dictionary of evaluation results with keys 'classes', 'y_proba', 'y_pred', 'report' 
+            (classification report as a dict), 'report_table' (as a string), 'conf_matrix' (counts, 
+            rows are true and columns predicted classes), 'balanced_accuracy' and 'roc_auc' 
+            (one-vs-rest for multiclass targets). Binary targets also get 'fpr' and 'tpr' for the ROC curve.
+    
+    Example:
+        >>> scores = eval_scores(clf=my_model, X_test, y_test, target_labels=['No Vote', 'Vote'])
+        >>> scores['balanced_accuracy']
+    
+    """
+    
+    import numpy as np
+    from sklearn.metrics import (classification_report, confusion_matrix,
+                                 roc_auc_score, roc_curve)
+    
+    
+    ## get predicted probabilities (the only pass over the test data)
+    classes = np.asarray(clf.classes_)
+    y_proba = clf.predict_proba(X_test)
+    y_pred = classes[np.argmax(y_proba, axis=1)]
+    y_true = np.asarray(y_test)
+    
+    if target_labels is None:
+        target_labels = [str(c) for c in classes]
+    
+    scores = {'classes': classes, 'y_proba': y_proba, 'y_pred': y_pred}
+    
+    ## Classification Report
+    scores['report'] = classification_report(y_true, y_pred, labels=classes,
+                                             target_names=target_labels, output_dict=True)
+    scores['report_table'] = classification_report(y_true, y_pred, labels=classes,
+                                                   target_names=target_labels)
+    
+    ## Confusion Matrix and balanced accuracy (mean recall of each class)
+    conf_matrix = confusion_matrix(y_true, y_pred, labels=classes)
+    scores['conf_matrix'] = conf_matrix
+    with np.errstate(invalid='ignore'):
+        recalls = np.diag(conf_matrix) / conf_matrix.sum(axis=1)
+    scores['balanced_accuracy'] = np.nanmean(recalls)
+    
+    ## ROC Curve/ AUC
+    if len(classes) == 2:
+        scores['fpr'], scores['tpr'], _ = roc_curve(y_true, y_proba[:, 1], pos_label=classes[1])
+        scores['roc_auc'] = roc_auc_score(y_true == classes[1], y_proba[:, 1])
+    else:
+        scores['roc_auc'] = roc_auc_score(y_true, y_proba, multi_class='ovr', labels=classes)
+    
+    return scores
+
+
+
+#################################################################################
+#################################################################################
+
+#################################################################################
+#################################################################################
+
+
+
+def normalize_conf_matrix(conf_matrix, normalize='true'):
+    
+    """Normalizes a confusion matrix of counts over the true (rows), predicted (columns) 
+       conditions or all the population, as sklearn's confusion_matrix does. If normalize 
+       is None, returns the counts unchanged.
+    """
+    
+    import numpy as np
+    
+    with np.errstate(all='ignore'):
+        if normalize == 'true':
+            conf_matrix = conf_matrix / conf_matrix.sum(axis=1, keepdims=True)
+        elif normalize == 'pred':
+            conf_matrix = conf_matrix / conf_matrix.sum(axis=0, keepdims=True)
+        elif normalize == 'all':
+            conf_matrix = conf_matrix / conf_matrix.sum()
+    
+    return np.nan_to_num(conf_matrix)
+
+
+
+#################################################################################
+#################################################################################
+
+#################################################################################
+#################################################################################
+
+
+
 def eval_classifier(clf, X_test, y_test, model_descr='',
                     target_labels=['Early', 'Election Day', 'No Vote'],
-                    cmap='Blues', normalize='true', save=False, fig_name=None):
+                    cmap='Blues', normalize='true', save=False, fig_name=None,
+                    plot=True, scores=None):
     
     """Given an sklearn classification model (already fit to training data), test features, and test labels,
        displays sklearn.metrics classification report and confusion matrix. A description of the model 
-       can be provided to model_descr to customize the title of the classification report.
+       can be provided to model_descr to customize the title of the classification report. All results 
+       come from a single predict_proba pass over the test data (see eval_scores).
        
        
     Args:
@@ -154,9 +261,14 @@ def eval_classifier(clf, X_test, y_test, model_descr='',
         If None, confusion matrix will not be normalized.
         save (bool, default=False): Whether to save the returned figure.
         fig_name (str, optional): What to name the file if the image is being saved.
+        plot (bool, default=True): Whether to plot the confusion matrix. If False, only the
+            classification report is printed.
+        scores (dict, optional): Results of eval_scores for clf on this test data, to avoid
+            predicting again. Defaults to None (calls eval_scores).
     
     Returns:
-        display: Sklearn classification report and confusion matrix.
+        display: Sklearn classification report and confusion matrix (fig, axes), or the 
+            eval_scores results if plot is False.
     
     Example:
         >>> eval_classifier(clf=my_model, X_test, y_test, model_descr='My Model',
@@ -165,31 +277,33 @@ def eval_classifier(clf, X_test, y_test, model_descr='',
     
     """
     
-    import matplotlib.pyplot as plt
-    from sklearn.metrics import classification_report, plot_confusion_matrix
-    
-    
     fig_filepath = 'Figures/'
     
-    ## get model predictions
-    y_hat_test = clf.predict(X_test)
+    ## get model predictions and metrics
+    if scores is None:
+        scores = eval_scores(clf, X_test, y_test, target_labels)
     
     
     ## Classification Report
     report_title = 'Classification Report: {}'.format(model_descr)
     divider = ('-----' * 11) + ('-' * (len(model_descr) - 31))
-    report_table = classification_report(y_test, y_hat_test,
-                                         target_names=target_labels)
-    print(divider, report_title, divider, report_table, divider, divider, '\n', sep='\n')
+    print(divider, report_title, divider, scores['report_table'], divider, divider, '\n', sep='\n')
+    
+    if not plot:
+        return scores
+    
+    import matplotlib.pyplot as plt
+    from sklearn.metrics import ConfusionMatrixDisplay
     
     
     ## Make Subplots for Figures
     fig, axes = plt.subplots(figsize=(10,6))
     
-    ## Confusion Matrix
-    plot_confusion_matrix(clf, X_test, y_test, 
-                          display_labels=target_labels, 
-                          normalize=normalize, cmap=cmap, ax=axes)
+    ## Confusion Matrix (show counts as integers, proportions to 2 significant figures)
+    values_format = '.2g' if normalize else 'd'
+    ConfusionMatrixDisplay(normalize_conf_matrix(scores['conf_matrix'], normalize),
+                           display_labels=target_labels).plot(cmap=cmap, ax=axes,
+                                                              values_format=values_format)
     
     axes.set_title('Confusion Matrix:\n{}'.format(model_descr),
                    fontdict={'fontsize': 18,'fontweight': 'bold'})
@@ -223,11 +337,13 @@ def eval_classifier(clf, X_test, y_test, model_descr='',
 
 def eval_bin_clf(clf, X_test, y_test, model_descr='',
                     target_labels=['No Vote', 'Vote'],
-                    cmap='Blues', normalize='true', save=False, fig_name=None):
+                    cmap='Blues', normalize='true', save=False, fig_name=None,
+                    plot=True, scores=None):
     
     """Given an sklearn binary classification model (already fit to training data), test features, and test labels,
        displays sklearn.metrics classification report, confusion matrix, and ROC curve. A description of the model 
-       can be provided to model_descr to customize the title of the classification report.
+       can be provided to model_descr to customize the title of the classification report. All results 
+       come from a single predict_proba pass over the test data (see eval_scores).
        
        
     Args:
@@ -243,9 +359,14 @@ def eval_bin_clf(clf, X_test, y_test, model_descr='',
         If None, confusion matrix will not be normalized.
         save (bool, default=False): Whether to save the returned figure.
         fig_name (str, optional): What to name the file if the image is being saved.
+        plot (bool, default=True): Whether to plot the confusion matrix and ROC curve. If False,
+            only the classification report, ROC AUC and balanced accuracy are printed.
+        scores (dict, optional): Results of eval_scores for clf on this test data, to avoid
+            predicting again. Defaults to None (calls eval_scores).
     
     Returns:
-        display: Sklearn classification report and confusion matrix.
+        display: Sklearn classification report, confusion matrix and ROC curve (fig, axes), 
+            or the eval_scores results if plot is False.
     
     Example:
         >>> eval_classifier(clf=my_model, X_test, y_test, model_descr='My Model',
@@ -254,31 +375,35 @@ def eval_bin_clf(clf, X_test, y_test, model_descr='',
     
     """
     
-    import matplotlib.pyplot as plt
-    from sklearn.metrics import classification_report, plot_confusion_matrix, plot_roc_curve
-    
-    
     fig_filepath = 'Figures/'
     
-    ## get model predictions
-    y_hat_test = clf.predict(X_test)
+    ## get model predictions and metrics
+    if scores is None:
+        scores = eval_scores(clf, X_test, y_test, target_labels)
     
     
     ## Classification Report
     report_title = 'Classification Report: {}'.format(model_descr)
     divider = ('-----' * 11) + ('-' * (len(model_descr) - 31))
-    report_table = classification_report(y_test, y_hat_test,
-                                         target_names=target_labels)
-    print(divider, report_title, divider, report_table, divider, divider, '\n', sep='\n')
+    print(divider, report_title, divider, scores['report_table'], divider, divider, sep='\n')
+    print(f"ROC AUC: {scores['roc_auc']:.3f}    Balanced Accuracy: {scores['balanced_accuracy']:.3f}")
+    print(divider, '\n', sep='\n')
+    
+    if not plot:
+        return scores
+    
+    import matplotlib.pyplot as plt
+    from sklearn.metrics import ConfusionMatrixDisplay, RocCurveDisplay
     
     
     ## Make Subplots for Figures
     fig, axes = plt.subplots(nrows=1, ncols=2, figsize=(12,6))
     
-    ## Confusion Matrix
-    plot_confusion_matrix(clf, X_test, y_test, 
-                                  display_labels=target_labels, 
-                                  normalize=normalize, cmap=cmap, ax=axes[0])
+    ## Confusion Matrix (show counts as integers, proportions to 2 significant figures)
+    values_format = '.2g' if normalize else 'd'
+    ConfusionMatrixDisplay(normalize_conf_matrix(scores['conf_matrix'], normalize),
+                           display_labels=target_labels).plot(cmap=cmap, ax=axes[0],
+                                                              values_format=values_format)
     
     axes[0].set_title('Confusion Matrix', fontdict={'fontsize': 18,'fontweight': 'bold'})
     axes[0].set_xlabel(axes[0].get_xlabel(),
@@ -292,7 +417,8 @@ def eval_bin_clf(clf, X_test, y_test, model_descr='',
     
     
     ## ROC Curve
-    plot_roc_curve(clf, X_test, y_test, ax=axes[1])
+    RocCurveDisplay(fpr=scores['fpr'], tpr=scores['tpr'],
+                    roc_auc=scores['roc_auc']).plot(ax=axes[1], name=type(clf).__name__)
     # plot line that demonstrates probable success when randomly guessing labels
     axes[1].plot([0,1],[0,1], ls='--', color='r')
     
@@ -322,9 +448,476 @@ def eval_bin_clf(clf, X_test, y_test, model_descr='',
 
 
 
+class TPESearchCV:
+    
+    """Bayesian (Tree-structured Parzen Estimator) hyperparameter search with the same interface as 
+       sklearn's GridSearchCV, using optuna. Each trial picks a value for every parameter from its list 
+       of candidate values based on how well earlier trials scored, and scores it with cross-validation.
+       The search stops after n_iter trials, or earlier once patience trials in a row fail to improve on 
+       the best score. The best parameters are then refit on the full training data.
+       
+    Args:
+        estimator (estimator): Classifier or pipeline to tune.
+        param_distributions (dict): Dictionary with parameters names (`str`) as keys and lists of 
+            parameter settings to try as values.
+        scoring (str, default='accuracy'): Scoring method compatible with sklearn's cross_val_score.
+        cv (int, default=5): Number of cross-validation folds.
+        n_iter (int, default=20): Maximum number of parameter settings to try.
+        patience (int, optional): Number of trials without improvement after which to stop early.
+            Defaults to None (always run n_iter trials).
+        random_state (int, optional): Seed for the TPE sampler.
+        n_jobs (int, default=-1): Number of jobs to run the cross-validation folds in parallel.
+    """
+    
+    # Store settings as sklearn's search classes do
+    def __init__(self, estimator, param_distributions, scoring='accuracy', cv=5, n_iter=20,
+                 patience=None, random_state=None, n_jobs=-1):
+        self.estimator = estimator
+        self.param_distributions = param_distributions
+        self.scoring = scoring
+        self.cv = cv
+        self.n_iter = n_iter
+        self.patience = patience
+        self.random_state = random_state
+        self.n_jobs = n_jobs
+    
+    # Run the trials, then refit the best parameters on all of X and y
+    def fit(self, X, y, **fit_params):
+        
+        import optuna
+        from sklearn.base import clone
+        from sklearn.model_selection import cross_val_score
+        
+        # optuna can only suggest simple values, so other settings are chosen by position
+        simple_types = (type(None), bool, int, float, str)
+        by_index = {name: not all(isinstance(v, simple_types) for v in values)
+                    for name, values in self.param_distributions.items()}
+        
+        def suggest(trial):
+            cand = {}
+            for name, values in self.param_distributions.items():
+                if by_index[name]:
+                    cand[name] = values[trial.suggest_categorical(name, list(range(len(values))))]
+                else:
+                    cand[name] = trial.suggest_categorical(name, list(values))
+            return cand
+        
+        cv_kwargs = {'params': fit_params} if fit_params else {}
+        
+        def objective(trial):
+            est = clone(self.estimator).set_params(**suggest(trial))
+            return cross_val_score(est, X, y, scoring=self.scoring, cv=self.cv,
+                                   n_jobs=self.n_jobs, **cv_kwargs).mean()
+        
+        def stop_early(study, trial):
+            if (self.patience is not None 
+                and trial.number - study.best_trial.number >= self.patience):
+                study.stop()
+        
+        optuna.logging.set_verbosity(optuna.logging.WARNING)
+        self.study_ = optuna.create_study(direction='maximize',
+                                          sampler=optuna.samplers.TPESampler(seed=self.random_state))
+        self.study_.optimize(objective, n_trials=self.n_iter, callbacks=[stop_early])
+        
+        trials = [t for t in self.study_.trials if t.value is not None]
+        self.cv_results_ = {'params': [suggest(optuna.trial.FixedTrial(t.params)) for t in trials],
+                            'mean_test_score': [t.value for t in trials]}
+        self.best_params_ = suggest(optuna.trial.FixedTrial(self.study_.best_trial.params))
+        self.best_score_ = self.study_.best_value
+        self.best_estimator_ = clone(self.estimator).set_params(**self.best_params_)
+        self.best_estimator_.fit(X, y, **fit_params)
+        
+        return self
+    
+    # Predict with the refit best estimator, as sklearn's search classes do
+    def predict(self, X):
+        return self.best_estimator_.predict(X)
+    
+    def predict_proba(self, X):
+        return self.best_estimator_.predict_proba(X)
+
+
+
+#################################################################################
+#################################################################################
+
+#################################################################################
+#################################################################################
+
+
+
+def get_search_cv(clf, params, search='grid', score='accuracy', cv=5, n_iter=20,
+                  factor=3, patience=None, random_state=None, n_jobs=-1):
+    
+    """Given an sklearn classification model and hyperparameter grid, returns an (unfit) 
+       hyperparameter search object for the chosen search strategy, each with its own budget:
+       
+       - 'grid': exhaustive GridSearchCV over every combination of params (no budget).
+       - 'random': RandomizedSearchCV trying n_iter combinations sampled from params.
+       - 'halving': HalvingGridSearchCV (successive halving on sample size), which starts every 
+         combination on a small sample of the training rows and only keeps the best 1/factor of 
+         them for each round with factor times as many rows, stopping poor candidates early.
+       - 'bayes': TPESearchCV (requires optuna), trying up to n_iter combinations chosen based on 
+         earlier scores and stopping early after patience trials without improvement.
+       
+    Args:
+        clf (estimator): Classifier or pipeline to tune.
+        params (dict): Dictionary with parameters names (`str`) as keys and lists of 
+            parameter settings to try as values.
+        search (str, default='grid'): Search strategy: 'grid', 'random', 'halving' or 'bayes'.
+        score (str, default='accuracy'): A string indicating a scoring method compatible with sklearn.
+        cv (int, default=5): Number of cross-validation folds.
+        n_iter (int, default=20): Number of combinations to try for 'random' and 'bayes'.
+        factor (int, default=3): Elimination rate for 'halving'.
+        patience (int, optional): Trials without improvement before 'bayes' stops early.
+        random_state (int, optional): Seed for the 'random', 'halving' and 'bayes' searches.
+        n_jobs (int, default=-1): Number of worker processes fitting in parallel (-1 for all cores).
+    
+    Returns:
+        search: Unfit search object with the GridSearchCV interface.
+    
+    Example:
+        >>> search = get_search_cv(my_model, param_grid, search='halving', score='balanced_accuracy')
+    
+    """
+    
+    from sklearn.model_selection import GridSearchCV, RandomizedSearchCV, ParameterGrid
+    
+    if search == 'grid':
+        return GridSearchCV(clf, params, scoring=score, cv=cv, n_jobs=n_jobs)
+    
+    elif search == 'random':
+        n_iter = min(n_iter, len(ParameterGrid(params)))
+        return RandomizedSearchCV(clf, params, n_iter=n_iter, scoring=score, cv=cv,
+                                  n_jobs=n_jobs, random_state=random_state)
+    
+    elif search == 'halving':
+        from sklearn.experimental import enable_halving_search_cv
+        from sklearn.model_selection import HalvingGridSearchCV
+        return HalvingGridSearchCV(clf, params, factor=factor, resource='n_samples',
+                                   scoring=score, cv=cv, n_jobs=n_jobs,
+                                   random_state=random_state)
+    
+    elif search == 'bayes':
+        return TPESearchCV(clf, params, scoring=score, cv=cv, n_iter=n_iter,
+                           patience=patience, random_state=random_state, n_jobs=n_jobs)
+    
+    raise ValueError("search must be 'grid', 'random', 'halving' or 'bayes', got '{}'".format(search))
+
+
+
+#################################################################################
+#################################################################################
+
+#################################################################################
+#################################################################################
+
+
+
+def count_cache_entries(cache_dir):
+    
+    """Returns the number of results stored in a joblib.Memory cache directory (each cached 
+       call is saved in its own folder containing an output.pkl file).
+    """
+    
+    import os
+    
+    n_entries = 0
+    for _, _, files in os.walk(cache_dir):
+        if 'output.pkl' in files:
+            n_entries += 1
+    
+    return n_entries
+
+
+
+#################################################################################
+#################################################################################
+
+#################################################################################
+#################################################################################
+
+
+
+def get_row_codes(df):
+    
+    """Returns, for each row of df, the index of its unique combination of values, along with the 
+       position of the first row with each combination and how many rows have it. Each column is 
+       factorized and the codes are combined into a single integer key per row.
+    """
+    
+    import numpy as np
+    import pandas as pd
+    
+    keys = np.zeros(len(df), dtype=np.int64)
+    n_combos = 1
+    
+    for col in df.columns:
+        codes, uniques = pd.factorize(df[col])
+        n_values = len(uniques) + 1
+        
+        # Fall back to hashing whole rows if the combined key could overflow
+        if n_combos * n_values >= 2**62:
+            codes, _ = pd.MultiIndex.from_frame(df).factorize()
+            keys = codes.astype(np.int64)
+            break
+        
+        # Missing values get code -1, so shift every code up by one
+        keys = keys * n_values + (codes + 1)
+        n_combos *= n_values
+    
+    _, first_idx, row_codes, counts = np.unique(keys, return_index=True,
+                                                return_inverse=True, return_counts=True)
+    
+    return row_codes.ravel(), first_idx, counts
+
+
+
+#################################################################################
+#################################################################################
+
+#################################################################################
+#################################################################################
+
+
+
+def dedup_xy(X, y, sample_weight=None):
+    
+    """Groups identical rows of (X, y) into their unique combinations, counting how many times each 
+       occurs (or summing the rows' sample_weight, if given). Since every predictor is a low-cardinality 
+       categorical, the ~300k training rows of UC_gen_elecs collapse to about 19,000 combinations 
+       (city_grp and year multiply the others). Fitting a deterministic model (e.g. a decision tree, or 
+       a forest without bootstrap) on these with the counts as sample weights gives the same model as 
+       fitting on every row, as long as it weights classes from the full y (see DedupClassifier). Models 
+       that sample rows at random (bootstrapped random forests, boosting with subsample < 1) draw 
+       combinations rather than rows, so they only match a full-data fit statistically.
+       
+    Args:
+        X (DataFrame or array): Features.
+        y (series or array): Target.
+        sample_weight (array, optional): Weight of each row, summed per combination. Defaults to 
+            None (count the rows).
+    
+    Returns:
+        tuple: (X_unique, y_unique, counts), where X_unique is a DataFrame of the unique combinations 
+            (with X's columns), y_unique their target values and counts an integer array of how many 
+            rows had each combination (or a float array of their summed sample_weight).
+    
+    Example:
+        >>> X_unique, y_unique, counts = dedup_xy(X_train, y_train)
+        >>> my_model.fit(X_unique, y_unique, clf__sample_weight=counts)
+    
+    """
+    
+    import numpy as np
+    import pandas as pd
+    
+    X_df = pd.DataFrame(X).reset_index(drop=True)
+    y = np.asarray(y)
+    
+    row_codes, first_idx, counts = get_row_codes(X_df.assign(__target__=y))
+    
+    if sample_weight is not None:
+        counts = np.bincount(row_codes, weights=sample_weight, minlength=len(first_idx))
+    
+    X_unique = X_df.iloc[first_idx].reset_index(drop=True)
+    
+    return X_unique, y[first_idx], counts
+
+
+
+#################################################################################
+#################################################################################
+
+#################################################################################
+#################################################################################
+
+
+
+def get_dedup_classifier():
+    
+    """Returns the DedupClassifier class, defining it the first time it's needed so that
+       sklearn is only imported by the functions that use it, as in the rest of this module. The class 
+       is also available as capstone_functions.DedupClassifier, so fitted models can be pickled and 
+       loaded (and sent to a search's workers).
+    
+    Example:
+        >>> DedupClassifier = get_dedup_classifier()
+        >>> dedup_clf = DedupClassifier(my_pipeline).fit(X_train, y_train)
+    
+    """
+    
+    global DedupClassifier
+    
+    if 'DedupClassifier' in globals():
+        return DedupClassifier
+    
+    from sklearn.base import BaseEstimator, ClassifierMixin
+    
+    
+    class DedupClassifier(BaseEstimator, ClassifierMixin):
+    
+        """Wraps a classifier or pipeline so it is fit on the unique combinations of (X, y) with their 
+           counts as sample weights (see dedup_xy), and predicts each unique row of X only once. Because 
+           deduplication happens inside fit, it can be used in a grid search with cross-validation and 
+           scoring still done on the original rows. Parameters of the wrapped estimator are set with an 
+           'estimator__' prefix (e.g. 'estimator__rf__max_depth').
+           
+           sklearn computes class_weight from the labels a model is fit on, which here would be the 
+           unique rows, so a class_weight of the final step is instead applied to every row of the full 
+           y and summed into the combinations' weights. For deterministic models the fit then matches 
+           a fit on every row. Models that sample rows at random (bootstrap=True, subsample < 1 or 
+           class_weight='balanced_subsample') sample combinations instead, so they only match a full 
+           fit statistically, and a warning is given.
+       
+        Args:
+            estimator (estimator): Classifier or (sklearn) Pipeline whose final step accepts sample_weight.
+                Pipelines with resampling steps (e.g. SMOTE) are not supported, since resampled rows 
+                would have no weights.
+        """
+    
+        # Store the estimator to wrap, as sklearn estimators do
+        def __init__(self, estimator):
+            self.estimator = estimator
+    
+        # Fit the wrapped estimator on the unique rows, weighted by their counts
+        def fit(self, X, y):
+        
+            import warnings
+            from sklearn.base import clone
+        
+            steps = getattr(self.estimator, 'steps', None)
+            if steps is not None and any(hasattr(step, 'fit_resample') for _, step in steps):
+                raise ValueError('DedupClassifier does not support pipelines with resampling steps')
+        
+            prefix = '' if steps is None else steps[-1][0] + '__'
+            estimator = clone(self.estimator)
+            params = estimator.get_params()
+        
+            if (params.get(prefix + 'bootstrap') is True or (params.get(prefix + 'subsample') or 1) < 1
+                    or params.get(prefix + 'class_weight') == 'balanced_subsample'):
+                warnings.warn('{} samples training rows at random, so fitting it on the unique rows '
+                              'only matches fitting on every row statistically'.format(
+                                  type(estimator if steps is None else steps[-1][1]).__name__))
+        
+            # Weight each row by its class over the full y, rather than over the unique rows
+            row_weight = None
+            class_weight = params.get(prefix + 'class_weight')
+            if class_weight is not None and class_weight != 'balanced_subsample':
+                from sklearn.utils.class_weight import compute_sample_weight
+                row_weight = compute_sample_weight(class_weight, y)
+                estimator.set_params(**{prefix + 'class_weight': None})
+        
+            X_unique, y_unique, counts = dedup_xy(X, y, sample_weight=row_weight)
+            self.estimator_ = estimator.fit(X_unique, y_unique, **{prefix + 'sample_weight': counts})
+            self.classes_ = self.estimator_.classes_
+            self.n_unique_ = len(y_unique)
+        
+            return self
+    
+        # Predict probabilities for each unique row of X, then map them back to every row
+        def predict_proba(self, X):
+        
+            import pandas as pd
+        
+            X_df = pd.DataFrame(X)
+            row_codes, first_idx, _ = get_row_codes(X_df)
+        
+            return self.estimator_.predict_proba(X_df.iloc[first_idx])[row_codes]
+    
+        def predict(self, X):
+            return self.classes_[self.predict_proba(X).argmax(axis=1)]
+    
+        # Give access to the fitted pipeline's steps (e.g. for plot_feat_importance and shap_force)
+        @property
+        def named_steps(self):
+            return self.estimator_.named_steps
+    
+    
+    return DedupClassifier
+
+
+## Define DedupClassifier when it's first looked up on the module (e.g. when unpickling a model)
+def __getattr__(name):
+    if name == 'DedupClassifier':
+        return get_dedup_classifier()
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+
+#################################################################################
+#################################################################################
+
+#################################################################################
+#################################################################################
+
+
+
+def memmap_design_matrix(clf, X_train, memmap_dir):
+    
+    """Fits the first (preprocessing) step of a pipeline on X_train and saves the transformed design 
+       matrix to a .npy file in memmap_dir (as float32 if it was float64, which is exact for one-hot 
+       columns and what sklearn's trees convert to anyway). The file is opened read-only as a memory 
+       map, which joblib sends to worker processes by file name, so every worker of a search reads 
+       the same pages instead of receiving its own pickled copy of the training data.
+       Note the first step is fit on all of X_train, so a search on the design matrix doesn't refit 
+       it per CV fold, and statistics it learns (e.g. imputed values, scaling or target encoding, 
+       or the categories a one-hot encoder finds) leak from the validation folds into training. 
+       Only use it with stateless preprocessing, such as one-hot encoding with categories given.
+       
+    Args:
+        clf (Pipeline): sklearn or imblearn Pipeline whose first step is the preprocessing.
+        X_train (DataFrame): Unencoded training features.
+        memmap_dir (str): Directory to save the design matrix to.
+    
+    Returns:
+        tuple: (fitted first step, read-only memory-mapped design matrix, path of the .npy file, 
+            pipeline of the remaining (unfitted) steps)
+    """
+    
+    import os
+    import tempfile
+    import numpy as np
+    from scipy import sparse
+    from sklearn.base import clone
+    
+    pre_name, preprocessing = clf.steps[0]
+    preprocessing = clone(preprocessing)
+    X_design = preprocessing.fit_transform(X_train)
+    
+    if sparse.issparse(X_design):
+        raise ValueError("memmap_dir needs a dense design matrix; the 'sparse' encoding is already "
+                         "small enough to send to each worker")
+    
+    X_design = np.asarray(X_design)
+    if X_design.dtype == np.float64:
+        X_design = X_design.astype(np.float32)
+    
+    os.makedirs(memmap_dir, exist_ok=True)
+    fd, path = tempfile.mkstemp(dir=memmap_dir, prefix='X_train_', suffix='.npy')
+    with os.fdopen(fd, 'wb') as f:
+        np.save(f, np.ascontiguousarray(X_design))
+    del X_design
+    
+    rest = type(clf)(steps=[(name, clone(step)) for name, step in clf.steps[1:]])
+    
+    return preprocessing, np.load(path, mmap_mode='r'), path, rest
+
+
+
+#################################################################################
+#################################################################################
+
+#################################################################################
+#################################################################################
+
+
+
 def fit_grid_clf(clf, params, X_train, y_train, X_test, y_test, bin_target=False,
                  model_descr='', score='accuracy', cv=5,
-                 target_labels=['Early', 'Election Day', 'No Vote']):
+                 target_labels=['Early', 'Election Day', 'No Vote'], plot=True,
+                 search='grid', n_iter=20, factor=3, patience=None, random_state=None,
+                 cache_dir=None, dedup=False, memmap_dir=None, n_jobs=-1, telemetry=None):
     
     """Given an sklearn classification model, hyperparameter grid, X and y training data, 
        and a GridSearchCV scoring metric (default is 'accuracy', which is the default metric for 
@@ -332,7 +925,28 @@ def fit_grid_clf(clf, params, X_train, y_train, X_test, y_test, bin_target=False
        returns the grid object. Function also takes in X_test and y_test to get predictions and 
        evaluate model performance on test data. Prints out parameters of the best estimator as well 
        as its classification report and confusion matrix. A description of the model can be provided
-       to model_descr to customize the title of the classification report.
+       to model_descr to customize the title of the classification report. Other search strategies
+       (randomized, successive halving or Bayesian) can be chosen with search (see get_search_cv).
+       If a cache_dir is given, the fitted preprocessing steps of the pipeline are memoized on disk, 
+       so the preprocessing for each training fold is only fit once and reused for every parameter 
+       setting (unless the setting changes the preprocessing), and an estimate of the number of cache 
+       hits is printed.
+       If dedup is True, each fit is done on the unique combinations of the training rows weighted by 
+       their counts (see DedupClassifier), which is much faster and gives the same models for 
+       deterministic classifiers (including with class_weight); classifiers that sample rows at random 
+       (e.g. bootstrapped random forests) only give statistically equivalent models.
+       If a memmap_dir is given, the pipeline's first (preprocessing) step is fit once on X_train and 
+       the encoded training data is shared with the search's workers as a read-only memory-mapped 
+       file (see memmap_design_matrix) instead of being pickled to each of them, so each extra worker 
+       adds less memory (memory still grows with the number of workers, since each has its own 
+       interpreter and copy of its CV fold). The remaining steps are searched on the encoded data, and 
+       the best estimator is the full pipeline. params can't then include parameters of the first step.
+       Because the first step is fit before the CV split, it sees the validation folds: this is only 
+       leak-free for stateless preprocessing (e.g. one-hot encoding with fixed categories), while 
+       imputers, scalers or target encoders make the CV scores optimistic.
+       If a TelemetryStore is given as telemetry, the search's wall time, CPU time and peak memory 
+       (over all workers), its candidates' fit times and scores, and the best estimator's test scores 
+       are recorded under model_descr.
        
     Args:
         clf (estimator): Fitted classifier.
@@ -345,9 +959,28 @@ def fit_grid_clf(clf, params, X_train, y_train, X_test, y_test, bin_target=False
         model_descr (str): A description of the model for customizing plot title.
         score (str, default='accuracy'): A string indicating a scoring method compatible with 
             sklearn.model_selection's GridSearchCV.
+        plot (bool, default=True): Whether to plot the best estimator's evaluation figures.
+        search (str, default='grid'): Search strategy: 'grid', 'random', 'halving' or 'bayes'.
+        n_iter (int, default=20): Number of combinations to try for 'random' and 'bayes'.
+        factor (int, default=3): Elimination rate for 'halving'.
+        patience (int, optional): Trials without improvement before 'bayes' stops early.
+        random_state (int, optional): Seed for the 'random', 'halving' and 'bayes' searches.
+        cache_dir (str, optional): Directory for caching fitted pipeline steps (all but the last) with
+            joblib.Memory. clf must be an sklearn or imblearn Pipeline. Defaults to None (no caching).
+        dedup (bool, default=False): Whether to fit on the unique combinations of the training rows 
+            with sample weights. params are given as for clf (without the 'estimator__' prefix).
+        memmap_dir (str, optional): Directory for the memory-mapped design matrix, which is removed 
+            after the search. Can't be combined with cache_dir or dedup. Defaults to None (pickle 
+            X_train to every worker).
+        n_jobs (int, default=-1): Number of worker processes fitting in parallel (-1 for all cores).
+        telemetry (TelemetryStore, optional): Store to record the search's telemetry in. Defaults to None.
     
     Returns:
-        grid: Fitted GridSearchCV object
+        grid: Fitted search object (GridSearchCV by default), with the best estimator's eval_scores results on the 
+            test data stored as grid.test_scores_ (and, if cache_dir is given, the expected number of 
+            cached step fits, the cache misses (new cache entries) and the cache hits estimated as their 
+            difference stored as grid.cache_info_, and if telemetry is given, the run ID of its records 
+            as grid.telemetry_run_id_)
     
     Example:
         >>> param_grid = {'param_name_1':[(1,1),(1,2),(1,3)],
@@ -358,7 +991,6 @@ def fit_grid_clf(clf, params, X_train, y_train, X_test, y_test, bin_target=False
     
     """
     
-    from sklearn.model_selection import GridSearchCV
     import datetime as dt
     from tzlocal import get_localzone
     
@@ -367,26 +999,118 @@ def fit_grid_clf(clf, params, X_train, y_train, X_test, y_test, bin_target=False
     fmt= "%m/%d/%y - %T %p"
     
     print('---'*20)    
-    print(f'***** Grid Search Started at {start.strftime(fmt)}')
+    print(f'***** {search.title()} Search Started at {start.strftime(fmt)}')
     print('---'*20)
     print()
     
-    grid = GridSearchCV(clf, params, scoring=score, cv=cv, n_jobs=-1)
-    grid.fit(X_train, y_train)
+    if memmap_dir is not None:
+        if cache_dir is not None or dedup:
+            raise ValueError('memmap_dir already fits the preprocessing once and shares it; '
+                             "it can't be combined with cache_dir or dedup")
+        
+        pre_name = clf.steps[0][0]
+        if any(name.startswith(pre_name + '__') for name in params):
+            raise ValueError("params can't include parameters of the '{}' step when using "
+                             'memmap_dir'.format(pre_name))
+    
+    if cache_dir is not None:
+        from joblib import Memory
+        from sklearn.base import clone
+        
+        clf = clone(clf).set_params(memory=Memory(cache_dir, verbose=0))
+        n_entries_before = count_cache_entries(cache_dir)
+    
+    search_clf = clf
+    search_X = X_train
+    if dedup:
+        search_clf = get_dedup_classifier()(clf)
+        params = {'estimator__' + name: values for name, values in params.items()}
+    
+    if memmap_dir is not None:
+        import os
+        import numpy as np
+        
+        preprocessing, search_X, memmap_path, search_clf = memmap_design_matrix(clf, X_train,
+                                                                                memmap_dir)
+        y_train = np.asarray(y_train)
+    
+    grid = get_search_cv(search_clf, params, search=search, score=score, cv=cv, n_iter=n_iter,
+                         factor=factor, patience=patience, random_state=random_state, n_jobs=n_jobs)
+    
+    if telemetry is not None:
+        from telemetry_functions import ResourceSampler
+        sampler = ResourceSampler().start()
+    
+    try:
+        grid.fit(search_X, y_train)
+    finally:
+        if telemetry is not None:
+            fit_costs = sampler.stop()
+        if memmap_dir is not None:
+            del search_X
+            # Workers may still have the file open on Windows; it's then left for the next run
+            try:
+                os.remove(memmap_path)
+            except OSError:
+                pass
+    
+    if memmap_dir is not None:
+        # Put the fitted preprocessing back in front of the best estimator's steps
+        grid.best_estimator_ = type(clf)(steps=[(pre_name, preprocessing)]
+                                         + grid.best_estimator_.steps)
     
     end = dt.datetime.now(tz=get_localzone())
     
     print(f'\n***** Training Completed at {end.strftime(fmt)}')
     print(f"\n***** Total Training Time: {end-start}")
+    
+    if cache_dir is not None:
+        from sklearn.model_selection import check_cv
+        from sklearn.base import is_classifier
+        
+        # Hits aren't counted by joblib, so they're estimated: every fold of every setting (plus
+          # the refit) is assumed to fit each cached step once, and those that didn't add a new 
+          # entry to the cache are counted as hits
+        n_cached_steps = len([step for _, step in clf.steps[:-1]
+                              if step is not None and step != 'passthrough'])
+        n_splits = check_cv(cv, y_train, classifier=is_classifier(clf)).get_n_splits(search_X, y_train)
+        n_fits = len(grid.cv_results_['params']) * n_splits + 1
+        n_misses = count_cache_entries(cache_dir) - n_entries_before
+        grid.cache_info_ = {'n_fits': n_fits * n_cached_steps,
+                            'n_misses': n_misses,
+                            'n_hits': n_fits * n_cached_steps - n_misses}
+        print(f"\n***** Preprocessing Cache Hits (estimated): {grid.cache_info_['n_hits']}"
+              f" of {grid.cache_info_['n_fits']} step fits")
     print('\n')
     
     print('Best Parameters:')
-    print(grid.best_params_)
+    print({name.replace('estimator__', '', 1) if dedup else name: value
+           for name, value in grid.best_params_.items()})
     print('\n')
     if bin_target:
-        eval_bin_clf(grid.best_estimator_, X_test, y_test, model_descr)
+        target_labels = ['No Vote', 'Vote']
+    
+    ## Evaluate the best estimator with a single pass over the test data
+    grid.test_scores_ = eval_scores(grid.best_estimator_, X_test, y_test, target_labels)
+    
+    if bin_target:
+        eval_bin_clf(grid.best_estimator_, X_test, y_test, model_descr,
+                     plot=plot, scores=grid.test_scores_)
     else:
-        eval_classifier(grid.best_estimator_, X_test, y_test, model_descr, target_labels)
+        eval_classifier(grid.best_estimator_, X_test, y_test, model_descr, target_labels,
+                        plot=plot, scores=grid.test_scores_)
+    
+    if telemetry is not None:
+        import uuid
+        
+        grid.telemetry_run_id_ = uuid.uuid4().hex[:12]
+        source = type(grid.best_estimator_.steps[-1][1]).__module__.split('.')[0]
+        model_name = model_descr or grid.best_estimator_.steps[-1][0]
+        
+        telemetry.record(grid.telemetry_run_id_, model_name, source,
+                         dict(fit_costs, balanced_accuracy=grid.test_scores_['balanced_accuracy'],
+                              roc_auc=grid.test_scores_['roc_auc']))
+        telemetry.record_search(grid.telemetry_run_id_, model_name, grid, source)
     
     return grid
 
@@ -400,8 +1124,254 @@ def fit_grid_clf(clf, params, X_train, y_train, X_test, y_test, bin_target=False
 
 
 
-def plot_feat_importance(clf, clf_step_name, feature_names,
-                         model_title='', save=False, fig_name=None):
+def benchmark_search(clf, params, X_train, y_train, X_test, y_test,
+                     searches=['grid', 'random', 'halving', 'bayes'],
+                     score='balanced_accuracy', cv=5, **search_kwargs):
+    
+    """Given an sklearn classification model, hyperparameter grid, and training and test data, runs 
+       each hyperparameter search strategy in turn and compares their wall time, number of parameter 
+       settings tried, best cross-validation score, and the balanced accuracy of their best estimator 
+       on the test data.
+       
+    Args:
+        clf (estimator): Classifier or pipeline to tune.
+        params (dict): Dictionary with parameters names (`str`) as keys and lists of 
+            parameter settings to try as values.
+        X_train (series or array): Subset of X data used for training.
+        y_train (series or array): Subset of y data used for training.
+        X_test (series or array): Subset of X data used for testing.
+        y_test (series or array): Subset of y data used for testing.
+        searches (list of str, default=['grid', 'random', 'halving', 'bayes']): Strategies to compare.
+        score (str, default='balanced_accuracy'): Scoring method used by the searches.
+        cv (int, default=5): Number of cross-validation folds.
+        **search_kwargs: Additional keyword arguments for get_search_cv (e.g. n_iter, random_state).
+    
+    Returns:
+        DataFrame: One row per search strategy.
+    
+    Example:
+        >>> benchmark_search(my_model, param_grid, X_train, y_train, X_test, y_test,
+                             n_iter=10, patience=5, random_state=319)
+    
+    """
+    
+    import time
+    import pandas as pd
+    
+    results = []
+    
+    for search in searches:
+        grid = get_search_cv(clf, params, search=search, score=score, cv=cv, **search_kwargs)
+        
+        start = time.perf_counter()
+        grid.fit(X_train, y_train)
+        fit_s = time.perf_counter() - start
+        
+        scores = eval_scores(grid.best_estimator_, X_test, y_test)
+        
+        results.append({'search': search,
+                        'fit_s': fit_s,
+                        'n_candidates': len(grid.cv_results_['params']),
+                        'best_cv_score': grid.best_score_,
+                        'test_balanced_accuracy': scores['balanced_accuracy'],
+                        'best_params': grid.best_params_})
+    
+    return pd.DataFrame(results)
+
+
+
+#################################################################################
+#################################################################################
+
+#################################################################################
+#################################################################################
+
+
+
+def benchmark_memmap(clf, params, X_train, y_train, memmap_dir, n_jobs_list=[1, 2, 4],
+                     score='balanced_accuracy', cv=5, interval=0.1):
+    
+    """Runs the same grid search with X_train pickled to each worker and with the encoded training 
+       data shared as a memory-mapped file (see memmap_design_matrix), for each number of workers in 
+       n_jobs_list, and compares their wall time and peak memory. Memory is sampled every interval 
+       seconds as the proportional set size (PSS, where available, otherwise RSS) of this process and 
+       all of its workers, so pages of the memory-mapped file shared by several workers are only 
+       counted once in total (see ResourceSampler). Requires psutil.
+       
+    Args:
+        clf (Pipeline): sklearn or imblearn Pipeline whose first step is the preprocessing.
+        params (dict): Dictionary with parameters names (`str`) as keys and lists of 
+            parameter settings to try as values (not including the first step's).
+        X_train (DataFrame): Unencoded training features.
+        y_train (series or array): Subset of y data used for training.
+        memmap_dir (str): Directory for the memory-mapped design matrix.
+        n_jobs_list (list of int, default=[1, 2, 4]): Numbers of workers to compare.
+        score (str, default='balanced_accuracy'): Scoring method used by the search.
+        cv (int, default=5): Number of cross-validation folds.
+        interval (float, default=0.1): Seconds between memory samples.
+    
+    Returns:
+        DataFrame: One row per data sharing mode and number of workers, with the wall time, CPU 
+            time, peak total memory and peak memory of the largest worker in MB.
+    
+    Example:
+        >>> benchmark_memmap(rf_all, params, X_all_train, y_all_train, 'App_Data/memmap',
+                             n_jobs_list=[1, 4, 8, 16])
+    
+    """
+    
+    import os
+    import numpy as np
+    import pandas as pd
+    import psutil  # without it, ResourceSampler can only report the lifetime peak RSS
+    from joblib.externals.loky import get_reusable_executor
+    from telemetry_functions import ResourceSampler
+    
+    results = []
+    
+    for n_jobs in n_jobs_list:
+        for mode in ['pickle', 'memmap']:
+            # Start each run with fresh workers
+            get_reusable_executor().shutdown(wait=True)
+            
+            sampler = ResourceSampler(interval).start()
+            
+            search_clf, search_X, search_y = clf, X_train, y_train
+            if mode == 'memmap':
+                _, search_X, memmap_path, search_clf = memmap_design_matrix(clf, X_train, memmap_dir)
+                search_y = np.asarray(y_train)
+            
+            try:
+                grid = get_search_cv(search_clf, params, score=score, cv=cv, n_jobs=n_jobs)
+                grid.fit(search_X, search_y)
+            finally:
+                costs = sampler.stop()
+                if mode == 'memmap':
+                    del search_X
+                    os.remove(memmap_path)
+            
+            results.append({'mode': mode,
+                            'n_jobs': n_jobs,
+                            'fit_s': costs['wall_s'],
+                            'cpu_s': costs['cpu_s'],
+                            'peak_total_mb': costs['peak_mb'],
+                            'peak_worker_mb': costs['peak_worker_mb'],
+                            'best_cv_score': grid.best_score_})
+    
+    return pd.DataFrame(results)
+
+
+
+#################################################################################
+#################################################################################
+
+#################################################################################
+#################################################################################
+
+
+
+def build_preprocessing(cat_cols, encoding='onehot'):
+    
+    """Builds the ColumnTransformer used as the 'preprocessing' step of the modeling pipelines, 
+       encoding the categorical columns in one of three ways:
+       
+       - 'onehot': dense float64 one-hot encoding (OneHotEncoder with sparse=False and 
+         drop='if_binary'), as in the modeling notebooks.
+       - 'sparse': the same one-hot encoding kept as a float32 CSR sparse matrix, which sklearn's 
+         tree models, XGBoost and SMOTE accept without densifying it.
+       - 'ordinal': one int8 column of category codes per categorical column, for tree models that 
+         handle categorical features directly (e.g. CatBoost with cat_features set to every column,
+         or XGBoost, which then splits on the codes). Columns must have at most 127 categories.
+       
+    Args:
+        cat_cols (list of str): Names of the categorical columns to encode.
+        encoding (str, default='onehot'): 'onehot', 'sparse' or 'ordinal'.
+    
+    Returns:
+        ColumnTransformer: Unfit preprocessor with the encoder in named_transformers_['cat'].named_steps.
+    
+    Example:
+        >>> preprocessing = build_preprocessing(cat_cols, encoding='sparse')
+        >>> rf = Pipeline(steps=[('preprocessing', preprocessing), ('rf', RandomForestClassifier())])
+    
+    """
+    
+    import inspect
+    import numpy as np
+    from sklearn.compose import ColumnTransformer
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import OneHotEncoder, OrdinalEncoder
+    
+    if encoding in ['onehot', 'sparse']:
+        is_sparse = encoding == 'sparse'
+        
+        # OneHotEncoder's sparse argument was renamed sparse_output in sklearn 1.2
+        if 'sparse_output' in inspect.signature(OneHotEncoder).parameters:
+            sparse_kwarg = {'sparse_output': is_sparse}
+        else:
+            sparse_kwarg = {'sparse': is_sparse}
+        
+        encoder = ('ohe', OneHotEncoder(handle_unknown='error', drop='if_binary',
+                                        dtype=np.float32 if is_sparse else np.float64,
+                                        **sparse_kwarg))
+        
+    elif encoding == 'ordinal':
+        is_sparse = False
+        encoder = ('ord', OrdinalEncoder(dtype=np.int8))
+    
+    else:
+        raise ValueError("encoding must be 'onehot', 'sparse' or 'ordinal', got '{}'".format(encoding))
+    
+    cat_transformer = Pipeline(steps=[encoder])
+    
+    return ColumnTransformer(transformers=[('cat', cat_transformer, cat_cols)],
+                             sparse_threshold=1.0 if is_sparse else 0)
+
+
+
+#################################################################################
+#################################################################################
+
+#################################################################################
+#################################################################################
+
+
+
+def get_feature_names(preprocessing, cat_cols):
+    
+    """Returns the names of the features (in order) output by a fitted preprocessor from 
+       build_preprocessing (or the modeling notebooks), for labeling feature importances 
+       and SHAP values: the one-hot column names for one-hot encodings, or cat_cols for 
+       ordinal encoding.
+    """
+    
+    import numpy as np
+    
+    steps = preprocessing.named_transformers_['cat'].named_steps
+    
+    if 'ohe' not in steps:
+        return np.array(cat_cols, dtype=object)
+    
+    # get_feature_names was replaced by get_feature_names_out in sklearn 1.0
+    ohe = steps['ohe']
+    if hasattr(ohe, 'get_feature_names_out'):
+        return ohe.get_feature_names_out(cat_cols)
+    
+    return ohe.get_feature_names(cat_cols)
+
+
+
+#################################################################################
+#################################################################################
+
+#################################################################################
+#################################################################################
+
+
+
+def plot_feat_importance(clf, clf_step_name, feature_names=None,
+                         model_title='', save=False, fig_name=None, cat_cols=None,
+                         importances=None):
     
     """Takes in an sklearn classifier already fit to training data, the name of the step for that model
        in the modeling pipeline, and optionally a title describing the model. 
@@ -410,7 +1380,13 @@ def plot_feat_importance(clf, clf_step_name, feature_names,
     Args:
         clf (estimator): An sklearn Pipeline with a vectorizer steps and final step is a fitted classifier.
         clf_step_name (str): The name given to the classifier step of the pipe.
-        vec_step_name (str): The name given to the vectorizer step of the pipe.
+        feature_names (list of str, optional): Names of the features the classifier was fit on. Defaults 
+            to get_feature_names of the pipeline's 'preprocessing' step (which requires cat_cols).
+        cat_cols (list of str, optional): Categorical columns encoded by the 'preprocessing' step, 
+            used if feature_names is not given.
+        importances (series, optional): Importances to plot instead of the classifier step's 
+            feature_importances_ (which clf_step_name is then not needed for), indexed by feature 
+            name, e.g. the 'importance_mean' column of grouped_permutation_importance.
         model_title (str): A description of the model for customizing plot title.
         save (bool, default=False): Whether to save the returned figure.
         fig_name (str, optional): What to name the file if the image is being saved.
@@ -431,8 +1407,21 @@ def plot_feat_importance(clf, clf_step_name, feature_names,
     
     fig_filepath = 'Figures/'
     
-    feature_importances = (
-        clf.named_steps[clf_step_name].feature_importances_)
+    if importances is not None:
+        feature_importances = pd.Series(importances).values
+        if feature_names is None:
+            feature_names = pd.Series(importances).index
+    else:
+        feature_importances = (
+            clf.named_steps[clf_step_name].feature_importances_)
+    
+    if feature_names is None:
+        feature_names = get_feature_names(clf.named_steps['preprocessing'], cat_cols)
+    
+    if len(feature_names) != len(feature_importances):
+        raise ValueError('Got {} feature names for {} feature importances; check that feature_names '
+                         'matches the encoding used by the pipeline'.format(len(feature_names),
+                                                                             len(feature_importances)))
     
     importance = pd.Series(feature_importances, index=feature_names)
     plt.figure(figsize=(8,6))
@@ -450,6 +1439,194 @@ def plot_feat_importance(clf, clf_step_name, feature_names,
 
 
 
+#################################################################################
+#################################################################################
+
+#################################################################################
+#################################################################################
+
+
+
+def proba_score(y_true, y_proba, classes, scoring='balanced_accuracy'):
+    
+    """Scores predicted class probabilities with one of 'balanced_accuracy', 'accuracy', 'roc_auc' 
+       or 'neg_log_loss' (higher is better for each).
+    """
+    
+    import numpy as np
+    from sklearn import metrics
+    
+    if scoring == 'roc_auc':
+        if len(classes) == 2:
+            return metrics.roc_auc_score(y_true, y_proba[:, 1])
+        return metrics.roc_auc_score(y_true, y_proba, multi_class='ovr', labels=classes)
+    
+    if scoring == 'neg_log_loss':
+        return -metrics.log_loss(y_true, y_proba, labels=classes)
+    
+    y_pred = np.asarray(classes)[np.argmax(y_proba, axis=1)]
+    
+    if scoring == 'balanced_accuracy':
+        return metrics.balanced_accuracy_score(y_true, y_pred)
+    if scoring == 'accuracy':
+        return metrics.accuracy_score(y_true, y_pred)
+    
+    raise ValueError("scoring must be 'balanced_accuracy', 'accuracy', 'roc_auc' or 'neg_log_loss', "
+                     "got '{}'".format(scoring))
+
+
+
+#################################################################################
+#################################################################################
+
+#################################################################################
+#################################################################################
+
+
+
+def predict_row_keys(clf, keys, columns, uniques):
+    
+    """Predicts class probabilities for the rows encoded by keys, the flat indices of each row's 
+       per-column codes into the product of the columns' unique values (see 
+       grouped_permutation_importance).
+    """
+    
+    import numpy as np
+    import pandas as pd
+    
+    codes = np.unravel_index(keys, [len(col_uniques) for col_uniques in uniques])
+    rows = pd.DataFrame({col: np.asarray(col_uniques, dtype=object)[col_codes]
+                         for col, col_uniques, col_codes in zip(columns, uniques, codes)})
+    
+    return clf.predict_proba(rows)
+
+
+
+#################################################################################
+#################################################################################
+
+#################################################################################
+#################################################################################
+
+
+
+def permuted_scores(clf, codes, uniques, columns, y, col_idx, base_keys, base_proba,
+                    scoring, n_repeats, seed):
+    
+    """Scores clf n_repeats times with the codes of column col_idx shuffled. Predictions are looked 
+       up from the baseline predictions of each unique row (base_keys, sorted, and base_proba), so 
+       only combinations created by the shuffle are predicted, and those are added to the lookup 
+       for the following repeats. Runs in a worker process.
+    """
+    
+    import numpy as np
+    
+    rng = np.random.default_rng(seed)
+    dims = [len(col_uniques) for col_uniques in uniques]
+    known_keys, known_proba = base_keys, base_proba
+    
+    scores = []
+    for _ in range(n_repeats):
+        perm_codes = list(codes)
+        perm_codes[col_idx] = rng.permutation(codes[col_idx])
+        keys = np.ravel_multi_index(perm_codes, dims)
+        
+        new_keys = np.setdiff1d(keys, known_keys)
+        if len(new_keys):
+            known_keys = np.concatenate([known_keys, new_keys])
+            known_proba = np.concatenate([known_proba,
+                                          predict_row_keys(clf, new_keys, columns, uniques)])
+            order = np.argsort(known_keys)
+            known_keys, known_proba = known_keys[order], known_proba[order]
+        
+        y_proba = known_proba[np.searchsorted(known_keys, keys)]
+        scores.append(proba_score(y, y_proba, clf.classes_, scoring))
+    
+    return scores
+
+
+
+#################################################################################
+#################################################################################
+
+#################################################################################
+#################################################################################
+
+
+
+def grouped_permutation_importance(clf, X, y, scoring='balanced_accuracy', n_repeats=5,
+                                   n_jobs=-1, random_state=None):
+    
+    """Computes the permutation importance of each original (categorical) column of X for a fitted 
+       pipeline, i.e. how much the score drops when that column is shuffled. Since the pipeline does 
+       the encoding, shuffling a column moves all of its one-hot children together, so importance 
+       isn't split across (or biased toward) columns with many categories, and it works for any 
+       classifier with predict_proba. Columns are shuffled in parallel, and because the turnout 
+       features only take about 19,000 distinct combinations (out of ~300k rows), the model is only 
+       called on the unique rows: once for the baseline, then for any new combinations a shuffle 
+       creates.
+       
+    Args:
+        clf (estimator): A fitted sklearn Pipeline (or classifier) that takes the columns of X.
+        X (DataFrame): Unencoded features, e.g. X_test.
+        y (series or array): True labels for X.
+        scoring (str, optional): 'balanced_accuracy', 'accuracy', 'roc_auc' or 'neg_log_loss'. 
+            Defaults to 'balanced_accuracy'.
+        n_repeats (int, optional): Number of times each column is shuffled. Defaults to 5.
+        n_jobs (int, optional): Number of worker processes (-1 for all cores). Defaults to -1.
+        random_state (int, optional): Seed for the shuffles. Defaults to None.
+    
+    Returns:
+        DataFrame: The mean and standard deviation of the drop in score from shuffling each column 
+            ('importance_mean', 'importance_std') and the unshuffled score ('baseline_score'), 
+            sorted by importance_mean.
+    
+    Example:
+        >>> perm_imp = grouped_permutation_importance(rf_grid.best_estimator_, X_test, y_test)
+        >>> plot_feat_importance(rf_grid.best_estimator_, None, importances=perm_imp['importance_mean'],
+        model_title='Random Forest Permutation')
+    
+    """
+    
+    import numpy as np
+    import pandas as pd
+    from joblib import Parallel, delayed
+    
+    X = pd.DataFrame(X)
+    y = np.asarray(y)
+    columns = list(X.columns)
+    
+    # Encode each row as a flat index into the product of its columns' unique values
+    codes, uniques = [], []
+    for col in columns:
+        col_codes, col_uniques = pd.factorize(X[col], use_na_sentinel=False)
+        codes.append(col_codes.astype(np.int32))
+        uniques.append(col_uniques)
+    
+    keys = np.ravel_multi_index(codes, [len(col_uniques) for col_uniques in uniques])
+    
+    # Predict each unique row once for the baseline score, then share those predictions
+    base_keys, inverse = np.unique(keys, return_inverse=True)
+    base_proba = predict_row_keys(clf, base_keys, columns, uniques)
+    baseline_score = proba_score(y, base_proba[inverse.ravel()], clf.classes_, scoring)
+    
+    seeds = np.random.SeedSequence(random_state).spawn(len(columns))
+    scores = Parallel(n_jobs=n_jobs)(
+        delayed(permuted_scores)(clf, codes, uniques, columns, y, col_idx, base_keys,
+                                 base_proba, scoring, n_repeats, seed)
+        for col_idx, seed in enumerate(seeds)
+    )
+    
+    drops = baseline_score - np.array(scores)
+    
+    importance = pd.DataFrame({'importance_mean': drops.mean(axis=1),
+                               'importance_std': drops.std(axis=1),
+                               'baseline_score': baseline_score}, index=columns)
+    
+    return importance.sort_values('importance_mean', ascending=False)
+
+
+
 #################################################################################
 #################################################################################
 
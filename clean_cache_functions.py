@@ -0,0 +1,236 @@
+import os
+import time
+import hashlib
+import inspect
+import tempfile
+
+import pandas as pd
+
+import clean_vreg_functions
+import stream_vreg_data
+import validate_vreg_functions
+from stream_vreg_data import iter_download, stream_vreg_table
+
+
+## Functions and tables whose contents determine clean_vreg's output
+CLEANER_PARTS = [
+    clean_vreg_functions.get_birth_reg_census,
+    clean_vreg_functions.get_gen_grp,
+    clean_vreg_functions.fill_missing,
+    clean_vreg_functions.get_city_grps,
+    clean_vreg_functions.clean_vreg,
+    clean_vreg_functions.VREG_DTYPES,
+    validate_vreg_functions
+]
+
+
+## Define function for hashing the cleaning code and its bucket tables
+def get_cleaner_hash(parts=CLEANER_PARTS):
+    """Returns a SHA-256 hex digest of the source code of the cleaning
+        functions (which include the birth region, generation, party, race and
+        city bucket tables), the validation rules and the read dtypes, so any
+        change to how raw files are validated or cleaned produces a new hash.
+    """
+
+    sha = hashlib.sha256()
+    for part in parts:
+        if callable(part) or inspect.ismodule(part):
+            sha.update(inspect.getsource(part).encode())
+        else:
+            sha.update(repr(sorted(part.items())).encode())
+
+    return sha.hexdigest()
+
+
+## Define function for hashing a file without reading it all into memory
+def hash_file(path, block_size=1024**2):
+
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            sha.update(block)
+
+    return sha.hexdigest()
+
+
+
+
+## Class for reusing cleaned voter registration data across processes and restarts
+class CleanCache:
+    """On-disk memoization of clean_vreg output, keyed by the SHA-256 of the
+        raw archive, the hash of the cleaning code, and the reader engine and
+        read arguments (the pyarrow engine returns categorical columns where
+        pandas returns strings), so re-reading an archive whose bytes (and the
+        cleaner) haven't changed skips parsing and cleaning.
+
+        Entries are stored as Parquet files (or pickles if pyarrow is not
+        installed). Entries not used for max_age_days are evicted, then the
+        least recently used entries are evicted until the cache fits in
+        max_total_mb. Temporary files left by interrupted writes and downloads
+        are removed once they are max_tmp_age_hours old.
+
+    Args:
+        cache_dir (str, optional): Directory to store cleaned outputs in.
+            Defaults to 'App_Data/clean_cache'.
+        max_age_days (float, optional): Days since last use after which an
+            entry is evicted. Defaults to 30.
+        max_total_mb (float, optional): Maximum total size in MB of all
+            entries. Defaults to 2048.
+        max_tmp_age_hours (float, optional): Hours since a temporary file was
+            last written after which it is treated as orphaned. Defaults to 24.
+    """
+
+    def __init__(self, cache_dir='App_Data/clean_cache', max_age_days=30,
+                 max_total_mb=2048, max_tmp_age_hours=24):
+        self.cache_dir = cache_dir
+        self.max_age_days = max_age_days
+        self.max_total_bytes = max_total_mb * 1024**2
+        self.max_tmp_age_hours = max_tmp_age_hours
+        self.cleaner_hash = get_cleaner_hash()
+        os.makedirs(cache_dir, exist_ok=True)
+
+        try:
+            import pyarrow
+            self.ext = '.parquet'
+        except ImportError:
+            self.ext = '.pkl'
+
+
+    def key(self, archive_hash, city_grps=None, engine='pandas', read_kwargs=None):
+        """Returns the cache key for an archive hash, optional fixed city
+            groups, and the reader engine and read arguments used to parse it."""
+        sha = hashlib.sha256()
+        sha.update(archive_hash.encode())
+        sha.update(self.cleaner_hash.encode())
+        sha.update(repr(None if city_grps is None else sorted(city_grps)).encode())
+        sha.update(engine.encode())
+
+        # Sort dict arguments (e.g. dtype) so the key doesn't depend on their order
+        for name, value in sorted((read_kwargs or {}).items()):
+            if isinstance(value, dict):
+                value = sorted((col, str(dtype)) for col, dtype in value.items())
+            sha.update('{}={!r}'.format(name, value).encode())
+
+        return sha.hexdigest()
+
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + self.ext)
+
+
+    def get(self, key):
+        """Returns the cached cleaned DataFrame for key, or None on a miss."""
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+
+        # Mark the entry as recently used for eviction
+        os.utime(path)
+
+        if self.ext == '.parquet':
+            return pd.read_parquet(path)
+        return pd.read_pickle(path)
+
+
+    def put(self, key, clean_df):
+        """Stores a cleaned DataFrame under key, then evicts old entries."""
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        os.close(fd)
+
+        if self.ext == '.parquet':
+            clean_df.to_parquet(tmp_path, index=False)
+        else:
+            clean_df.to_pickle(tmp_path)
+
+        # Rename into place so other processes never read a partial entry
+        os.replace(tmp_path, self._path(key))
+        self.evict()
+
+
+    def evict(self):
+        """Removes entries unused for max_age_days, then the least recently
+            used entries until the cache fits in max_total_mb. Also removes
+            orphaned temporary files (entries and archives) left by
+            interrupted calls."""
+        now = time.time()
+        entries = []
+
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+
+            if name.endswith('.tmp'):
+                try:
+                    if (now - os.stat(path).st_mtime) / 3600 > self.max_tmp_age_hours:
+                        os.remove(path)
+                except FileNotFoundError:
+                    # Finished (renamed or removed) by another process meanwhile
+                    pass
+                continue
+
+            if not name.endswith(self.ext):
+                continue
+            stat = os.stat(path)
+
+            if (now - stat.st_mtime) / 86400 > self.max_age_days:
+                os.remove(path)
+            else:
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_total_bytes:
+                break
+            os.remove(path)
+            total -= size
+
+
+    def clean_archive(self, url, city_grps=None, quarantine_dir=None, **read_kwargs):
+        """Returns clean_vreg output for the zipped voter registration file at
+            url. The archive is streamed to a temporary file while being
+            hashed; if a cleaned output for the same bytes and cleaner exists
+            it is returned without parsing, otherwise the file is parsed,
+            cleaned and cached.
+
+        Args:
+            url (str): URL or local path of a zipped ncvoter file.
+            city_grps (list of str, optional): Cities to keep as their own
+                city_grp. Defaults to those computed by clean_vreg.
+            quarantine_dir (str, optional): Directory to save the rows that
+                fail validation to when the archive is cleaned (see
+                report_validation). Defaults to None (only logged).
+            **read_kwargs: Keyword arguments for stream_vreg_table (including
+                engine). Defaults to get_vreg_read_kwargs().
+
+        Returns:
+            DataFrame: Cleaned voter registration data.
+        """
+
+        engine = read_kwargs.pop('engine', None) or stream_vreg_data.reader_engine
+        if not read_kwargs:
+            read_kwargs = clean_vreg_functions.get_vreg_read_kwargs()
+
+        fd, archive_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.zip.tmp')
+
+        try:
+            sha = hashlib.sha256()
+            with os.fdopen(fd, 'wb') as f:
+                for block in iter_download(url):
+                    sha.update(block)
+                    f.write(block)
+
+            key = self.key(sha.hexdigest(), city_grps, engine, read_kwargs)
+            clean_df = self.get(key)
+
+            if clean_df is None:
+                raw_df = stream_vreg_table(archive_path, engine=engine, **read_kwargs)
+                raw_df = validate_vreg_functions.report_validation(
+                    *validate_vreg_functions.validate_vreg(raw_df), source=url,
+                    quarantine_dir=quarantine_dir
+                )
+                clean_df = clean_vreg_functions.clean_vreg(raw_df, city_grps)
+                self.put(key, clean_df)
+
+            return clean_df
+
+        finally:
+            os.remove(archive_path)
@@ -48,8 +48,61 @@ def get_gen_grp(birth_year):
         return 'Missing'
 
 
+## Define function for filling null values, including in categorical columns
+def fill_missing(series, value='Missing'):
+
+    import pandas as pd
+
+    if isinstance(series.dtype, pd.CategoricalDtype) and value not in series.cat.categories:
+        series = series.cat.add_categories([value])
+
+    return series.fillna(value)
+
+
+## Define function for finding the cities that make up at least 5% of voters
+def get_city_grps(res_city_desc, thresh=0.05):
+
+    city_pcts = fill_missing(res_city_desc).value_counts(normalize=True)
+    city_grps = list(city_pcts[city_pcts >= thresh].index)
+
+    # Missing city is always kept as its own category, separate from 'Other'
+    if 'Missing' not in city_grps:
+        city_grps.append('Missing')
+
+    return city_grps
+
+
+## Raw voter registration columns read by clean_vreg, and the dtypes to read them
+  # with, so loaders only parse the 11 (of ~70) columns that are actually used
+  # (birth_age and birth_year are floats so a missing value doesn't fail the read)
+VREG_DTYPES = {
+    'voter_status_desc': 'category',
+    'reason_cd': 'category',
+    'res_city_desc': 'category',
+    'race_code': 'category',
+    'party_cd': 'category',
+    'gender_code': 'category',
+    'birth_age': 'float64',
+    'birth_state': 'category',
+    'drivers_lic': 'category',
+    'registr_dt': 'str',
+    'birth_year': 'float64'
+}
+
+VREG_COLS_USED = list(VREG_DTYPES)
+
+
+## Define function for getting the read_table arguments for projecting raw files
+def get_vreg_read_kwargs(extra_cols=None):
+
+    usecols = VREG_COLS_USED + [col for col in (extra_cols or [])
+                                if col not in VREG_DTYPES]
+
+    return {'usecols': usecols, 'dtype': VREG_DTYPES.copy()}
+
+
 ## Define function for cleaning and preparing df for visualization
-def clean_vreg(df):
+def clean_vreg(df, city_grps=None):
 
     import pandas as pd
     import numpy as np
@@ -58,7 +111,7 @@ def clean_vreg(df):
     df['registr_dt'] = pd.to_datetime(df['registr_dt'])
 
     # Fill null values in birth_state with 'Missing'
-    df['birth_state'].fillna(value='Missing', inplace=True)
+    df['birth_state'] = fill_missing(df['birth_state'])
 
     # Recast drivers_lic for sake of clarity in figures
     df['drivers_lic'] = np.where(df['drivers_lic']=='Y',
@@ -83,13 +136,13 @@ def clean_vreg(df):
     
     df['race_grp'] = df['race_grp'].map(race_grp_map)
 
-    # Create new column grouping most infrequent cities (<5% of voters)
-    df['res_city_desc'].fillna('Missing', inplace=True)
-    df['city_grp'] = np.where(df['res_city_desc'].isin(['MONROE', 
-                                                        'WAXHAW',
-                                                        'INDIAN TRAIL',
-                                                        'MATTHEWS',
-                                                        'Missing']),
+    # Create new column grouping most infrequent cities (<5% of voters),
+      # finding the county's most frequent cities from the data if not provided
+    df['res_city_desc'] = fill_missing(df['res_city_desc'])
+    if city_grps is None:
+        city_grps = get_city_grps(df['res_city_desc'])
+
+    df['city_grp'] = np.where(df['res_city_desc'].isin(city_grps),
                               df['res_city_desc'].str.title(),
                               'Other')
 
@@ -0,0 +1,232 @@
+import os
+import json
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from clean_vreg_functions import clean_vreg, get_vreg_read_kwargs
+from validate_vreg_functions import validate_vreg, report_validation
+from stream_vreg_data import stream_vreg_table
+from registr_dt_functions import RegistrTimeSeries
+
+
+## Base path to NCSBE voter registration/ history data files
+ncsbe_data_url = "https://s3.amazonaws.com/dl.ncsbe.gov/data/"
+
+## NC counties in NCSBE county_id order (alphabetical, Union County is 90)
+NC_COUNTIES = [
+    'Alamance', 'Alexander', 'Alleghany', 'Anson', 'Ashe',
+    'Avery', 'Beaufort', 'Bertie', 'Bladen', 'Brunswick',
+    'Buncombe', 'Burke', 'Cabarrus', 'Caldwell', 'Camden',
+    'Carteret', 'Caswell', 'Catawba', 'Chatham', 'Cherokee',
+    'Chowan', 'Clay', 'Cleveland', 'Columbus', 'Craven',
+    'Cumberland', 'Currituck', 'Dare', 'Davidson', 'Davie',
+    'Duplin', 'Durham', 'Edgecombe', 'Forsyth', 'Franklin',
+    'Gaston', 'Gates', 'Graham', 'Granville', 'Greene',
+    'Guilford', 'Halifax', 'Harnett', 'Haywood', 'Henderson',
+    'Hertford', 'Hoke', 'Hyde', 'Iredell', 'Jackson',
+    'Johnston', 'Jones', 'Lee', 'Lenoir', 'Lincoln',
+    'Macon', 'Madison', 'Martin', 'McDowell', 'Mecklenburg',
+    'Mitchell', 'Montgomery', 'Moore', 'Nash', 'New Hanover',
+    'Northampton', 'Onslow', 'Orange', 'Pamlico', 'Pasquotank',
+    'Pender', 'Perquimans', 'Person', 'Pitt', 'Polk',
+    'Randolph', 'Richmond', 'Robeson', 'Rockingham', 'Rowan',
+    'Rutherford', 'Sampson', 'Scotland', 'Stanly', 'Stokes',
+    'Surry', 'Swain', 'Transylvania', 'Tyrrell', 'Union',
+    'Vance', 'Wake', 'Warren', 'Washington', 'Watauga',
+    'Wayne', 'Wilkes', 'Wilson', 'Yadkin', 'Yancey'
+]
+
+UNION_COUNTY_ID = 90
+
+
+## Define function for getting a county's name from its NCSBE county_id
+def get_county_name(county_id):
+    return NC_COUNTIES[county_id - 1]
+
+
+## Define function for getting the path to a county's voter registration file
+def get_county_vreg_url(county_id):
+    return ncsbe_data_url + 'ncvoter{}.zip'.format(county_id)
+
+
+## Define function for retrieving and cleaning a county's voter registration file
+  # (reusing cleaned output from a CleanCache if the file hasn't changed), saving
+  # the rows that fail validation to quarantine_dir if given
+def read_county_vreg(county_id, clean_cache=None, quarantine_dir=None):
+
+    url = get_county_vreg_url(county_id)
+
+    if clean_cache is None:
+        vreg_data = stream_vreg_table(url, **get_vreg_read_kwargs())
+        vreg_df = clean_vreg(report_validation(*validate_vreg(vreg_data), source=url,
+                                               quarantine_dir=quarantine_dir))
+    else:
+        vreg_df = clean_cache.clean_archive(url, quarantine_dir=quarantine_dir)
+
+    dt_retrieved = datetime.now(
+        timezone.utc
+    ).astimezone().strftime(
+        "%m/%d/%Y %H:%M:%S %Z"
+    )
+
+    return vreg_df, dt_retrieved
+
+
+
+
+## Class for a single county's cleaned data and precomputed aggregates
+class CountyData:
+
+    # Initialize with the cleaned registration data, precomputing aggregates
+    def __init__(self, county_id, vreg_df, dt_retrieved):
+        self.county_id = county_id
+        self.name = get_county_name(county_id)
+        self.vreg_df = vreg_df
+        self.dt_retrieved = dt_retrieved
+        self.registr_ts = RegistrTimeSeries(vreg_df)
+
+    # Approximate resident memory in bytes of the data and its aggregates
+    def memory_usage(self):
+        ts_bytes = sum(arr.nbytes for arr in self.registr_ts.counts.values())
+        ts_bytes += sum(arr.nbytes for arr in self.registr_ts.cum_counts.values())
+
+        return int(self.vreg_df.memory_usage(deep=True).sum()) + ts_bytes
+
+
+
+
+## Class for lazily loading counties from a per-county partitioned store
+class CountyStore:
+    """Loads each county's cleaned voter registration data only when it is
+        requested, keeping the most recently used counties resident in memory.
+
+        Cleaned data is written to one partition directory per county
+        ({store_dir}/{county_id:03d}/) the first time the county is retrieved
+        from NCSBE, and is re-read from there until it is older than max_age_days.
+        Rows that fail validation are saved to the partition's quarantine.csv.gz
+        and quality_summary.csv (see report_validation).
+        Once the resident counties exceed mem_budget_mb, the least recently used
+        counties are dropped from memory (but stay on disk). Counties are
+        loaded outside the store's lock, so sessions asking for a resident
+        county never wait behind another county's download, and a county
+        requested by several sessions at once is only loaded once.
+
+    Args:
+        store_dir (str, optional): Directory holding the county partitions.
+            Defaults to 'App_Data/counties'.
+        mem_budget_mb (float, optional): Memory budget in MB for resident
+            counties. The most recently requested county is always kept, even
+            if it alone exceeds the budget. Defaults to 1024.
+        max_age_days (float, optional): Age after which a partition is
+            re-retrieved from NCSBE. NCSBE updates the files weekly.
+            Defaults to 7.
+        clean_cache (CleanCache, optional): Cache of cleaned outputs to reuse
+            when a re-retrieved file hasn't changed. Defaults to None.
+    """
+
+    def __init__(self, store_dir='App_Data/counties', mem_budget_mb=1024,
+                 max_age_days=7, clean_cache=None):
+        self.store_dir = store_dir
+        self.mem_budget = mem_budget_mb * 1024**2
+        self.max_age_days = max_age_days
+        self.clean_cache = clean_cache
+        self.resident = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks = {}
+
+
+    def _partition_dir(self, county_id):
+        return os.path.join(self.store_dir, '{:03d}'.format(county_id))
+
+
+    def _read_partition(self, county_id):
+        # Returns None if the partition does not exist or is out of date
+        part_dir = self._partition_dir(county_id)
+        meta_path = os.path.join(part_dir, 'meta.json')
+
+        if not os.path.exists(meta_path):
+            return None
+
+        with open(meta_path) as f:
+            meta = json.load(f)
+
+        age_days = (datetime.now(timezone.utc).timestamp() - meta['ts_retrieved']) / 86400
+        if age_days > self.max_age_days:
+            return None
+
+        vreg_df = pd.read_csv(os.path.join(part_dir, 'vreg.gz'),
+                              parse_dates=['registr_dt'])
+
+        return vreg_df, meta['dt_retrieved']
+
+
+    def write_partition(self, county_id, vreg_df, dt_retrieved):
+        """Writes a county's cleaned data and retrieval time to its partition."""
+        part_dir = self._partition_dir(county_id)
+        os.makedirs(part_dir, exist_ok=True)
+
+        vreg_df.to_csv(os.path.join(part_dir, 'vreg.gz'), index=False)
+
+        # Write metadata last so a partially written partition is never read
+        with open(os.path.join(part_dir, 'meta.json'), 'w') as f:
+            json.dump({'county_id': county_id,
+                       'dt_retrieved': dt_retrieved,
+                       'ts_retrieved': datetime.now(timezone.utc).timestamp(),
+                       'n_rows': len(vreg_df)}, f)
+
+
+    def _evict(self):
+        # Drop least recently used counties until back under the memory budget
+        while len(self.resident) > 1 and self.memory_usage() > self.mem_budget:
+            self.resident.popitem(last=False)
+
+
+    def memory_usage(self):
+        """Returns the approximate memory in bytes of all resident counties."""
+        return sum(data.nbytes for data in self.resident.values())
+
+
+    def get(self, county_id):
+        """Returns the CountyData for county_id, loading it from its partition
+            (or from NCSBE if the partition is missing or out of date) if it
+            is not already resident.
+
+        Args:
+            county_id (int): NCSBE county_id (1-100).
+
+        Returns:
+            CountyData: The county's cleaned registration data and aggregates.
+        """
+
+        with self._lock:
+            if county_id in self.resident:
+                self.resident.move_to_end(county_id)
+                return self.resident[county_id]
+
+            load_lock = self._load_locks.setdefault(county_id, threading.Lock())
+
+        # Only one session loads a county; others requesting it wait for that load
+        with load_lock:
+            with self._lock:
+                if county_id in self.resident:
+                    self.resident.move_to_end(county_id)
+                    return self.resident[county_id]
+
+            loaded = self._read_partition(county_id)
+
+            if loaded is None:
+                loaded = read_county_vreg(county_id, self.clean_cache,
+                                          self._partition_dir(county_id))
+                self.write_partition(county_id, *loaded)
+
+            data = CountyData(county_id, *loaded)
+            data.nbytes = data.memory_usage()
+
+            with self._lock:
+                self.resident[county_id] = data
+                self._evict()
+
+            return data
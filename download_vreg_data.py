@@ -0,0 +1,259 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.request import Request, urlopen
+
+from county_data_functions import ncsbe_data_url
+
+
+## Paths to the statewide voter registration and voting history files
+statewide_vreg_url = ncsbe_data_url + 'ncvoter_Statewide.zip'
+statewide_vhis_url = ncsbe_data_url + 'ncvhis_Statewide.zip'
+
+## Size of each read from a response body, and how often download progress is saved
+block_size = 1024**2
+save_every = 16 * block_size
+
+
+## Define function for checking a file's size and whether it can be fetched in ranges
+def get_remote_info(url):
+    """Sends a HEAD request and returns the file's size (None if unknown),
+        whether the server accepts byte Range requests, and its validator
+        (ETag or Last-Modified) for detecting changes between attempts.
+    """
+
+    with urlopen(Request(url, method='HEAD')) as resp:
+        size = resp.headers.get('Content-Length')
+        accepts_ranges = resp.headers.get('Accept-Ranges', '').lower() == 'bytes'
+        validator = resp.headers.get('ETag') or resp.headers.get('Last-Modified')
+
+    return (int(size) if size is not None else None), accepts_ranges, validator
+
+
+
+
+## Class for downloading large NCSBE files in resumable, parallel segments
+class RangeDownloader:
+    """Downloads a file as n_segments byte ranges fetched in parallel into a
+        preallocated '.part' file. Progress of each segment is saved to a
+        '.part.json' file, so an interrupted download resumes where each
+        segment left off (as long as the remote file hasn't changed). The
+        finished file is checked against the expected size and (optionally)
+        SHA-256 before being moved into place. Servers that don't accept
+        Range requests are downloaded in a single stream.
+
+    Args:
+        n_segments (int, optional): Number of ranges downloaded in parallel.
+            Defaults to 4.
+        max_retries (int, optional): Retries per segment, each resuming from
+            the last byte written. Defaults to 5.
+        backoff_base (float, optional): Base seconds to wait between retries,
+            doubled each retry. Defaults to 2.
+    """
+
+    def __init__(self, n_segments=4, max_retries=5, backoff_base=2.0):
+        self.n_segments = n_segments
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+
+
+    def _load_state(self, state_path, part_path, url, size, validator):
+        # Reuse saved progress only if it was for the same version of the file
+          # and the partly downloaded file it describes is still there
+        if os.path.exists(state_path) and os.path.exists(part_path):
+            with open(state_path) as f:
+                state = json.load(f)
+            if (state['url'] == url and state['size'] == size
+                    and state['validator'] == validator
+                    and os.path.getsize(part_path) == size):
+                return state
+
+        bounds = [size * i // self.n_segments for i in range(self.n_segments + 1)]
+        return {'url': url, 'size': size, 'validator': validator,
+                'segments': [{'start': bounds[i], 'end': bounds[i + 1], 'done': 0}
+                             for i in range(self.n_segments)]}
+
+
+    def _save_state(self, state, state_path):
+        with self._lock:
+            tmp_path = state_path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(state, f)
+            os.replace(tmp_path, state_path)
+
+
+    def _fetch_segment(self, url, part_path, segment, state, state_path):
+        # Download one byte range, retrying from the last byte written
+        for attempt in range(self.max_retries + 1):
+            start = segment['start'] + segment['done']
+            if start >= segment['end']:
+                return
+
+            try:
+                req = Request(url, headers={
+                    'Range': 'bytes={}-{}'.format(start, segment['end'] - 1)
+                })
+                with urlopen(req) as resp, open(part_path, 'r+b') as f:
+                    if resp.status != 206:
+                        raise IOError('Server ignored Range request (status {})'.format(resp.status))
+
+                    f.seek(start)
+                    remaining = segment['end'] - start
+                    unsaved = 0
+
+                    # Progress is only recorded once the bytes are flushed to disk
+                    try:
+                        while remaining > 0:
+                            block = resp.read(min(block_size, remaining))
+                            if not block:
+                                break
+                            f.write(block)
+                            remaining -= len(block)
+                            unsaved += len(block)
+
+                            if unsaved >= save_every:
+                                f.flush()
+                                segment['done'] += unsaved
+                                unsaved = 0
+                                self._save_state(state, state_path)
+                    finally:
+                        f.flush()
+                        segment['done'] += unsaved
+                        self._save_state(state, state_path)
+
+                if segment['start'] + segment['done'] >= segment['end']:
+                    return
+
+            except Exception:
+                if attempt == self.max_retries:
+                    raise
+
+            time.sleep(self.backoff_base * 2**attempt)
+
+        raise IOError('Segment {}-{} incomplete after {} retries'.format(
+            segment['start'], segment['end'], self.max_retries))
+
+
+    def _fetch_whole(self, url, part_path):
+        # Fallback for servers without Range support
+        with urlopen(url) as resp, open(part_path, 'wb') as f:
+            for block in iter(lambda: resp.read(block_size), b''):
+                f.write(block)
+
+
+    def download(self, url, dest_path, expected_size=None, expected_sha256=None):
+        """Downloads url to dest_path, resuming any earlier interrupted attempt.
+
+        Args:
+            url (str): URL of the file, e.g. statewide_vreg_url.
+            dest_path (str): Path to save the verified file to.
+            expected_size (int, optional): Expected size in bytes. Defaults to
+                the size reported by the server.
+            expected_sha256 (str, optional): Expected SHA-256 hex digest.
+                Defaults to None (not checked).
+
+        Returns:
+            str: SHA-256 hex digest of the downloaded file.
+
+        Raises:
+            IOError: If the downloaded file's size or SHA-256 doesn't match.
+        """
+
+        self._lock = threading.Lock()
+        part_path = dest_path + '.part'
+        state_path = dest_path + '.part.json'
+
+        size, accepts_ranges, validator = get_remote_info(url)
+        if expected_size is None:
+            expected_size = size
+
+        if accepts_ranges and size:
+            state = self._load_state(state_path, part_path, url, size, validator)
+
+            # Preallocate the file so each segment can write at its own offset,
+              # starting from an empty file unless resuming saved progress
+            resuming = any(segment['done'] for segment in state['segments'])
+            with open(part_path, 'r+b' if resuming else 'wb') as f:
+                f.truncate(size)
+            self._save_state(state, state_path)
+
+            with ThreadPoolExecutor(max_workers=self.n_segments) as pool:
+                futures = [pool.submit(self._fetch_segment, url, part_path,
+                                       segment, state, state_path)
+                           for segment in state['segments']]
+                for future in futures:
+                    future.result()
+
+        else:
+            self._fetch_whole(url, part_path)
+
+        # Verify before handing the file on
+        actual_size = os.path.getsize(part_path)
+        if expected_size is not None and actual_size != expected_size:
+            raise IOError('Downloaded {} bytes, expected {}'.format(actual_size, expected_size))
+
+        sha = hashlib.sha256()
+        with open(part_path, 'rb') as f:
+            for block in iter(lambda: f.read(block_size), b''):
+                sha.update(block)
+        sha256 = sha.hexdigest()
+
+        if expected_sha256 is not None and sha256 != expected_sha256.lower():
+            # The partial data can't be trusted, so start over next time
+            os.remove(part_path)
+            if os.path.exists(state_path):
+                os.remove(state_path)
+            raise IOError('SHA-256 mismatch: got {}, expected {}'.format(sha256, expected_sha256))
+
+        os.replace(part_path, dest_path)
+        if os.path.exists(state_path):
+            os.remove(state_path)
+
+        return sha256
+
+
+## Define function for downloading, verifying and cleaning the statewide registration file
+def get_statewide_vreg(dest_dir='App_Data/raw', expected_sha256=None, n_segments=4,
+                       clean_cache=None):
+    """Downloads (or resumes downloading) ncvoter_Statewide.zip, verifies it
+        and returns the cleaned statewide voter registration data.
+
+    Args:
+        dest_dir (str, optional): Directory to save the zip file to.
+            Defaults to 'App_Data/raw'.
+        expected_sha256 (str, optional): Expected SHA-256 of the zip file.
+            Defaults to None (only the size is checked).
+        n_segments (int, optional): Number of ranges downloaded in parallel.
+            Defaults to 4.
+        clean_cache (CleanCache, optional): Cache of cleaned outputs to reuse
+            if the archive hasn't changed. Defaults to None (always clean).
+
+        Rows that fail validation are saved to dest_dir/ncvoter_Statewide_quarantine/
+        (see report_validation).
+
+    Returns:
+        DataFrame: Cleaned statewide voter registration data.
+    """
+
+    from clean_vreg_functions import clean_vreg, get_vreg_read_kwargs
+    from stream_vreg_data import stream_vreg_table
+    from validate_vreg_functions import validate_vreg, report_validation
+
+    os.makedirs(dest_dir, exist_ok=True)
+    dest_path = os.path.join(dest_dir, 'ncvoter_Statewide.zip')
+    quarantine_dir = os.path.join(dest_dir, 'ncvoter_Statewide_quarantine')
+
+    RangeDownloader(n_segments=n_segments).download(
+        statewide_vreg_url, dest_path, expected_sha256=expected_sha256
+    )
+
+    if clean_cache is not None:
+        return clean_cache.clean_archive(dest_path, quarantine_dir=quarantine_dir)
+
+    raw_df = stream_vreg_table(dest_path, **get_vreg_read_kwargs())
+
+    return clean_vreg(report_validation(*validate_vreg(raw_df), source=dest_path,
+                                        quarantine_dir=quarantine_dir))
@@ -0,0 +1,243 @@
+import numpy as np
+import pandas as pd
+
+from clean_vreg_functions import VREG_DTYPES, clean_vreg
+from lookup_scorer_functions import MODEL_FEATURE_COLS
+from score_vreg_data import (get_known_rows, get_model_categories, get_model_city_grps,
+                             prep_model_features)
+from validate_vreg_functions import validate_vreg, report_validation
+from vreg_snapshot_functions import INSERTED, CHANGED
+
+
+## Define function for turning a registration snapshot into model features
+def get_snapshot_features(snap, categories):
+    """Validates and cleans a snapshot (as from VregSnapshotStore, where every
+        value is a string) and returns its model features indexed by ncid.
+
+    Args:
+        snap (DataFrame): Registration snapshot with 'ncid' and VREG_COLS_USED.
+        categories (dict): Feature column mapped to the model's categories,
+            as from get_model_categories.
+
+    Returns:
+        DataFrame: Model features of the valid registrations, indexed by ncid.
+    """
+
+    raw = snap.set_index('ncid')
+
+    num_cols = [col for col, dtype in VREG_DTYPES.items()
+                if pd.api.types.is_numeric_dtype(pd.api.types.pandas_dtype(dtype))]
+    for col in num_cols:
+        raw[col] = pd.to_numeric(raw[col], errors='coerce')
+    raw = raw.astype(VREG_DTYPES)
+
+    valid_df = report_validation(*validate_vreg(raw), source='registration snapshot')
+    clean_df = clean_vreg(valid_df.copy(), city_grps=get_model_city_grps(categories))
+
+    return prep_model_features(clean_df, categories)
+
+
+## Define function for the population stability index of a categorical feature
+def population_stability(expected, actual, eps=1e-4):
+    """Returns the population stability index (PSI) of a categorical feature
+        between an expected (training) and actual (new) sample: the sum over
+        categories of (actual share - expected share) * ln(actual share /
+        expected share). Below 0.1 is usually read as no shift and above 0.2
+        as a significant shift.
+    """
+
+    expected_share = expected.value_counts(normalize=True)
+    actual_share = actual.value_counts(normalize=True)
+
+    cats = expected_share.index.union(actual_share.index)
+    expected_share = expected_share.reindex(cats, fill_value=0).clip(lower=eps)
+    actual_share = actual_share.reindex(cats, fill_value=0).clip(lower=eps)
+
+    return float(((actual_share - expected_share) * np.log(actual_share / expected_share)).sum())
+
+
+## Define function for measuring how much the registrations changed between snapshots
+def get_drift_metrics(old_features, new_features, delta, categories):
+    """Compares the model features of two snapshots.
+
+    Returns:
+        dict: 'churn' (inserted, removed and changed ncids as a share of the
+            old snapshot), 'psi_{col}' for each feature, 'max_psi', and
+            'unknown_rate' (share of new registrations with a category the
+            model wasn't trained on).
+    """
+
+    drift = {'churn': len(delta) / max(len(old_features), 1)}
+
+    for col in categories:
+        drift['psi_' + col] = population_stability(old_features[col], new_features[col])
+    drift['max_psi'] = max(drift['psi_' + col] for col in categories)
+
+    drift['unknown_rate'] = float(1 - get_known_rows(new_features, categories).mean())
+
+    return drift
+
+
+## Define function for adding trees or boosting rounds to a fitted pipeline
+def warm_start_fit(model, X_new, y_new, n_new=50):
+    """Continues training the classifier of a fitted pipeline on new rows,
+        keeping its preprocessing (and so its encoded features) unchanged:
+        XGBoost and CatBoost models get n_new more boosting rounds starting
+        from the current model, and sklearn ensembles with warm_start and
+        n_estimators (random forests, gradient boosting) get n_new more trees
+        or stages fit on the new rows. The pipeline is updated in place.
+
+    Args:
+        model (Pipeline): Fitted pipeline.
+        X_new (DataFrame): Model features of the new rows, with categories
+            the pipeline's encoder knows.
+        y_new (series or array): Targets of the new rows.
+        n_new (int, optional): Trees or boosting rounds to add. Defaults to 50.
+
+    Returns:
+        Pipeline: The updated pipeline.
+    """
+
+    clf_name, clf = model.steps[-1]
+    Xt = model[:-1].transform(X_new)
+    package = type(clf).__module__.split('.')[0]
+
+    if package == 'xgboost':
+        booster = clf.get_booster()
+        clf.set_params(n_estimators=n_new).fit(Xt, y_new, xgb_model=booster)
+        clf.set_params(n_estimators=clf.get_booster().num_boosted_rounds())
+
+    elif package == 'catboost':
+        new_clf = clf.copy()
+        new_clf.set_params(iterations=n_new)
+        new_clf.fit(Xt, y_new, init_model=clf)
+        model.steps[-1] = (clf_name, new_clf)
+
+    # Other estimators with warm_start (e.g. HistGradientBoosting, logistic regression)
+      # don't add trees, so they can't be updated this way
+    elif {'warm_start', 'n_estimators'} <= set(clf.get_params()):
+        clf.set_params(warm_start=True, n_estimators=clf.n_estimators + n_new).fit(Xt, y_new)
+
+    else:
+        raise ValueError('{} does not support warm starts with more trees or boosting '
+                         'rounds'.format(type(clf).__name__))
+
+    return model
+
+
+## Define function for updating a registered model with a new registration snapshot
+def update_model(registry, name, snapshot_store, labels, X_holdout, y_holdout,
+                 feature_cols=MODEL_FEATURE_COLS, n_new=50, min_rows=1000,
+                 psi_threshold=0.2, churn_threshold=0.2, unknown_threshold=0.01,
+                 max_score_drop=0.02):
+    """Updates the pinned (or latest) version of a registered model with the
+        registrations inserted or changed since the snapshot it was trained
+        on, and registers the result as a new version.
+
+        Drift between the model's snapshot and the latest one is measured
+        first (see get_drift_metrics), along with how much the model's
+        balanced accuracy on the holdout set has dropped from its registered
+        value. If any exceeds its threshold, the model is refit from scratch
+        on every labeled registration of the latest snapshot. Otherwise it is
+        warm started (see warm_start_fit) on only the new and changed ncids.
+        Either way, the updated model is evaluated on the holdout set, and
+        if the version it was made from was pinned, the pin moves to it.
+
+    Args:
+        registry (ModelRegistry): Registry holding the model.
+        name (str): Name of the registered model. Its version must have a
+            snapshot_date.
+        snapshot_store (VregSnapshotStore): Archive of registration snapshots.
+        labels (series): Target values (e.g. vote_bin in the latest general
+            election) indexed by ncid, excluding the holdout set's ncids.
+        X_holdout (DataFrame): Model features of the held-out set.
+        y_holdout (series or array): Targets of the held-out set.
+        feature_cols (list of str, optional): Model features. Defaults to
+            MODEL_FEATURE_COLS.
+        n_new (int, optional): Trees or boosting rounds to add when warm
+            starting. Defaults to 50.
+        min_rows (int, optional): Minimum new labeled rows to warm start on;
+            with fewer the model is left as is. Defaults to 1,000.
+        psi_threshold (float, optional): Largest feature PSI before a full
+            refit. Defaults to 0.2.
+        churn_threshold (float, optional): Largest share of changed ncids
+            before a full refit. Defaults to 0.2.
+        unknown_threshold (float, optional): Largest share of registrations
+            with unknown categories before a full refit (which learns the new
+            categories). Defaults to 0.01.
+        max_score_drop (float, optional): Largest drop in holdout balanced
+            accuracy before a full refit. Defaults to 0.02.
+
+    Returns:
+        dict: 'action' ('none', 'skipped', 'warm_start' or 'full_refit'), the
+            old and new versions, the number of rows trained on, the drift
+            metrics and the holdout balanced accuracy before and after.
+    """
+
+    from sklearn.base import clone
+    from capstone_functions import eval_scores
+
+    meta = registry.load_meta(name)
+    if meta['snapshot_date'] is None:
+        raise ValueError('Version {} of {} has no snapshot_date to update from'.format(
+            meta['version'], name))
+
+    old_date = pd.Timestamp(meta['snapshot_date'])
+    new_date = snapshot_store.dates()[-1]
+    result = {'action': 'none', 'old_version': meta['version'], 'new_version': None}
+    if new_date <= old_date:
+        return result
+
+    # Warm starts modify the model, so read it into memory rather than mapping it
+    model = registry.load(name, meta['version'], mmap=False)
+    categories = get_model_categories(model, feature_cols)
+
+    old_features = get_snapshot_features(snapshot_store.as_of(old_date), categories)
+    new_features = get_snapshot_features(snapshot_store.latest(), categories)
+    delta = snapshot_store.diff(old_date, new_date)
+
+    drift = get_drift_metrics(old_features, new_features, delta, categories)
+    old_bacc = float(eval_scores(model, X_holdout, y_holdout)['balanced_accuracy'])
+    drift['score_drop'] = meta['metrics'].get('balanced_accuracy', old_bacc) - old_bacc
+    result.update({'drift': drift, 'old_balanced_accuracy': old_bacc})
+
+    refit = (drift['max_psi'] > psi_threshold or drift['churn'] > churn_threshold
+             or drift['unknown_rate'] > unknown_threshold or drift['score_drop'] > max_score_drop)
+
+    if refit:
+        train = new_features[new_features.index.isin(labels.index)]
+        X_train, y_train = train, labels.loc[train.index]
+        model = clone(model).fit(X_train, y_train)
+        action = 'full_refit'
+
+    else:
+        # Only new and changed registrations the encoder can handle
+        changed_ids = delta.loc[delta['change'].isin([INSERTED, CHANGED]), 'ncid']
+        train = new_features[new_features.index.isin(changed_ids)
+                             & new_features.index.isin(labels.index)]
+        train = train[get_known_rows(train, categories)]
+        X_train, y_train = train, labels.loc[train.index]
+
+        if len(train) < min_rows or y_train.nunique() < len(model.classes_):
+            result.update({'action': 'skipped', 'n_rows': len(train)})
+            return result
+
+        warm_start_fit(model, X_train, y_train, n_new)
+        action = 'warm_start'
+
+    scores = eval_scores(model, X_holdout, y_holdout)
+    notes = '{} of v{} on {:,} rows from the {} snapshot'.format(
+        action.replace('_', ' '), meta['version'], len(X_train), new_date.date())
+
+    new_version = registry.register(name, model, scores, X_train=X_train,
+                                    snapshot_date=new_date, lookup_cols=meta['lookup_cols'],
+                                    shap_table=meta.get('shap_table', False), notes=notes)
+
+    # The update replaces the version it was made from, including as the pinned version
+    if registry.pinned(name) == meta['version']:
+        registry.pin(name, new_version)
+
+    result.update({'action': action, 'new_version': new_version, 'n_rows': len(X_train),
+                   'new_balanced_accuracy': float(scores['balanced_accuracy'])})
+
+    return result
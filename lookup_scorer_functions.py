@@ -0,0 +1,181 @@
+import numpy as np
+import pandas as pd
+
+
+## Predictors of the binary turnout models (Union_AllGeneral_binary_target.ipynb),
+  # all of which are also columns of clean_vreg's output
+MODEL_FEATURE_COLS = ['gen_grp', 'party_grp', 'race_grp', 'gender_code',
+                      'birth_reg_other', 'drivers_lic', 'city_grp']
+
+
+## Define function for getting the categories a fitted pipeline was trained on
+def get_feature_categories(clf, feature_cols):
+    """Returns a list with the categories of each of feature_cols learned by
+        the encoder in the fitted pipeline's 'preprocessing' step (a
+        OneHotEncoder or OrdinalEncoder, as from build_preprocessing).
+    """
+
+    steps = clf.named_steps['preprocessing'].named_transformers_['cat'].named_steps
+    encoder = steps['ohe'] if 'ohe' in steps else steps['ord']
+
+    if len(encoder.categories_) != len(feature_cols):
+        raise ValueError('Encoder has {} columns, got {} feature_cols'.format(
+            len(encoder.categories_), len(feature_cols)))
+
+    return [list(cats) for cats in encoder.categories_]
+
+
+## Define function for building feature combinations from their flat table indices
+def get_category_combos(feature_cols, categories, flat_idx):
+    """Returns a DataFrame of feature_cols with the combination of categories
+        at each flat index of the Cartesian product of categories (in the
+        order of a LookupScorer table)."""
+
+    dims = tuple(len(cats) for cats in categories)
+    codes = np.unravel_index(flat_idx, dims)
+
+    return pd.DataFrame({
+        col: np.asarray(cats, dtype=object)[col_codes]
+        for col, cats, col_codes in zip(feature_cols, categories, codes)
+    })
+
+
+
+
+## Class for scoring voters by looking up precomputed predictions
+class LookupScorer:
+    """Table of a fitted classifier's predicted probabilities for every
+        combination of its (categorical) features. Since each of the turnout
+        models' features has only a handful of categories, the whole feature
+        space is small enough to score once, after which scoring any number of
+        voters is a single NumPy gather from the table rather than a model call.
+
+    Args:
+        feature_cols (list of str): Names of the feature columns, in order.
+        categories (list of lists): Categories of each feature column.
+        proba (ndarray): Probability table of shape (n categories of each
+            feature..., n classes), indexed by the features' category codes.
+        classes (array): Class labels of the last axis of proba.
+    """
+
+    def __init__(self, feature_cols, categories, proba, classes):
+        self.feature_cols = list(feature_cols)
+        self.categories = [list(cats) for cats in categories]
+        self.proba = proba
+        self.classes = np.asarray(classes)
+
+        # Flat view for gathering rows by a single index
+        self.flat_proba = proba.reshape(-1, proba.shape[-1])
+        self.dims = proba.shape[:-1]
+
+
+    @classmethod
+    def compile(cls, clf, feature_cols=MODEL_FEATURE_COLS, categories=None,
+                batch_rows=1000000):
+        """Scores a fitted classifier (or pipeline) once over the Cartesian
+            product of its features' categories.
+
+        Args:
+            clf (estimator): Fitted classifier with predict_proba and classes_
+                that takes a DataFrame of feature_cols.
+            feature_cols (list of str, optional): Feature columns, in the order
+                clf expects. Defaults to MODEL_FEATURE_COLS.
+            categories (list of lists, optional): Categories of each feature.
+                Defaults to those learned by clf's 'preprocessing' step.
+            batch_rows (int, optional): Maximum number of combinations
+                scored per predict_proba call. Defaults to 1,000,000.
+
+        Returns:
+            LookupScorer: Table of clf's predictions.
+        """
+
+        if categories is None:
+            categories = get_feature_categories(clf, feature_cols)
+
+        dims = tuple(len(cats) for cats in categories)
+        n_combos = int(np.prod(dims))
+        classes = np.asarray(clf.classes_)
+        flat_proba = np.empty((n_combos, len(classes)), dtype=np.float32)
+
+        for start in range(0, n_combos, batch_rows):
+            flat_idx = np.arange(start, min(start + batch_rows, n_combos))
+            combos = get_category_combos(feature_cols, categories, flat_idx)
+            flat_proba[flat_idx] = clf.predict_proba(combos)
+
+        return cls(feature_cols, categories, flat_proba.reshape(dims + (len(classes),)),
+                   classes)
+
+
+    def encode(self, df):
+        """Returns the flat table index of each row of df, or -1 for rows with
+            a category the model wasn't trained on (or a missing value).
+        """
+
+        codes = []
+        for col, cats in zip(self.feature_cols, self.categories):
+            codes.append(pd.Categorical(df[col], categories=cats).codes.astype(np.int64))
+
+        unknown = np.zeros(len(df), dtype=bool)
+        for col_codes in codes:
+            unknown |= col_codes < 0
+
+        flat_idx = np.ravel_multi_index([np.maximum(col_codes, 0) for col_codes in codes],
+                                        self.dims)
+        flat_idx[unknown] = -1
+
+        return flat_idx
+
+
+    def flat_index(self, values):
+        """Returns the flat table index of a single voter, given a dict of one
+            category per feature column (raising a ValueError if one of them
+            wasn't in the training data). Much faster than encode for one row,
+            e.g. for each interaction in the app."""
+
+        codes = [cats.index(values[col]) for col, cats in zip(self.feature_cols, self.categories)]
+
+        return int(np.ravel_multi_index(codes, self.dims))
+
+
+    def predict_proba(self, df):
+        """Looks up the predicted class probabilities for each row of df
+            (NaN for rows with unknown categories)."""
+
+        flat_idx = self.encode(df)
+        proba = self.flat_proba[np.maximum(flat_idx, 0)]
+        proba[flat_idx < 0] = np.nan
+
+        return proba
+
+
+    def predict(self, df):
+        """Looks up the predicted class of each row of df (None for rows with
+            unknown categories)."""
+        proba = self.predict_proba(df)
+        pred = self.classes[np.argmax(np.nan_to_num(proba, nan=-1), axis=1)].astype(object)
+        pred[np.isnan(proba[:, 0])] = None
+
+        return pred
+
+
+    def save(self, path):
+        """Saves the table to a .npz file (without pickling)."""
+        cat_arrays = {}
+        for i, cats in enumerate(self.categories):
+            # Keep numeric categories numeric; anything else is stored as strings
+            cats = np.asarray(cats)
+            cat_arrays['cats_{}'.format(i)] = cats.astype(str) if cats.dtype == object else cats
+
+        np.savez_compressed(path, proba=self.proba, classes=self.classes,
+                            feature_cols=np.asarray(self.feature_cols, dtype=str),
+                            **cat_arrays)
+
+
+    @classmethod
+    def load(cls, path):
+        """Loads a table saved with save."""
+        with np.load(path) as npz:
+            feature_cols = list(npz['feature_cols'])
+            categories = [list(npz['cats_{}'.format(i)]) for i in range(len(feature_cols))]
+
+            return cls(feature_cols, categories, npz['proba'], npz['classes'])
@@ -0,0 +1,381 @@
+import os
+import json
+import shutil
+import tempfile
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from turnout_rate_functions import get_dataset_version
+
+
+## File names of the parts of a registered model version
+PIPELINE_FILE = 'pipeline.joblib'
+META_FILE = 'meta.json'
+LOOKUP_FILE = 'lookup.npz'
+SHAP_FILE = 'shap.npz'
+
+## Native formats of boosted classifiers, by the package they come from
+NATIVE_MODEL_FILES = {'xgboost': 'model.ubj', 'catboost': 'model.cbm'}
+
+
+## Define function for finding the native save format of a pipeline's classifier
+def get_native_model_file(model):
+    """Returns the file name to save an XGBoost or CatBoost model to in its
+        own binary format, or None for other models (which are pickled)."""
+
+    package = type(model).__module__.split('.')[0]
+    if package in NATIVE_MODEL_FILES and hasattr(model, 'save_model'):
+        return NATIVE_MODEL_FILES[package]
+
+    return None
+
+
+## Define function for keeping the JSON-serializable scalar metrics of an evaluation
+def get_scalar_metrics(metrics):
+    """Returns the numeric scalar values of metrics (e.g. balanced_accuracy
+        and roc_auc from grid.test_scores_) as floats, dropping arrays,
+        reports and anything else that isn't a single number."""
+
+    scalars = {}
+    for name, value in (metrics or {}).items():
+        if isinstance(value, (int, float, np.integer, np.floating)) and not isinstance(value, bool):
+            scalars[name] = float(value)
+
+    return scalars
+
+
+
+
+## Class for saving, versioning and quickly loading fitted turnout models
+class ModelRegistry:
+    """Stores fitted pipelines (e.g. grid.best_estimator_ from fit_grid_clf)
+        as numbered versions under registry_dir/name/, each with the names of
+        the encoded features, evaluation metrics, the hash of the training
+        data and the snapshot it came from.
+
+        Pipelines are saved uncompressed with joblib so their NumPy arrays can
+        be memory-mapped on load instead of read into memory, and XGBoost or
+        CatBoost classifiers are saved in their native binary format. A
+        LookupScorer table of the model, and the SHAP values of every row of
+        it, can be stored alongside for scoring and the app without loading
+        the pipeline at all. One version of each
+        model can be pinned as the version loaded by default.
+
+    Args:
+        registry_dir (str, optional): Directory to store models in.
+            Defaults to 'App_Data/models'.
+    """
+
+    def __init__(self, registry_dir='App_Data/models'):
+        self.registry_dir = registry_dir
+        os.makedirs(registry_dir, exist_ok=True)
+
+
+    def _model_dir(self, name):
+        return os.path.join(self.registry_dir, name)
+
+
+    def _version_dir(self, name, version):
+        return os.path.join(self._model_dir(name), 'v{:04d}'.format(version))
+
+
+    def names(self):
+        """Returns the names of all registered models."""
+        return sorted(name for name in os.listdir(self.registry_dir)
+                      if os.path.isdir(self._model_dir(name)))
+
+
+    def versions(self, name):
+        """Returns the registered version numbers of a model, oldest first."""
+        model_dir = self._model_dir(name)
+        if not os.path.isdir(model_dir):
+            return []
+
+        return sorted(int(entry[1:]) for entry in os.listdir(model_dir)
+                      if entry.startswith('v') and entry[1:].isdigit())
+
+
+    def register(self, name, model, metrics=None, feature_names=None, X_train=None,
+                 data_hash=None, snapshot_date=None, lookup_cols=None, shap_table=False,
+                 notes=''):
+        """Saves a fitted pipeline as the next version of a model.
+
+        Args:
+            name (str): Name of the model, e.g. 'union_rf_bin'.
+            model (Pipeline): Fitted sklearn or imblearn Pipeline.
+            metrics (dict, optional): Evaluation metrics, e.g. grid.test_scores_
+                (only scalar values are kept). Defaults to None.
+            feature_names (list of str, optional): Names of the encoded
+                features the classifier was fit on. Defaults to the
+                pipeline's get_feature_names_out, if available.
+            X_train (DataFrame, optional): Training features, used to compute
+                data_hash if it isn't given.
+            data_hash (str, optional): Hash of the training data. Defaults to
+                get_dataset_version(X_train), if X_train is given.
+            snapshot_date (str or datetime, optional): Date of the registration
+                snapshot (see VregSnapshotStore) the training data came from.
+            lookup_cols (list of str, optional): Feature columns to compile a
+                LookupScorer table over (e.g. MODEL_FEATURE_COLS). Defaults
+                to None (no table).
+            shap_table (bool, optional): Whether to also store the SHAP values
+                of every combination of the lookup table (see
+                get_category_shap), for tree classifiers. Requires
+                lookup_cols. Defaults to False.
+            notes (str, optional): Free text description of the version.
+
+        Returns:
+            int: The new version number.
+        """
+
+        import joblib
+        from sklearn.base import clone
+
+        if feature_names is None:
+            try:
+                feature_names = list(model[:-1].get_feature_names_out())
+            except (AttributeError, TypeError, ValueError):
+                feature_names = None
+
+        if shap_table and lookup_cols is None:
+            raise ValueError('shap_table requires lookup_cols')
+
+        if data_hash is None and X_train is not None:
+            data_hash = get_dataset_version(X_train)
+
+        os.makedirs(self._model_dir(name), exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=self._model_dir(name), prefix='.tmp_')
+
+        try:
+            # Save boosted classifiers natively, pickling only an unfitted copy of them
+            clf_name, clf = model.steps[-1]
+            native_file = get_native_model_file(clf)
+            to_pickle = model
+            if native_file is not None:
+                clf.save_model(os.path.join(tmp_dir, native_file))
+                to_pickle = type(model)(steps=model.steps[:-1] + [(clf_name, clone(clf))])
+
+            joblib.dump(to_pickle, os.path.join(tmp_dir, PIPELINE_FILE))
+
+            if lookup_cols is not None:
+                from lookup_scorer_functions import LookupScorer
+                scorer = LookupScorer.compile(model, lookup_cols)
+                scorer.save(os.path.join(tmp_dir, LOOKUP_FILE))
+
+                if shap_table:
+                    from shap_cache_functions import get_category_shap, save_category_shap
+                    save_category_shap(os.path.join(tmp_dir, SHAP_FILE),
+                                       get_category_shap(model, scorer))
+
+            meta = {
+                'name': name,
+                'created': datetime.now(timezone.utc).isoformat(),
+                'model_class': type(clf).__name__,
+                'steps': [step_name for step_name, _ in model.steps],
+                'params': {param: repr(value) for param, value in clf.get_params().items()},
+                'classes': [c.item() if hasattr(c, 'item') else c for c in model.classes_],
+                'feature_names': feature_names,
+                'lookup_cols': lookup_cols,
+                'shap_table': shap_table,
+                'metrics': get_scalar_metrics(metrics),
+                'data_hash': data_hash,
+                'snapshot_date': None if snapshot_date is None else pd.Timestamp(snapshot_date).isoformat(),
+                'native_file': native_file,
+                'notes': notes
+            }
+
+            # Claim the next version number; a concurrent register gets the one after
+            version = (self.versions(name) or [0])[-1] + 1
+            while True:
+                meta['version'] = version
+                with open(os.path.join(tmp_dir, META_FILE), 'w') as f:
+                    json.dump(meta, f, indent=1)
+                try:
+                    os.rename(tmp_dir, self._version_dir(name, version))
+                    break
+                except OSError:
+                    version += 1
+
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        return version
+
+
+    def pinned(self, name):
+        """Returns the pinned version of a model, or None."""
+        pin_path = os.path.join(self._model_dir(name), 'pinned.json')
+        if not os.path.exists(pin_path):
+            return None
+
+        with open(pin_path) as f:
+            return json.load(f)['version']
+
+
+    def pin(self, name, version):
+        """Pins a version of a model as the one loaded by default."""
+        if version not in self.versions(name):
+            raise ValueError('{} has no version {}'.format(name, version))
+
+        pin_path = os.path.join(self._model_dir(name), 'pinned.json')
+        with open(pin_path + '.tmp', 'w') as f:
+            json.dump({'version': version}, f)
+        os.replace(pin_path + '.tmp', pin_path)
+
+
+    def unpin(self, name):
+        """Removes the pin of a model, so the latest version is loaded by default."""
+        pin_path = os.path.join(self._model_dir(name), 'pinned.json')
+        if os.path.exists(pin_path):
+            os.remove(pin_path)
+
+
+    def resolve(self, name, version=None):
+        """Returns version, or if it is None the pinned (or else latest) version."""
+        if version is None:
+            version = self.pinned(name)
+        if version is None:
+            versions = self.versions(name)
+            if not versions:
+                raise ValueError('No versions of {} are registered'.format(name))
+            version = versions[-1]
+
+        return version
+
+
+    def load_meta(self, name, version=None):
+        """Returns the metadata of a model version (by default the pinned or
+            latest version)."""
+        version = self.resolve(name, version)
+        with open(os.path.join(self._version_dir(name, version), META_FILE)) as f:
+            return json.load(f)
+
+
+    def load(self, name, version=None, mmap=True):
+        """Loads a registered pipeline.
+
+        Args:
+            name (str): Name of the model.
+            version (int, optional): Version to load. Defaults to the pinned
+                version, or the latest if none is pinned.
+            mmap (bool, optional): Whether to memory-map the pipeline's arrays
+                (read-only) rather than read them into memory. Defaults to True.
+
+        Returns:
+            Pipeline: The fitted pipeline.
+        """
+
+        import joblib
+
+        version = self.resolve(name, version)
+        version_dir = self._version_dir(name, version)
+        meta = self.load_meta(name, version)
+
+        model = joblib.load(os.path.join(version_dir, PIPELINE_FILE),
+                            mmap_mode='r' if mmap else None)
+
+        if meta['native_file'] is not None:
+            model.steps[-1][1].load_model(os.path.join(version_dir, meta['native_file']))
+
+        return model
+
+
+    def load_lookup(self, name, version=None):
+        """Loads the LookupScorer table stored with a model version (by
+            default the pinned or latest version)."""
+        from lookup_scorer_functions import LookupScorer
+
+        version = self.resolve(name, version)
+        lookup_path = os.path.join(self._version_dir(name, version), LOOKUP_FILE)
+        if not os.path.exists(lookup_path):
+            raise ValueError('Version {} of {} has no lookup table; register it with '
+                             'lookup_cols'.format(version, name))
+
+        return LookupScorer.load(lookup_path)
+
+
+    def compile_shap(self, name, version=None, shap_cache=None):
+        """Computes and stores the SHAP values of every combination of the
+            lookup table of a model version (by default the pinned or latest
+            version), e.g. for versions registered without shap_table."""
+        from shap_cache_functions import get_category_shap, save_category_shap
+
+        version = self.resolve(name, version)
+        version_dir = self._version_dir(name, version)
+
+        category_shap = get_category_shap(self.load(name, version), self.load_lookup(name, version),
+                                          shap_cache)
+
+        shap_path = os.path.join(version_dir, SHAP_FILE)
+        save_category_shap(shap_path + '.tmp.npz', category_shap)
+        os.replace(shap_path + '.tmp.npz', shap_path)
+
+        meta = self.load_meta(name, version)
+        meta['shap_table'] = True
+        with open(os.path.join(version_dir, META_FILE + '.tmp'), 'w') as f:
+            json.dump(meta, f, indent=1)
+        os.replace(os.path.join(version_dir, META_FILE + '.tmp'), os.path.join(version_dir, META_FILE))
+
+
+    def load_shap(self, name, version=None):
+        """Loads the CategoryShap values stored with a model version (by
+            default the pinned or latest version)."""
+        from shap_cache_functions import load_category_shap
+
+        version = self.resolve(name, version)
+        shap_path = os.path.join(self._version_dir(name, version), SHAP_FILE)
+        if not os.path.exists(shap_path):
+            raise ValueError('Version {} of {} has no SHAP table; register it with '
+                             'shap_table=True or run compile_shap'.format(version, name))
+
+        return load_category_shap(shap_path)
+
+
+    def list_versions(self, name=None):
+        """Returns a DataFrame with one row per registered version (of one
+            model, or of every model if name is None) giving when it was
+            created, its classifier, metrics, data hash and snapshot, and
+            whether it is pinned."""
+
+        rows = []
+        for model_name in ([name] if name is not None else self.names()):
+            pinned = self.pinned(model_name)
+            for version in self.versions(model_name):
+                meta = self.load_meta(model_name, version)
+                row = {'name': model_name, 'version': version,
+                       'pinned': version == pinned, 'created': pd.Timestamp(meta['created']),
+                       'model_class': meta['model_class'], 'data_hash': meta['data_hash'],
+                       'snapshot_date': meta['snapshot_date'], 'notes': meta['notes']}
+                row.update(meta['metrics'])
+                rows.append(row)
+
+        return pd.DataFrame(rows)
+
+
+    def compare(self, name, versions=None):
+        """Compares versions of a model (by default all of them) side by side:
+            one column per version, with rows for each metric, the data hash
+            and snapshot, and every classifier parameter that differs between
+            the versions.
+        """
+
+        versions = versions or self.versions(name)
+        metas = [self.load_meta(name, version) for version in versions]
+
+        table = {}
+        for meta in metas:
+            col = {'model_class': meta['model_class'], 'data_hash': meta['data_hash'],
+                   'snapshot_date': meta['snapshot_date']}
+            col.update(meta['metrics'])
+            col.update({'param: ' + param: value for param, value in meta['params'].items()})
+            table['v{}'.format(meta['version'])] = col
+
+        comparison = pd.DataFrame(table)
+
+        # Keep metrics, but only the parameters that differ
+        is_param = comparison.index.str.startswith('param: ')
+        differs = comparison.astype(str).nunique(axis=1, dropna=False) > 1
+
+        return comparison[~is_param | differs]
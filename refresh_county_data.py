@@ -0,0 +1,287 @@
+import os
+import json
+import time
+import random
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from county_data_functions import (CountyStore, NC_COUNTIES, ncsbe_data_url,
+                                   get_county_name)
+
+
+## NCSBE file kinds polled for each county (registration and voting history)
+FILE_KINDS = ['ncvoter', 'ncvhis']
+
+
+## Define function for cleaning a downloaded registration file into the county store
+def clean_county_file(archive_path, store_dir, county_id, dt_retrieved):
+    """Parses and cleans a downloaded ncvoter archive and writes it to the
+        county's partition of a CountyStore, along with the rows that failed
+        validation (see report_validation). Runs in a worker process.
+
+    Args:
+        archive_path (str): Path to the downloaded ncvoter zip file.
+        store_dir (str): Directory of the CountyStore partitions.
+        county_id (int): NCSBE county_id (1-100).
+        dt_retrieved (str): Formatted date and time the file was retrieved.
+
+    Returns:
+        int: Number of cleaned registration records.
+    """
+
+    from clean_vreg_functions import clean_vreg, get_vreg_read_kwargs
+    from stream_vreg_data import stream_vreg_table
+    from validate_vreg_functions import validate_vreg, report_validation
+
+    store = CountyStore(store_dir)
+
+    raw_df = stream_vreg_table(archive_path, **get_vreg_read_kwargs())
+    vreg_df = clean_vreg(report_validation(*validate_vreg(raw_df), source=archive_path,
+                                           quarantine_dir=store._partition_dir(county_id)))
+    store.write_partition(county_id, vreg_df, dt_retrieved)
+
+    return len(vreg_df)
+
+
+
+
+## Class for keeping every county's NCSBE files up to date
+class CountyRefresher:
+    """Polls the NCSBE registration (ncvoter{county_id}.zip) and voting history
+        (ncvhis{county_id}.zip) files for every county with a pooled aiohttp
+        client. Requests are conditional (If-None-Match/ If-Modified-Since), so
+        unchanged files are not re-downloaded, at most max_concurrency
+        downloads run at once, and failed requests are retried with jittered
+        exponential backoff. Downloaded registration files are cleaned on a
+        process pool and written to the CountyStore partitions read by the app.
+
+    Args:
+        data_dir (str, optional): Directory to download the raw zip files to.
+            Defaults to 'App_Data/raw'.
+        store_dir (str, optional): Directory of the CountyStore partitions.
+            Defaults to 'App_Data/counties'.
+        county_ids (list of int, optional): Counties to poll. Defaults to all 100.
+        kinds (list of str, optional): File kinds to poll. Defaults to FILE_KINDS.
+        base_url (str, optional): Base URL of the NCSBE data files.
+            Defaults to ncsbe_data_url.
+        max_concurrency (int, optional): Maximum simultaneous downloads. Defaults to 8.
+        max_retries (int, optional): Retries per file before giving up until
+            the next refresh. Defaults to 5.
+        backoff_base (float, optional): Base backoff in seconds. Defaults to 2.
+        backoff_max (float, optional): Maximum backoff in seconds. Defaults to 300.
+        clean_workers (int, optional): Number of cleaning processes.
+            Defaults to the number of CPUs.
+    """
+
+    def __init__(self, data_dir='App_Data/raw', store_dir='App_Data/counties',
+                 county_ids=None, kinds=FILE_KINDS, base_url=ncsbe_data_url,
+                 max_concurrency=8, max_retries=5, backoff_base=2.0,
+                 backoff_max=300.0, clean_workers=None):
+        self.data_dir = data_dir
+        self.store_dir = store_dir
+        self.county_ids = list(county_ids or range(1, len(NC_COUNTIES) + 1))
+        self.kinds = list(kinds)
+        self.base_url = base_url
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.clean_workers = clean_workers
+
+        os.makedirs(data_dir, exist_ok=True)
+        self.state_path = os.path.join(data_dir, 'refresh_state.json')
+
+        # Per-file validators and timestamps, kept across restarts
+        if os.path.exists(self.state_path):
+            with open(self.state_path) as f:
+                self.state = json.load(f)
+        else:
+            self.state = {}
+
+
+    def _file_name(self, county_id, kind):
+        return '{}{}.zip'.format(kind, county_id)
+
+
+    def _save_state(self):
+        tmp_path = self.state_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.state, f, indent=1)
+        os.replace(tmp_path, self.state_path)
+
+
+    def _record_failure(self, file_state, error):
+        file_state['n_failures'] = file_state.get('n_failures', 0) + 1
+        file_state['last_error'] = '{}: {}'.format(type(error).__name__, error)
+
+
+    def _backoff(self, attempt):
+        # "Full jitter": a random wait up to the capped exponential backoff
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+
+
+    async def _download(self, session, county_id, kind):
+        # Returns the path of the newly downloaded file and its validators, or
+          # None if unchanged. The validators are only saved once the file has
+          # been processed, so a file that fails to clean is downloaded again
+        file_name = self._file_name(county_id, kind)
+        file_state = self.state.setdefault(file_name, {})
+
+        headers = {}
+        if file_state.get('etag'):
+            headers['If-None-Match'] = file_state['etag']
+        if file_state.get('last_modified'):
+            headers['If-Modified-Since'] = file_state['last_modified']
+
+        async with session.get(self.base_url + file_name, headers=headers) as resp:
+            if resp.status == 304:
+                return None
+            resp.raise_for_status()
+
+            path = os.path.join(self.data_dir, file_name)
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                async for block in resp.content.iter_chunked(1024**2):
+                    f.write(block)
+            os.replace(tmp_path, path)
+
+            validators = {'etag': resp.headers.get('ETag'),
+                          'last_modified': resp.headers.get('Last-Modified')}
+
+        return path, validators
+
+
+    async def refresh_file(self, session, semaphore, pool, county_id, kind):
+        """Conditionally downloads one county file, retrying with jittered
+            backoff, and cleans it into the county store if it is a changed
+            registration file. The file's validators are only saved once it
+            has been cleaned, so a file that fails to clean is downloaded and
+            cleaned again on the next refresh. Failures are recorded in the
+            file's state (see status) rather than raised.
+
+        Returns:
+            bool: Whether the file changed (and, for registration files, was
+                cleaned).
+        """
+
+        file_state = self.state.setdefault(self._file_name(county_id, kind), {})
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with semaphore:
+                    downloaded = await self._download(session, county_id, kind)
+                break
+
+            except Exception as e:
+                self._record_failure(file_state, e)
+
+                if attempt == self.max_retries:
+                    self._save_state()
+                    return False
+
+                await asyncio.sleep(self._backoff(attempt))
+
+        now = datetime.now(timezone.utc)
+        file_state['ts_checked'] = now.timestamp()
+
+        if downloaded is not None:
+            path, validators = downloaded
+
+            if kind == 'ncvoter':
+                dt_retrieved = now.astimezone().strftime("%m/%d/%Y %H:%M:%S %Z")
+                loop = asyncio.get_running_loop()
+                try:
+                    file_state['n_rows'] = await loop.run_in_executor(
+                        pool, clean_county_file, path, self.store_dir, county_id, dt_retrieved
+                    )
+                except Exception as e:
+                    self._record_failure(file_state, e)
+                    self._save_state()
+                    return False
+
+            file_state.update(validators)
+            file_state['ts_retrieved'] = now.timestamp()
+
+        file_state['n_failures'] = 0
+        file_state['last_error'] = None
+        self._save_state()
+
+        return downloaded is not None
+
+
+    async def refresh_all(self):
+        """Refreshes every county's files concurrently. A file that fails
+            doesn't stop the others; its error is recorded in its state.
+
+        Returns:
+            int: Number of files that changed.
+        """
+
+        import aiohttp
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        connector = aiohttp.TCPConnector(limit=self.max_concurrency)
+        timeout = aiohttp.ClientTimeout(total=None, sock_read=60)
+
+        with ProcessPoolExecutor(max_workers=self.clean_workers) as pool:
+            async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+                files = [(county_id, kind) for county_id in self.county_ids
+                         for kind in self.kinds]
+                changed = await asyncio.gather(*[
+                    self.refresh_file(session, semaphore, pool, county_id, kind)
+                    for county_id, kind in files
+                ], return_exceptions=True)
+
+        # Record anything refresh_file didn't catch against its file
+        for (county_id, kind), result in zip(files, changed):
+            if isinstance(result, Exception):
+                self._record_failure(self.state.setdefault(self._file_name(county_id, kind), {}),
+                                     result)
+        self._save_state()
+
+        return sum(result is True for result in changed)
+
+
+    async def run_forever(self, interval_hours=24):
+        """Refreshes every county's files every interval_hours."""
+        while True:
+            start = time.monotonic()
+            await self.refresh_all()
+            await asyncio.sleep(max(0, interval_hours * 3600 - (time.monotonic() - start)))
+
+
+    def status(self):
+        """Returns a DataFrame with one row per county file giving when it was
+            last checked and retrieved, the age in hours of the retrieved data,
+            and any error from the latest attempt.
+        """
+
+        now = datetime.now(timezone.utc).timestamp()
+        rows = []
+
+        for county_id in self.county_ids:
+            for kind in self.kinds:
+                file_state = self.state.get(self._file_name(county_id, kind), {})
+                ts_retrieved = file_state.get('ts_retrieved')
+                ts_checked = file_state.get('ts_checked')
+
+                rows.append({
+                    'county_id': county_id,
+                    'county': get_county_name(county_id),
+                    'kind': kind,
+                    'last_checked': pd.to_datetime(ts_checked, unit='s', utc=True),
+                    'last_retrieved': pd.to_datetime(ts_retrieved, unit='s', utc=True),
+                    'age_hours': None if ts_retrieved is None else (now - ts_retrieved) / 3600,
+                    'n_failures': file_state.get('n_failures', 0),
+                    'last_error': file_state.get('last_error')
+                })
+
+        return pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+    refresher = CountyRefresher()
+    asyncio.run(refresher.run_forever())
@@ -0,0 +1,172 @@
+import numpy as np
+import pandas as pd
+
+
+## Categorical columns of the cleaned registration data to break counts down by
+REGISTR_GROUP_COLS = [
+    'voter_status_desc', 'gen_grp', 'party_grp', 'gender_code',
+    'race_grp', 'birth_reg_other', 'drivers_lic', 'city_grp'
+]
+
+## Resampling frequencies supported by RegistrTimeSeries.query
+REGISTR_FREQS = {
+    'D': 'Daily',
+    'W': 'Weekly',
+    'M': 'Monthly'
+}
+
+
+## Define function for getting the index of the first day of each period
+def get_period_starts(dates, freq='D'):
+    """Takes a sorted, contiguous array of daily numpy datetime64[D] values and
+        returns the positions where each new day, week (starting Monday) or
+        month begins, along with the start date of each of those periods.
+
+    Args:
+        dates (array): Sorted numpy array of datetime64[D] values.
+        freq (str, optional): One of 'D', 'W', or 'M'. Defaults to 'D'.
+
+    Returns:
+        tuple: Array of integer positions where each period starts and
+            array of datetime64[D] period start dates.
+    """
+
+    if freq == 'D':
+        period = dates
+
+    elif freq == 'W':
+        # 1970-01-01 (day 0) was a Thursday, so shift by 3 to make Monday 0
+        weekday = (dates.astype(np.int64) + 3) % 7
+        period = dates - weekday.astype('timedelta64[D]')
+
+    elif freq == 'M':
+        period = dates.astype('datetime64[M]').astype('datetime64[D]')
+
+    else:
+        raise ValueError(
+            "freq must be one of {}, got '{}'".format(list(REGISTR_FREQS), freq)
+        )
+
+    if len(period) == 0:
+        return np.array([], dtype=np.int64), period
+
+    new_period = np.empty(len(period), dtype=bool)
+    new_period[0] = True
+    new_period[1:] = period[1:] != period[:-1]
+    starts = np.flatnonzero(new_period)
+
+    return starts, period[starts]
+
+
+
+
+## Class for precomputed registration counts by date
+class RegistrTimeSeries:
+    """Precomputed daily registration counts for the whole registered voter
+        population and for each category of the provided group columns.
+
+        Counts are stored as (categories x days) int32 arrays along with their
+        running totals, so range queries and weekly/ monthly resampling only
+        touch the small aggregate arrays rather than the row-level data.
+
+    Args:
+        df (DataFrame): Cleaned voter registration DataFrame (output of clean_vreg).
+        group_cols (list of str, optional): Categorical columns to break counts
+            down by. Defaults to REGISTR_GROUP_COLS.
+        date_col (str, optional): Name of the registration date column.
+            Defaults to 'registr_dt'.
+    """
+
+    # Initialize by binning every registration into its day (and category)
+    def __init__(self, df, group_cols=REGISTR_GROUP_COLS, date_col='registr_dt'):
+        days = pd.to_datetime(df[date_col]).values.astype('datetime64[D]')
+        valid = ~np.isnat(days)
+        days = days[valid]
+
+        if len(days) == 0:
+            raise ValueError('No valid {} values to aggregate'.format(date_col))
+
+        self.start = days.min()
+        self.end = days.max()
+        day_idx = (days - self.start).astype(np.int64)
+        n_days = int(day_idx.max()) + 1
+
+        self.dates = np.arange(self.start, self.start + n_days)
+        self.n_missing = int((~valid).sum())
+
+        self.counts = {None: np.bincount(day_idx, minlength=n_days)
+                       .astype(np.int32).reshape(1, n_days)}
+        self.categories = {None: np.array(['All'], dtype=object)}
+
+        for col in group_cols:
+            codes, cats = pd.factorize(
+                df[col].fillna('Missing').values[valid], sort=True
+            )
+            counts = np.bincount(codes * n_days + day_idx,
+                                 minlength=len(cats) * n_days)
+
+            self.counts[col] = counts.astype(np.int32).reshape(len(cats), n_days)
+            self.categories[col] = np.asarray(cats, dtype=object)
+
+        # Running totals let cumulative queries skip re-summing the daily counts
+        self.cum_counts = {col: np.cumsum(counts, axis=1, dtype=np.int32)
+                           for col, counts in self.counts.items()}
+
+
+    def _day_range(self, start=None, end=None):
+        # Convert start/ end dates to positions in self.dates (inclusive of end)
+        lo = 0 if start is None else np.datetime64(pd.Timestamp(start).date(), 'D')
+        hi = len(self.dates) if end is None else np.datetime64(pd.Timestamp(end).date(), 'D')
+
+        if start is not None:
+            lo = int(np.clip((lo - self.start).astype(np.int64), 0, len(self.dates)))
+        if end is not None:
+            hi = int(np.clip((hi - self.start).astype(np.int64) + 1, 0, len(self.dates)))
+
+        return lo, max(lo, hi)
+
+
+    def query(self, group_col=None, start=None, end=None, freq='D',
+              cumulative=False):
+        """Returns registration counts between start and end (inclusive),
+            resampled to the specified frequency.
+
+        Args:
+            group_col (str, optional): Column to break counts down by. If None,
+                returns counts for all registered voters. Defaults to None.
+            start (str or datetime, optional): First date to include.
+                Defaults to the earliest registration date.
+            end (str or datetime, optional): Last date to include.
+                Defaults to the latest registration date.
+            freq (str, optional): 'D' (daily), 'W' (weekly) or 'M' (monthly).
+                Defaults to 'D'.
+            cumulative (bool, optional): Whether to return the total number of
+                registrations up to the end of each period (counted from the
+                earliest registration date, not from start) instead of the
+                number registered within each period. Defaults to False.
+
+        Returns:
+            DataFrame: Pandas DataFrame indexed by period start date with one
+                column per category of group_col (or a single 'All' column).
+        """
+
+        if group_col not in self.counts:
+            raise KeyError('No precomputed counts for {}'.format(group_col))
+
+        lo, hi = self._day_range(start, end)
+        starts, period_dates = get_period_starts(self.dates[lo:hi], freq)
+
+        if len(starts) == 0:
+            values = np.zeros((len(self.categories[group_col]), 0), dtype=np.int32)
+
+        elif cumulative:
+            # The last day of each period is the day before the next one starts
+            ends = np.append(starts[1:], hi - lo) - 1
+            values = self.cum_counts[group_col][:, lo:hi][:, ends]
+
+        else:
+            values = np.add.reduceat(self.counts[group_col][:, lo:hi], starts, axis=1)
+
+        return pd.DataFrame(values.T,
+                            index=pd.DatetimeIndex(period_dates, name='registr_dt'),
+                            columns=self.categories[group_col])
@@ -0,0 +1,219 @@
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from clean_vreg_functions import clean_vreg, get_vreg_read_kwargs
+from lookup_scorer_functions import MODEL_FEATURE_COLS, LookupScorer
+from stream_vreg_data import stream_vreg_table
+from validate_vreg_functions import validate_vreg
+
+
+## Model used by each worker process (loaded once per process)
+_model = None
+
+
+## Define function for loading a saved turnout model
+def load_model(model_path):
+    """Loads a LookupScorer table (.npz) or a fitted pipeline saved with
+        joblib (any other extension)."""
+
+    if model_path.endswith('.npz'):
+        return LookupScorer.load(model_path)
+
+    import joblib
+    return joblib.load(model_path)
+
+
+## Define function for getting the categories of each model feature
+def get_model_categories(model, feature_cols=MODEL_FEATURE_COLS):
+
+    if isinstance(model, LookupScorer):
+        return dict(zip(model.feature_cols, model.categories))
+
+    from lookup_scorer_functions import get_feature_categories
+    return dict(zip(feature_cols, get_feature_categories(model, feature_cols)))
+
+
+## Define function for preparing cleaned registration data as model features
+def prep_model_features(clean_df, categories):
+    """Selects the model's feature columns from clean_vreg output, recoding
+        drivers_lic to 'Y'/'N' if that is how the model was trained.
+    """
+
+    features = clean_df[list(categories)].copy()
+
+    if 'drivers_lic' in categories and 'License' not in categories['drivers_lic']:
+        features['drivers_lic'] = np.where(features['drivers_lic'] == 'License', 'Y', 'N')
+
+    return features
+
+
+## Define function for getting the raw city names the model has its own category for
+  # (any other city, including a missing one if the model has no 'Missing' city, is 'Other')
+def get_model_city_grps(categories):
+
+    model_cities = categories.get('city_grp', [])
+    cities = [city.upper() for city in model_cities if city not in ['Other', 'Missing']]
+
+    return cities + (['Missing'] if 'Missing' in model_cities else [])
+
+
+## Define function for flagging rows whose every feature has a category the model knows
+def get_known_rows(features, categories):
+
+    known = np.ones(len(features), dtype=bool)
+    for col, cats in categories.items():
+        known &= features[col].isin(cats).values
+
+    return known
+
+
+## Define function for loading the model in a worker process
+def init_worker(model_path):
+    global _model
+    _model = load_model(model_path)
+
+
+## Define function for validating, cleaning and scoring one chunk of raw registrations
+def score_chunk(raw_chunk):
+    """Validates, cleans and scores a chunk of raw voter registration data
+        with the worker's model. Voters with a category the model wasn't
+        trained on get a missing probability.
+
+    Returns:
+        tuple: (DataFrame of ncid and predicted probability of voting,
+            number of quarantined rows)
+    """
+
+    categories = get_model_categories(_model)
+
+    valid_df, quarantine_df, _ = validate_vreg(raw_chunk)
+    ncids = valid_df['ncid'].values
+
+    clean_df = clean_vreg(valid_df.copy(), city_grps=get_model_city_grps(categories))
+    features = prep_model_features(clean_df, categories)
+
+    known = get_known_rows(features, categories)
+
+    proba = np.full(len(features), np.nan, dtype=np.float32)
+    if known.any():
+        proba[known] = _model.predict_proba(features[known])[:, -1]
+
+    return pd.DataFrame({'ncid': ncids, 'p_vote': proba}), len(quarantine_df)
+
+
+## Define function for scoring a whole registration file in parallel chunks
+def score_vreg_file(url, model_path, out_path, chunksize=250000, workers=None):
+    """Streams a zipped ncvoter file in chunks, scores each chunk on a
+        process pool and writes each voter's ncid and predicted probability
+        of voting to a Parquet file as chunks finish. At most two chunks per
+        worker are in memory at once, so the statewide file can be scored
+        on a laptop.
+
+    Args:
+        url (str): URL or local path of a zipped ncvoter file.
+        model_path (str): Path of a LookupScorer table (.npz) or a joblib
+            pickled pipeline.
+        out_path (str): Path of the Parquet file to write.
+        chunksize (int, optional): Rows per chunk. Defaults to 250,000.
+        workers (int, optional): Number of worker processes. Defaults to
+            the number of CPUs.
+
+    Returns:
+        dict: Number of rows read, scored and quarantined, elapsed seconds,
+            rows scored per second and peak memory in MB (of this process
+            and its largest worker; NaN on Windows).
+    """
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    workers = workers or os.cpu_count()
+    start = time.perf_counter()
+    stats = {'n_read': 0, 'n_scored': 0, 'n_quarantined': 0}
+
+    # Chunked reads need the pandas reader, whatever the default engine is
+    chunks = stream_vreg_table(url, engine='pandas', chunksize=chunksize,
+                               **get_vreg_read_kwargs(['ncid']))
+    writer = None
+
+    def write(future):
+        nonlocal writer
+        scored, n_quarantined = future.result()
+        table = pa.Table.from_pandas(scored, preserve_index=False)
+        if writer is None:
+            writer = pq.ParquetWriter(out_path, table.schema)
+        writer.write_table(table)
+        stats['n_scored'] += len(scored)
+        stats['n_quarantined'] += n_quarantined
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                 initargs=(model_path,)) as pool:
+            pending = []
+            for chunk in chunks:
+                stats['n_read'] += len(chunk)
+                pending.append(pool.submit(score_chunk, chunk))
+
+                # Write finished chunks in order, keeping the pool busy but bounded
+                while len(pending) >= 2 * workers:
+                    write(pending.pop(0))
+
+            for future in pending:
+                write(future)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    elapsed = time.perf_counter() - start
+
+    stats.update({'seconds': elapsed, 'rows_per_s': stats['n_scored'] / elapsed})
+
+    try:
+        import resource
+    except ImportError:
+        # resource is Unix-only, so peak memory isn't reported on Windows
+        stats.update({'peak_mb_main': np.nan, 'peak_mb_worker': np.nan})
+    else:
+        # ru_maxrss is in KB on Linux and bytes on macOS
+        rss_unit = 1024**2 if sys.platform == 'darwin' else 1024
+        stats.update({
+            'peak_mb_main': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / rss_unit,
+            'peak_mb_worker': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / rss_unit
+        })
+
+    return stats
+
+
+## Define function for running batch scoring from the command line
+def main(argv=None):
+
+    from county_data_functions import get_county_vreg_url, UNION_COUNTY_ID
+
+    parser = argparse.ArgumentParser(
+        description='Score every voter in an NCSBE registration file with a turnout model.'
+    )
+    parser.add_argument('model', help='LookupScorer table (.npz) or joblib pickled pipeline')
+    parser.add_argument('out', help='Parquet file to write ncid and p_vote to')
+    parser.add_argument('--url', default=get_county_vreg_url(UNION_COUNTY_ID),
+                        help='URL or path of the zipped ncvoter file (default: Union County; '
+                             'use ncvoter_Statewide.zip for the whole state)')
+    parser.add_argument('--chunksize', type=int, default=250000, help='rows per chunk')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes')
+    args = parser.parse_args(argv)
+
+    stats = score_vreg_file(args.url, args.model, args.out,
+                            chunksize=args.chunksize, workers=args.workers)
+
+    print('Scored {n_scored:,} of {n_read:,} registrations ({n_quarantined:,} quarantined) '
+          'in {seconds:.1f}s: {rows_per_s:,.0f} rows/s'.format(**stats))
+    print('Peak memory: {peak_mb_main:.0f} MB (main), {peak_mb_worker:.0f} MB (largest worker)'.format(**stats))
+
+
+if __name__ == '__main__':
+    main()
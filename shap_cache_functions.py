@@ -0,0 +1,318 @@
+import os
+import pickle
+import hashlib
+import tempfile
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from turnout_rate_functions import get_dataset_version
+
+
+## SHAP values of a dataset with the explainer's expected value(s). Has the
+  # expected_value attribute shap_force and multi_shap_force read from an explainer
+ShapValues = namedtuple('ShapValues', ['expected_value', 'values'])
+
+## SHAP values of the positive class summed per original feature column, for every
+  # combination of a LookupScorer table, and whether they add up to a 'probability'
+  # or to 'log_odds' (as for XGBoost)
+CategoryShap = namedtuple('CategoryShap', ['expected_value', 'values', 'output'])
+
+
+## Define function for hashing a fitted model
+def get_model_hash(model):
+    """Returns a SHA-256 hex digest of a fitted model (e.g. an XGBoost
+        booster or sklearn estimator), which changes whenever it is refit
+        to different values."""
+
+    # XGBoost boosters have a stable raw format; anything else is pickled
+    if hasattr(model, 'save_raw'):
+        model_bytes = bytes(model.save_raw())
+    else:
+        model_bytes = pickle.dumps(model, protocol=4)
+
+    return hashlib.sha256(model_bytes).hexdigest()
+
+
+## Define function for hashing a feature DataFrame (values, row order and column names)
+def get_data_hash(X):
+
+    X = X if isinstance(X, pd.DataFrame) else pd.DataFrame(X)
+
+    sha = hashlib.sha256()
+    sha.update(repr(list(X.columns)).encode())
+    sha.update(get_dataset_version(X).encode())
+
+    return sha.hexdigest()
+
+
+## Define function for describing the settings of a SHAP explainer
+def get_explainer_config(explainer=None):
+    """Returns a string describing the settings of a shap.TreeExplainer that
+        change its values (its output units, how it handles dependent
+        features and a hash of its background data), to key cached values
+        on. No explainer means the default shap.TreeExplainer(model). Other
+        explainer types can't be described this way, so None is returned."""
+
+    if explainer is None:
+        return repr(('TreeExplainer', 'raw', 'tree_path_dependent', None))
+
+    import shap
+    if not isinstance(explainer, shap.TreeExplainer):
+        return None
+
+    data = getattr(explainer, 'data', None)
+    data_hash = None if data is None else get_data_hash(data)
+
+    return repr(('TreeExplainer', explainer.model_output, explainer.feature_perturbation,
+                 data_hash))
+
+
+## Define function for finding the unique rows of a feature matrix
+def get_unique_rows(X):
+    """Returns the unique rows of X (a DataFrame, if X is one) and the index
+        of each row of X in them, so values computed for the unique rows can
+        be broadcast back with unique_values[inverse]."""
+
+    values = X.values if isinstance(X, pd.DataFrame) else np.asarray(X)
+    _, first_idx, inverse = np.unique(values, axis=0, return_index=True,
+                                      return_inverse=True)
+
+    unique_X = X.iloc[first_idx] if isinstance(X, pd.DataFrame) else values[first_idx]
+
+    return unique_X, inverse.ravel()
+
+
+## Define function for mapping the encoded columns of a pipeline to its feature columns
+def get_encoded_col_features(clf, n_features):
+    """Returns the index of the original feature column each column output by
+        the fitted pipeline's 'preprocessing' step (as from build_preprocessing)
+        encodes, so SHAP values of the one-hot columns can be summed per
+        feature. Binary features dropped to one column by drop='if_binary'
+        have a single column."""
+
+    steps = clf.named_steps['preprocessing'].named_transformers_['cat'].named_steps
+    if 'ohe' not in steps:
+        return np.arange(n_features)
+
+    ohe = steps['ohe']
+    drop_idx = ohe.drop_idx_ if ohe.drop_idx_ is not None else [None] * len(ohe.categories_)
+    n_cols = [len(cats) - (drop is not None) for cats, drop in zip(ohe.categories_, drop_idx)]
+
+    return np.repeat(np.arange(len(n_cols)), n_cols)
+
+
+## Define function for explaining every combination of a LookupScorer table
+def get_category_shap(clf, scorer, shap_cache=None):
+    """Computes the SHAP values of the positive class for every combination
+        of categories in a LookupScorer table of a fitted pipeline, summing
+        the values of each feature's one-hot columns so there is one value
+        per original feature (e.g. how much being a Democrat moves the
+        prediction). Values are computed through a ShapCache, so explaining
+        the same model again is only a load.
+
+    Args:
+        clf (Pipeline): Fitted pipeline with a 'preprocessing' step and a
+            tree classifier as its last step.
+        scorer (LookupScorer): Table of clf's predictions.
+        shap_cache (ShapCache, optional): Cache to compute the values
+            through. Defaults to ShapCache().
+
+    Returns:
+        CategoryShap: The positive class's expected value, an array of shape
+            (n combinations, n features) indexed by the table's flat index,
+            and the output units the values add up to.
+    """
+
+    from lookup_scorer_functions import get_category_combos
+
+    shap_cache = shap_cache or ShapCache()
+
+    flat_idx = np.arange(len(scorer.flat_proba))
+    combos = get_category_combos(scorer.feature_cols, scorer.categories, flat_idx)
+
+    model = clf.steps[-1][1]
+    Xt = clf[:-1].transform(combos)
+    if hasattr(Xt, 'toarray'):
+        Xt = Xt.toarray()
+
+        # XGBoost treats the zeros a sparse matrix leaves out as missing values
+        if type(model).__module__.split('.')[0] == 'xgboost':
+            Xt[Xt == 0] = np.nan
+
+    shap_values = shap_cache.shap_values(model, pd.DataFrame(Xt))
+
+    # Keep the positive class of models explained per class
+    values = shap_values.values
+    if isinstance(values, list):
+        values = values[-1]
+    expected_value = float(np.ravel(shap_values.expected_value)[-1])
+
+    col_features = get_encoded_col_features(clf, len(scorer.feature_cols))
+    feature_values = np.zeros((len(values), len(scorer.feature_cols)), dtype=np.float32)
+    for feature in range(len(scorer.feature_cols)):
+        feature_values[:, feature] = values[:, col_features == feature].sum(axis=1)
+
+    # Tree models explained in margin space (e.g. XGBoost) add up to log odds
+    total = expected_value + feature_values.sum(axis=1)
+    is_proba = np.allclose(total, scorer.flat_proba[:, -1], atol=1e-3)
+
+    return CategoryShap(expected_value, feature_values, 'probability' if is_proba else 'log_odds')
+
+
+## Define function for saving the SHAP values of a LookupScorer table
+def save_category_shap(path, category_shap):
+    """Saves a CategoryShap to a .npz file (without pickling)."""
+    np.savez(path, expected_value=category_shap.expected_value,
+             values=category_shap.values, output=category_shap.output)
+
+
+## Define function for loading the SHAP values of a LookupScorer table
+def load_category_shap(path):
+    """Loads a CategoryShap saved with save_category_shap."""
+    with np.load(path) as npz:
+        return CategoryShap(npz['expected_value'].item(), npz['values'], str(npz['output']))
+
+
+
+
+## Class for computing SHAP values once per model and dataset
+class ShapCache:
+    """On-disk memoization of SHAP values, keyed by the hash of the model, of
+        the dataset explained and of the explainer's settings. Since the one-hot encoded voter features
+        take only a few thousand distinct combinations, SHAP values are only
+        computed for the unique rows of the dataset and broadcast back to
+        every row. Only the unique rows' values and each row's index in them
+        are stored, so loading the values for a force or summary plot after a
+        kernel restart takes well under a second.
+
+        Entries are stored as .npz files (without pickling).
+
+    Args:
+        cache_dir (str, optional): Directory to store SHAP values in.
+            Defaults to 'App_Data/shap_cache'.
+    """
+
+    def __init__(self, cache_dir='App_Data/shap_cache'):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+
+    def key(self, model_hash, data_hash, explainer_config=None):
+        """Returns the cache key for a model hash, dataset hash and explainer
+            configuration (from get_explainer_config; defaults to that of the
+            default explainer)."""
+        import shap
+
+        sha = hashlib.sha256()
+        sha.update(model_hash.encode())
+        sha.update(data_hash.encode())
+        sha.update((explainer_config or get_explainer_config()).encode())
+        sha.update(shap.__version__.encode())
+
+        return sha.hexdigest()
+
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + '.npz')
+
+
+    def get(self, key):
+        """Returns the cached ShapValues for key, or None on a miss."""
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+
+        with np.load(path) as npz:
+            unique_values = npz['unique_values']
+            inverse = npz['inverse']
+            expected_value = npz['expected_value']
+            per_class = bool(npz['per_class'])
+
+        # Multiclass values are stored as (n classes, n unique rows, n features)
+        if per_class:
+            values = [class_values[inverse] for class_values in unique_values]
+        else:
+            values = unique_values[inverse]
+
+        if expected_value.ndim == 0:
+            expected_value = expected_value.item()
+
+        return ShapValues(expected_value, values)
+
+
+    def put(self, key, unique_values, inverse, expected_value):
+        """Stores the SHAP values of the unique rows of a dataset (an array, or
+            a list of arrays with one per class) and each row's index in them
+            under key."""
+        per_class = isinstance(unique_values, list)
+        if per_class:
+            unique_values = np.stack(unique_values)
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.npz')
+        os.close(fd)
+
+        np.savez(tmp_path, unique_values=unique_values,
+                 inverse=inverse.astype(np.int32), expected_value=np.asarray(expected_value),
+                 per_class=per_class)
+
+        # Rename into place so other processes never read a partial entry
+        os.replace(tmp_path, self._path(key))
+
+
+    def shap_values(self, model, X, explainer=None):
+        """Returns the SHAP values of every row of X for a tree model, loading
+            them from the cache if this model has explained this dataset before.
+
+        Args:
+            model (model): Fitted tree model, e.g. the booster of an XGBoost
+                classifier or the classifier step of a Pipeline.
+            X (DataFrame): Preprocessed features, e.g. X_all_train_df.
+            explainer (shap explainer, optional): Explainer to compute missing
+                values with. Defaults to shap.TreeExplainer(model). Values of
+                a TreeExplainer are cached per setting (e.g. model_output and
+                background data); those of any other explainer are computed
+                every time, since its settings aren't part of the key.
+
+        Returns:
+            ShapValues: The explainer's expected_value and the SHAP values (an
+                array, or a list of arrays with one per class as expected by
+                multi_shap_summ and multi_shap_force for multiclass models).
+
+        Example:
+            all_shap = ShapCache().shap_values(all_model, X_all_train_df)
+
+            shap_force(xgb_all_bacc_grid.best_estimator_, 'xgb',
+                       X_all_train_df, y_all_train, 6, all_shap, all_shap.values)
+
+            shap.summary_plot(all_shap.values, X_all_train_df)
+        """
+
+        explainer_config = get_explainer_config(explainer)
+        if explainer_config is not None:
+            key = self.key(get_model_hash(model), get_data_hash(X), explainer_config)
+            cached = self.get(key)
+            if cached is not None:
+                return cached
+
+        if explainer is None:
+            import shap
+            explainer = shap.TreeExplainer(model)
+
+        unique_X, inverse = get_unique_rows(X)
+        unique_values = explainer.shap_values(unique_X)
+
+        # Newer versions of shap return multiclass values as one 3D array
+        if isinstance(unique_values, np.ndarray) and unique_values.ndim == 3:
+            unique_values = [unique_values[:, :, i] for i in range(unique_values.shape[2])]
+
+        if explainer_config is None:
+            if isinstance(unique_values, list):
+                return ShapValues(explainer.expected_value,
+                                  [class_values[inverse] for class_values in unique_values])
+            return ShapValues(explainer.expected_value, unique_values[inverse])
+
+        self.put(key, unique_values, inverse, explainer.expected_value)
+
+        return self.get(key)
@@ -0,0 +1,362 @@
+import io
+import os
+import queue
+import struct
+import threading
+import zlib
+from urllib.request import urlopen
+
+import pandas as pd
+
+
+## Size of each block read from the HTTP response body
+block_size = 1024**2
+
+## Number of downloaded blocks that can be buffered ahead of the parser
+queue_blocks = 16
+
+## Parser backend used by stream_vreg_table: 'pandas' (single-threaded C parser)
+  # or 'pyarrow' (multithreaded block parsing with dictionary-encoded strings)
+reader_engine = os.environ.get('VREG_READER', 'pandas')
+
+## Size of the blocks pyarrow parses in parallel
+arrow_block_size = 16 * 1024**2
+
+## Zip local file header (https://pkware.cachefly.net/webdocs/casestudies/APPNOTE.TXT)
+ZIP_LOCAL_HEADER = struct.Struct('<4sHHHHHIIIHH')
+ZIP_LOCAL_SIG = b'PK\x03\x04'
+ZIP_DESCRIPTOR_SIG = b'PK\x07\x08'
+
+
+## Define function for reading a URL or local file in blocks on a background thread
+def iter_download(url, block_size=block_size, queue_blocks=queue_blocks):
+    """Yields the bytes of url in blocks while a background thread keeps
+        downloading up to queue_blocks blocks ahead, so the download overlaps
+        with whatever consumes the blocks. Only queue_blocks * block_size bytes
+        are ever buffered.
+
+    Args:
+        url (str): HTTP(S) URL or local file path.
+        block_size (int, optional): Bytes per block. Defaults to 1 MB.
+        queue_blocks (int, optional): Maximum number of blocks buffered ahead
+            of the consumer. Defaults to 16.
+
+    Yields:
+        bytes: Consecutive blocks of the file.
+    """
+
+    blocks = queue.Queue(maxsize=queue_blocks)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        # Give up if the consumer stopped reading, rather than block forever
+        while not stop.is_set():
+            try:
+                blocks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def download():
+        try:
+            if os.path.exists(url):
+                body = open(url, 'rb')
+            else:
+                body = urlopen(url)
+
+            with body:
+                while True:
+                    block = body.read(block_size)
+                    if not block or not put(block):
+                        break
+
+            put(done)
+
+        except Exception as e:
+            put(e)
+
+    thread = threading.Thread(target=download, daemon=True)
+    thread.start()
+
+    try:
+        while True:
+            item = blocks.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    finally:
+        stop.set()
+
+
+## Define function for decompressing the first file in a zip archive as it streams in
+def iter_unzip(blocks):
+    """Takes an iterable of the raw bytes of a zip archive and yields the
+        decompressed bytes of the first file in the archive (NCSBE archives
+        contain a single text file) without needing the whole archive, or
+        its central directory at the end, to be available.
+
+    Args:
+        blocks (iterable of bytes): Consecutive blocks of the zip archive.
+
+    Yields:
+        bytes: Consecutive blocks of the decompressed file.
+
+    Raises:
+        ValueError: If the archive is not a zip file, uses an unsupported
+            compression method, or fails its CRC-32 check.
+    """
+
+    blocks = iter(blocks)
+    buf = b''
+
+    def fill(n):
+        # Read blocks until buf holds at least n bytes (or the stream ends)
+        nonlocal buf
+        while len(buf) < n:
+            block = next(blocks, None)
+            if block is None:
+                break
+            buf += block
+
+    fill(ZIP_LOCAL_HEADER.size)
+    if buf[:4] != ZIP_LOCAL_SIG:
+        raise ValueError('Not a zip archive (no local file header found)')
+
+    (_, _, flags, method, _, _, crc, comp_size,
+     _, name_len, extra_len) = ZIP_LOCAL_HEADER.unpack(buf[:ZIP_LOCAL_HEADER.size])
+
+    data_start = ZIP_LOCAL_HEADER.size + name_len + extra_len
+    fill(data_start)
+    buf = buf[data_start:]
+
+    # Bit 3 means the CRC and sizes follow the data in a data descriptor
+    has_descriptor = bool(flags & 0x08)
+    running_crc = 0
+
+    if method == 8:
+        decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+
+        while True:
+            if buf:
+                out = decompressor.decompress(buf)
+                buf = b''
+                if out:
+                    running_crc = zlib.crc32(out, running_crc)
+                    yield out
+                if decompressor.eof:
+                    buf = decompressor.unused_data
+                    break
+
+            block = next(blocks, None)
+            if block is None:
+                raise ValueError('Zip archive ended before the end of the compressed data')
+            buf = block
+
+    elif method == 0 and not has_descriptor:
+        remaining = comp_size
+        while remaining > 0:
+            fill(1)
+            if not buf:
+                raise ValueError('Zip archive ended before the end of the stored data')
+            out, buf = buf[:remaining], buf[remaining:]
+            remaining -= len(out)
+            running_crc = zlib.crc32(out, running_crc)
+            yield out
+
+    else:
+        raise ValueError('Unsupported zip compression method: {}'.format(method))
+
+    if has_descriptor:
+        fill(16)
+        if buf[:4] == ZIP_DESCRIPTOR_SIG:
+            buf = buf[4:]
+        crc = struct.unpack('<I', buf[:4])[0]
+
+    if running_crc != crc:
+        raise ValueError('CRC-32 mismatch in zip archive')
+
+
+## Class for presenting an iterable of bytes blocks as a readable binary file
+class IterStream(io.RawIOBase):
+
+    def __init__(self, blocks):
+        self.blocks = iter(blocks)
+        self.leftover = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self.leftover:
+            block = next(self.blocks, None)
+            if block is None:
+                return 0
+            self.leftover = block
+
+        n = min(len(b), len(self.leftover))
+        b[:n] = self.leftover[:n]
+        self.leftover = self.leftover[n:]
+
+        return n
+
+
+## Define function for parsing a decompressed NCSBE data file with pyarrow
+def read_arrow_table(raw, encoding='ISO-8859-1', usecols=None, dtype=None,
+                     block_size=arrow_block_size):
+    """Parses a binary stream of tab-delimited NCSBE data into a pandas
+        DataFrame using pyarrow's multithreaded CSV reader. Blocks of the
+        file are parsed in parallel and low-cardinality string columns are
+        dictionary-encoded, becoming pandas Categorical columns.
+
+    Args:
+        raw (file-like): Readable binary stream of the decompressed file.
+        encoding (str, optional): Text encoding of the data file.
+            Defaults to 'ISO-8859-1'.
+        usecols (list of str, optional): Columns to read. Defaults to all columns.
+        dtype (dict, optional): Column name to dtype ('category', str, or a
+            numpy dtype). Defaults to pyarrow's type inference.
+        block_size (int, optional): Bytes per block parsed in parallel.
+            Defaults to 16 MB.
+
+    Returns:
+        DataFrame: The parsed file.
+    """
+
+    import numpy as np
+    import pyarrow as pa
+    from pyarrow import csv as pa_csv
+
+    column_types = {}
+    for col, col_dtype in (dtype or {}).items():
+        if col_dtype == 'category':
+            column_types[col] = pa.dictionary(pa.int32(), pa.string())
+        elif col_dtype in (str, 'str', object, 'object'):
+            column_types[col] = pa.string()
+        else:
+            column_types[col] = pa.from_numpy_dtype(np.dtype(col_dtype))
+
+    table = pa_csv.read_csv(
+        raw,
+        read_options=pa_csv.ReadOptions(use_threads=True, block_size=block_size,
+                                        encoding=encoding),
+        parse_options=pa_csv.ParseOptions(delimiter='\t'),
+        convert_options=pa_csv.ConvertOptions(include_columns=usecols,
+                                              column_types=column_types,
+                                              strings_can_be_null=True,
+                                              auto_dict_encode=True)
+    )
+
+    return table.to_pandas()
+
+
+## Define function for streaming a zipped NCSBE data file into pandas
+def stream_vreg_table(url, encoding='ISO-8859-1', block_size=block_size,
+                      queue_blocks=queue_blocks, engine=None, **read_kwargs):
+    """Reads a zipped, tab-delimited NCSBE voter registration or history file
+        into pandas while it downloads. Blocks of the response body are
+        decompressed and decoded from ISO-8859-1 incrementally and fed
+        straight to the parser, so download and parsing overlap and the
+        archive itself never has to fit in memory.
+
+    Args:
+        url (str): URL (or local path) of the zip file, e.g.
+            "https://s3.amazonaws.com/dl.ncsbe.gov/data/ncvoter90.zip".
+        encoding (str, optional): Text encoding of the data file.
+            Defaults to 'ISO-8859-1'.
+        block_size (int, optional): Bytes per downloaded block. Defaults to 1 MB.
+        queue_blocks (int, optional): Maximum number of downloaded blocks
+            buffered ahead of the parser. Defaults to 16.
+        engine (str, optional): 'pandas' or 'pyarrow'. Defaults to the
+            VREG_READER environment variable, or 'pandas' if it is not set.
+        **read_kwargs: Additional keyword arguments for pd.read_table
+            (e.g. usecols, dtype, chunksize). The pyarrow engine only
+            accepts usecols and dtype, and raises a ValueError if given
+            chunksize.
+
+    Returns:
+        DataFrame: The parsed file (or a TextFileReader iterator of
+            DataFrames if chunksize is passed).
+    """
+
+    if engine is None:
+        engine = reader_engine
+
+    if engine not in ['pandas', 'pyarrow']:
+        raise ValueError("engine must be 'pandas' or 'pyarrow', got '{}'".format(engine))
+
+    # pyarrow parses the whole file at once, so chunked reads need pandas
+    if engine == 'pyarrow' and ('chunksize' in read_kwargs or 'iterator' in read_kwargs):
+        raise ValueError("chunksize and iterator are only supported by the pandas engine; "
+                         "pass engine='pandas' for chunked reads")
+
+    raw = io.BufferedReader(
+        IterStream(iter_unzip(iter_download(url, block_size, queue_blocks))),
+        buffer_size=block_size
+    )
+
+    if engine == 'pyarrow':
+        return read_arrow_table(raw, encoding=encoding, **read_kwargs)
+
+    text = io.TextIOWrapper(raw, encoding=encoding, newline='')
+
+    return pd.read_table(text, **read_kwargs)
+
+
+## Define function for comparing the pandas and pyarrow reader backends
+def benchmark_vreg_readers(url, engines=('pandas', 'pyarrow'), n_repeats=3,
+                           **read_kwargs):
+    """Times reading (and cleaning) an NCSBE voter registration file with each
+        reader backend and checks that the cleaned output is the same. Pointing
+        url at a local copy of ncvoter_Statewide.zip (~8M rows) keeps network
+        time out of the comparison.
+
+    Args:
+        url (str): URL or local path of a zipped ncvoter file.
+        engines (tuple of str, optional): Backends to compare.
+            Defaults to ('pandas', 'pyarrow').
+        n_repeats (int, optional): Number of timed reads per backend; the
+            fastest is reported. Defaults to 3.
+        **read_kwargs: Additional keyword arguments passed to stream_vreg_table.
+
+    Returns:
+        DataFrame: One row per backend with the number of rows, the fastest
+            read and clean times in seconds, and whether its cleaned output
+            matches that of the first backend.
+    """
+
+    import time
+    from clean_vreg_functions import clean_vreg
+
+    results = []
+    first_clean = None
+
+    for engine in engines:
+        read_times = []
+        clean_times = []
+
+        for _ in range(n_repeats):
+            start = time.perf_counter()
+            raw_df = stream_vreg_table(url, engine=engine, **read_kwargs)
+            read_times.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            clean_df = clean_vreg(raw_df)
+            clean_times.append(time.perf_counter() - start)
+
+        # Compare values only; the pyarrow backend keeps some columns categorical
+        clean_df = clean_df.astype(object)
+        if first_clean is None:
+            first_clean = clean_df
+
+        results.append({'engine': engine,
+                        'n_rows': len(raw_df),
+                        'read_s': min(read_times),
+                        'clean_s': min(clean_times),
+                        'matches': clean_df.equals(first_clean)})
+
+    return pd.DataFrame(results)
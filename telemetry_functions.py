@@ -0,0 +1,486 @@
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import sqlite3
+import threading
+import warnings
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+
+## Columns of the telemetry table. Rows with a missing iteration are per-fit
+  # metrics (e.g. wall_s, cpu_s, peak_mb, balanced_accuracy); the others are
+  # per-iteration (boosting round or search candidate) metrics
+TELEMETRY_COLS = ['run_id', 'model', 'source', 'recorded_at', 'fold', 'dataset',
+                  'iteration', 'metric', 'value', 'params']
+
+## Log files written by CatBoost to its train_dir (optionally prefixed by 'fold_{n}_')
+CATBOOST_LOG_RE = re.compile(r'^(?:fold_(\d+)_)?(learn_error|test_error|time_left)\.tsv$')
+
+
+## Define function for reading a CatBoost learn_error/ test_error/ time_left log
+def read_catboost_tsv(path):
+    """Reads a CatBoost .tsv log into a long DataFrame with columns
+        'iteration', 'metric', 'set_idx' and 'value'. Metrics repeated across
+        columns (one per test set, as in the logs of catboost.cv) are numbered
+        by set_idx in the order they appear. Rows that don't match the header
+        (as when several cross-validation folds wrote to the same log and
+        their lines ran together) are skipped with a warning.
+    """
+
+    with open(path) as f:
+        header = f.readline().rstrip('\n').split('\t')
+        rows = [line.rstrip('\n').split('\t') for line in f]
+
+    parsed = []
+    for row in rows:
+        if len(row) == len(header):
+            try:
+                parsed.append([float(value) for value in row])
+            except ValueError:
+                pass
+
+    if len(parsed) < len(rows):
+        warnings.warn('Skipped {} malformed rows of {}'.format(len(rows) - len(parsed), path))
+
+    values = np.array(parsed, dtype=float).reshape(-1, len(header))
+    iterations = values[:, 0].astype(int)
+
+    seen = {}
+    frames = []
+    for col_idx, metric in enumerate(header[1:], start=1):
+        set_idx = seen.get(metric, 0)
+        seen[metric] = set_idx + 1
+        frames.append(pd.DataFrame({'iteration': iterations, 'metric': metric,
+                                    'set_idx': set_idx, 'value': values[:, col_idx]}))
+
+    return pd.concat(frames, ignore_index=True)
+
+
+## Define function for parsing every log of a catboost_info directory
+def parse_catboost_info(info_dir='catboost_info'):
+    """Parses the learn_error.tsv, test_error.tsv and time_left.tsv logs (and
+        their 'fold_{n}_' versions written by cross-validation) of a CatBoost
+        train_dir into one long DataFrame.
+
+    Returns:
+        DataFrame: Columns 'fold' (None for the main training run), 'dataset'
+            ('learn', 'test', 'test_1', ... for additional test sets, or
+            'time'), 'iteration', 'metric' and 'value'. Times are converted from
+            milliseconds to seconds as the metrics 'passed_s' and 'remaining_s'.
+    """
+
+    frames = []
+    for file_name in sorted(os.listdir(info_dir)):
+        match = CATBOOST_LOG_RE.match(file_name)
+        if match is None:
+            continue
+
+        fold, kind = match.groups()
+        log = read_catboost_tsv(os.path.join(info_dir, file_name))
+
+        if kind == 'time_left':
+            log['dataset'] = 'time'
+            log['metric'] = log['metric'].map({'Passed': 'passed_s', 'Remaining': 'remaining_s'})
+            log['value'] = log['value'] / 1000
+        else:
+            dataset = kind.split('_')[0]
+            log['dataset'] = np.where(log['set_idx'] == 0, dataset,
+                                      dataset + '_' + log['set_idx'].astype(str))
+
+        log['fold'] = None if fold is None else int(fold)
+        frames.append(log.drop(columns='set_idx'))
+
+    if not frames:
+        return pd.DataFrame(columns=['fold', 'dataset', 'iteration', 'metric', 'value'])
+
+    return pd.concat(frames, ignore_index=True)[['fold', 'dataset', 'iteration', 'metric', 'value']]
+
+
+## Define function for getting the per-iteration metrics a fitted model kept
+def get_iteration_metrics(model):
+    """Returns a long DataFrame ('dataset', 'iteration', 'metric', 'value') of
+        the per-iteration metrics recorded by a fitted model (or the last step
+        of a pipeline): XGBoost and CatBoost eval results, or the training loss
+        of sklearn's gradient boosting. Empty for models that keep none.
+    """
+
+    if hasattr(model, 'steps'):
+        model = model.steps[-1][1]
+
+    results = {}
+    if hasattr(model, 'get_evals_result'):
+        results = model.get_evals_result()
+    elif hasattr(model, 'evals_result'):
+        try:
+            results = model.evals_result()
+        except Exception:
+            results = {}
+    elif hasattr(model, 'train_score_'):
+        results = {'learn': {'loss': model.train_score_}}
+
+    frames = [pd.DataFrame({'dataset': dataset, 'iteration': np.arange(len(values)),
+                            'metric': metric, 'value': np.asarray(values, dtype=float)})
+              for dataset, metrics in results.items()
+              for metric, values in metrics.items()]
+
+    if not frames:
+        return pd.DataFrame(columns=['dataset', 'iteration', 'metric', 'value'])
+
+    return pd.concat(frames, ignore_index=True)
+
+
+
+
+## Class for measuring the CPU time and peak memory of this process and its workers
+class ResourceSampler:
+    """Samples, every interval seconds in a background thread, the memory
+        (PSS where available, otherwise RSS) of this process and all of its
+        child processes (e.g. joblib workers) and their CPU times. Without
+        psutil, falls back to this process's (and its finished children's) CPU
+        time and its lifetime peak RSS (or only this process's CPU time, and
+        no peak memory, on Windows).
+
+    Args:
+        interval (float, optional): Seconds between samples. Defaults to 0.1.
+    """
+
+    def __init__(self, interval=0.1):
+        self.interval = interval
+        self.peak_mb = 0
+        self.peak_worker_mb = 0
+
+        try:
+            import psutil
+            self.psutil = psutil
+        except ImportError:
+            self.psutil = None
+
+
+    def _cpu_by_pid(self, procs):
+        cpu = {}
+        for proc in procs:
+            try:
+                times = proc.cpu_times()
+                cpu[proc.pid] = times.user + times.system
+            except (self.psutil.NoSuchProcess, self.psutil.AccessDenied):
+                pass
+        return cpu
+
+
+    def _mb(self, proc):
+        try:
+            info = proc.memory_full_info()
+            return getattr(info, 'pss', info.rss) / 1024**2
+        except (self.psutil.NoSuchProcess, self.psutil.AccessDenied):
+            return 0
+
+
+    def _sample(self):
+        main = self.psutil.Process()
+        procs = [main] + main.children(recursive=True)
+
+        # Workers outlive a fit (and may exit before the end), so keep each one's latest CPU time
+        self._cpu_last.update(self._cpu_by_pid(procs))
+
+        workers_mb = [self._mb(proc) for proc in procs[1:]]
+        self.peak_mb = max(self.peak_mb, self._mb(main) + sum(workers_mb))
+        self.peak_worker_mb = max([self.peak_worker_mb] + workers_mb)
+
+
+    def _run(self):
+        while not self._done.is_set():
+            self._sample()
+            time.sleep(self.interval)
+
+
+    def start(self):
+        self._wall_start = time.perf_counter()
+
+        if self.psutil is None:
+            self._cpu_start = time.process_time() + self._children_cpu()
+            return self
+
+        main = self.psutil.Process()
+        self._cpu_start = self._cpu_by_pid([main] + main.children(recursive=True))
+        self._cpu_last = dict(self._cpu_start)
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+        return self
+
+
+    def _rusage(self, who):
+        # resource is Unix-only, so it's imported only for the fallback without psutil
+        try:
+            import resource
+        except ImportError:
+            return None
+        return resource.getrusage(getattr(resource, 'RUSAGE_' + who))
+
+
+    def _children_cpu(self):
+        usage = self._rusage('CHILDREN')
+        return 0 if usage is None else usage.ru_utime + usage.ru_stime
+
+
+    def stop(self):
+        """Stops sampling and returns the wall time, CPU time (summed over the
+            process and its workers) and peak memory in MB."""
+        wall_s = time.perf_counter() - self._wall_start
+
+        if self.psutil is None:
+            cpu_s = time.process_time() + self._children_cpu() - self._cpu_start
+            # ru_maxrss is in KB on Linux and bytes on macOS
+            rss_unit = 1024**2 if sys.platform == 'darwin' else 1024
+            usage = self._rusage('SELF')
+            self.peak_mb = np.nan if usage is None else usage.ru_maxrss / rss_unit
+        else:
+            self._done.set()
+            self._thread.join()
+            self._sample()
+            cpu_s = sum(cpu - self._cpu_start.get(pid, 0) for pid, cpu in self._cpu_last.items())
+
+        return {'wall_s': wall_s, 'cpu_s': cpu_s, 'peak_mb': self.peak_mb,
+                'peak_worker_mb': self.peak_worker_mb}
+
+
+
+
+## Class for collecting training telemetry from every model fit in one table
+class TelemetryStore:
+    """SQLite table of training telemetry: per-fit wall time, CPU time, peak
+        memory and evaluation scores, and per-iteration metrics (boosting
+        rounds from CatBoost's catboost_info logs, XGBoost/ CatBoost eval
+        results or sklearn's gradient boosting, and the candidates of a
+        hyperparameter search), one row per value (see TELEMETRY_COLS).
+
+    Args:
+        db_path (str, optional): Path of the SQLite database.
+            Defaults to 'App_Data/telemetry.db'.
+    """
+
+    def __init__(self, db_path='App_Data/telemetry.db'):
+        self.db_path = db_path
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+
+        with sqlite3.connect(db_path) as con:
+            con.execute('CREATE TABLE IF NOT EXISTS telemetry ('
+                        'run_id TEXT, model TEXT, source TEXT, recorded_at TEXT, '
+                        'fold INTEGER, dataset TEXT, iteration INTEGER, metric TEXT, '
+                        'value REAL, params TEXT)')
+            con.execute('CREATE INDEX IF NOT EXISTS telemetry_run ON telemetry (run_id, metric)')
+
+
+    def record(self, run_id, model, source, rows, params=None):
+        """Appends metrics for a run.
+
+        Args:
+            run_id (str): ID of the fit or search.
+            model (str): Name of the model, e.g. 'rf_all'.
+            source (str): Where the metrics came from, e.g. 'sklearn',
+                'xgboost' or 'catboost'.
+            rows (DataFrame or dict): Long DataFrame with 'metric' and 'value'
+                (and optionally 'fold', 'dataset' and 'iteration') columns, or
+                a dict of per-fit metric values.
+            params (dict, optional): Model parameters, stored with the
+                per-fit rows.
+        """
+
+        if isinstance(rows, dict):
+            rows = pd.DataFrame({'metric': list(rows), 'value': list(rows.values())})
+
+        rows = rows.copy()
+        for col in ['fold', 'dataset', 'iteration']:
+            if col not in rows.columns:
+                rows[col] = None
+
+        rows['run_id'] = run_id
+        rows['model'] = model
+        rows['source'] = source
+        rows['recorded_at'] = datetime.now(timezone.utc).isoformat()
+        rows['value'] = rows['value'].astype(float)
+        rows['params'] = np.where(rows['iteration'].isna(),
+                                  json.dumps(params, default=repr) if params else None, None)
+
+        # Store missing values as NULL, and folds and iterations as plain ints
+        rows['fold'] = pd.to_numeric(rows['fold']).astype('Int64')
+        rows['iteration'] = pd.to_numeric(rows['iteration']).astype('Int64')
+        records = [tuple(None if pd.isna(v) else int(v) if isinstance(v, np.integer) else v
+                         for v in row)
+                   for row in rows[TELEMETRY_COLS].astype(object).itertuples(index=False, name=None)]
+
+        with sqlite3.connect(self.db_path) as con:
+            con.executemany('INSERT INTO telemetry VALUES ({})'.format(
+                ', '.join('?' * len(TELEMETRY_COLS))), records)
+
+
+    @contextmanager
+    def track_fit(self, model, source='sklearn', params=None, run_id=None, interval=0.1):
+        """Context manager measuring the wall time, CPU time and peak memory
+            of the code it wraps. Scores and a fitted estimator (whose
+            per-iteration metrics are recorded) can be added to the yielded
+            dict; everything is recorded on exit.
+
+        Example:
+            >>> with telemetry.track_fit('xgb_all', 'xgboost', params) as fit:
+                    xgb_all.fit(X_train, y_train)
+                    fit['estimator'] = xgb_all
+                    fit['metrics']['balanced_accuracy'] = eval_scores(
+                        xgb_all, X_test, y_test)['balanced_accuracy']
+        """
+
+        fit = {'run_id': run_id or uuid.uuid4().hex[:12], 'metrics': {}, 'estimator': None}
+        sampler = ResourceSampler(interval).start()
+
+        try:
+            yield fit
+        finally:
+            costs = sampler.stop()
+
+        self.record(fit['run_id'], model, source, dict(costs, **fit['metrics']), params)
+
+        if fit['estimator'] is not None:
+            iterations = get_iteration_metrics(fit['estimator'])
+            if len(iterations):
+                self.record(fit['run_id'], model, source, iterations)
+
+
+    def record_search(self, run_id, model, grid, source='sklearn'):
+        """Records the mean fit time and cross-validation score of each
+            candidate of a fitted search (iteration = candidate index), its
+            best score and the best estimator's per-iteration metrics."""
+
+        results = grid.cv_results_
+        n_candidates = len(results['params'])
+
+        # TPESearchCV doesn't time its candidates
+        candidates = pd.concat([
+            pd.DataFrame({'dataset': 'cv', 'iteration': np.arange(n_candidates),
+                          'metric': metric, 'value': np.asarray(results[key], dtype=float)})
+            for key, metric in [('mean_fit_time', 'mean_fit_s'), ('mean_test_score', 'mean_test_score')]
+            if key in results
+        ], ignore_index=True)
+        self.record(run_id, model, source, candidates)
+
+        self.record(run_id, model, source, {'n_candidates': n_candidates,
+                                            'best_cv_score': grid.best_score_},
+                    params=grid.best_params_)
+
+        iterations = get_iteration_metrics(grid.best_estimator_)
+        if len(iterations):
+            self.record(run_id, model, source, iterations)
+
+
+    def ingest_catboost_info(self, info_dir='catboost_info', model='catboost', run_id=None,
+                             score_metric='BalancedAccuracy:use_weights=false'):
+        """Parses a CatBoost train_dir's logs (see parse_catboost_info) into
+            the table. Each fold's (or the main run's) wall time is taken from
+            its last 'passed_s', and the last test value of score_metric (as
+            'balanced_accuracy', averaged over test sets) is recorded as a
+            per-fit score, so CatBoost runs can be compared with the others.
+
+        Returns:
+            str: The run ID.
+        """
+
+        run_id = run_id or uuid.uuid4().hex[:12]
+        logs = parse_catboost_info(info_dir)
+        self.record(run_id, model, 'catboost', logs)
+
+        for fold, fold_logs in logs.groupby(logs['fold'].fillna(-1)):
+            fit_metrics = {}
+
+            passed = fold_logs[fold_logs['metric'] == 'passed_s']
+            if len(passed):
+                fit_metrics['wall_s'] = passed['value'].iloc[-1]
+
+            test = fold_logs[fold_logs['dataset'].str.startswith('test')
+                             & (fold_logs['metric'] == score_metric)]
+            if len(test):
+                last = test[test['iteration'] == test['iteration'].max()]
+                fit_metrics['balanced_accuracy'] = last['value'].mean()
+
+            if fit_metrics:
+                rows = pd.DataFrame({'metric': list(fit_metrics), 'value': list(fit_metrics.values()),
+                                     'fold': None if fold < 0 else int(fold)})
+                self.record(run_id, model, 'catboost', rows)
+
+        return run_id
+
+
+    def query(self, sql='SELECT * FROM telemetry', params=()):
+        """Runs a SQL query against the telemetry table, returning a DataFrame."""
+        with sqlite3.connect(self.db_path) as con:
+            return pd.read_sql_query(sql, con, params=params)
+
+
+    def runs(self):
+        """Returns one row per run (and fold) with its per-fit metrics as columns."""
+        fits = self.query('SELECT run_id, model, source, recorded_at, fold, metric, value '
+                          'FROM telemetry WHERE iteration IS NULL')
+
+        # Runs without folds have a missing fold, which pivot_table would drop
+        fits['fold'] = fits['fold'].fillna(-1)
+        fits['recorded_at'] = fits.groupby('run_id')['recorded_at'].transform('min')
+        runs = fits.pivot_table(index=['run_id', 'model', 'source', 'recorded_at', 'fold'],
+                                columns='metric', values='value').reset_index()
+        runs['fold'] = runs['fold'].astype(int).astype(object).where(runs['fold'] >= 0, None)
+        runs.columns.name = None
+
+        return runs.sort_values('recorded_at', ignore_index=True)
+
+
+## Define function for plotting training cost against balanced accuracy
+def plot_cost_vs_score(runs, cost='wall_s', score='balanced_accuracy', title='',
+                       save=False, fig_name=None):
+    """Takes in the per-run table from TelemetryStore.runs() and plots each
+        run's training cost (e.g. 'wall_s', 'cpu_s' or 'peak_mb') against its
+        score, colored by source and labeled by model.
+
+    Args:
+        runs (DataFrame): Output of TelemetryStore.runs().
+        cost (str, optional): Cost metric for the x axis. Defaults to 'wall_s'.
+        score (str, optional): Score metric for the y axis.
+            Defaults to 'balanced_accuracy'.
+        title (str, optional): Plot title. Defaults to ''.
+        save (bool, optional): Whether to save the figure. Defaults to False.
+        fig_name (str, optional): What to name the file if the image is
+            being saved. Defaults to None.
+
+    Returns:
+        Figure: Matplotlib scatter plot figure.
+    """
+
+    import matplotlib.pyplot as plt
+
+    fig_filepath = 'Figures/'
+
+    runs = runs.dropna(subset=[cost, score])
+
+    fig, ax = plt.subplots(figsize=(8, 6))
+    for source, source_runs in runs.groupby('source'):
+        ax.scatter(source_runs[cost], source_runs[score], label=source, s=60)
+        for _, run in source_runs.iterrows():
+            ax.annotate(run['model'], (run[cost], run[score]), fontsize=9,
+                        xytext=(4, 4), textcoords='offset points')
+
+    ax.set_xlabel(cost, fontsize=12, fontweight='bold')
+    ax.set_ylabel(score, fontsize=12, fontweight='bold')
+    ax.set_title(title or 'Training Cost vs. {}'.format(score), fontsize=16, fontweight='bold')
+    ax.legend()
+
+    if save:
+        plt.savefig(fig_filepath + fig_name, bbox_inches='tight')
+
+    plt.show()
+
+    return fig
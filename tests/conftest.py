@@ -0,0 +1,101 @@
+import os
+import sys
+import hashlib
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+## Make the repo's top-level modules importable from the tests
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+## Handler serving a directory like S3 serves the NCSBE files: with an ETag,
+  # conditional requests and (optionally) single byte ranges
+class FileRequestHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+
+    def do_HEAD(self):
+        self.send_file(head=True)
+
+
+    def do_GET(self):
+        self.send_file(head=False)
+
+
+    def send_file(self, head):
+        server = self.server
+        name = self.path.lstrip('/')
+        server.requests.append((self.command, name, dict(self.headers)))
+
+        if name in server.fail:
+            self.send_error(500)
+            return
+
+        path = os.path.join(server.root, name)
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return
+
+        with open(path, 'rb') as f:
+            data = f.read()
+        etag = '"{}"'.format(hashlib.md5(data).hexdigest())
+
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        byte_range = self.headers.get('Range') if server.ranges else None
+        if byte_range is not None:
+            start, end = byte_range.split('=')[1].split('-')
+            start, end = int(start), min(int(end), len(data) - 1)
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes {}-{}/{}'.format(start, end, len(data)))
+            data = data[start:end + 1]
+        else:
+            self.send_response(200)
+
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('ETag', etag)
+        if server.ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+
+        if not head:
+            self.wfile.write(data)
+
+
+## Local HTTP server for the download and streaming tests
+@pytest.fixture
+def file_server(tmp_path):
+    """Serves the files in a temporary directory over HTTP.
+
+    The yielded server has: root (the served directory), url (base URL
+    ending in '/'), requests (list of (method, file name, headers) received),
+    fail (set of file names to answer with 500) and ranges (whether Range
+    requests are honoured, True by default).
+    """
+
+    root = tmp_path / 'served'
+    root.mkdir()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FileRequestHandler)
+    server.daemon_threads = True
+    server.root = str(root)
+    server.url = 'http://127.0.0.1:{}/'.format(server.server_address[1])
+    server.requests = []
+    server.fail = set()
+    server.ranges = True
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    yield server
+
+    server.shutdown()
+    server.server_close()
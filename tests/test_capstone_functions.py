@@ -0,0 +1,219 @@
+import os
+import warnings
+
+import numpy as np
+import pytest
+
+matplotlib = pytest.importorskip('matplotlib')
+matplotlib.use('Agg')
+
+from sklearn.dummy import DummyClassifier
+
+from capstone_functions import eval_classifier, eval_scores
+
+
+## 3-class test set where the classifier always predicts the majority class
+LABELS = ['Early', 'Election Day', 'No Vote']
+X_TEST = np.zeros((1234, 1))
+Y_TEST = np.array(['Early'] * 1000 + ['Election Day'] * 200 + ['No Vote'] * 34)
+
+
+@pytest.fixture
+def scores():
+    clf = DummyClassifier(strategy='most_frequent').fit(X_TEST, Y_TEST)
+    return eval_scores(clf, X_TEST, Y_TEST, LABELS)
+
+
+def cell_labels(fig):
+    return [text.get_text() for text in fig.axes[0].texts]
+
+
+@pytest.mark.parametrize('normalize, expected', [
+    (None, ['1000', '0', '0', '200', '0', '0', '34', '0', '0']),
+    ('true', ['1', '0', '0', '1', '0', '0', '1', '0', '0']),
+])
+def test_conf_matrix_values_format(scores, normalize, expected):
+    fig, axes = eval_classifier(None, X_TEST, Y_TEST, target_labels=LABELS,
+                                normalize=normalize, scores=scores)
+
+    # Counts are printed in full rather than rounded to '1e+03'
+    assert cell_labels(fig) == expected
+
+
+def test_cache_info_with_cv_splitter(tmp_path):
+    pytest.importorskip('optuna')
+    pytest.importorskip('tzlocal')
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.model_selection import StratifiedKFold
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import StandardScaler
+
+    from capstone_functions import fit_grid_clf
+
+    rng = np.random.RandomState(0)
+    X = rng.normal(size=(300, 3))
+    y = np.where(X[:, 0] > 0, 'Vote', 'No Vote')
+    clf = Pipeline([('scale', StandardScaler()), ('clf', LogisticRegression())])
+
+    grid = fit_grid_clf(clf, {'clf__C': [0.1, 1, 10]}, X[:200], y[:200], X[200:], y[200:],
+                        bin_target=True, cv=StratifiedKFold(3), search='bayes', n_iter=4,
+                        random_state=0, plot=False, cache_dir=str(tmp_path / 'cache'), n_jobs=1)
+
+    # 4 trials of 3 folds plus the refit, each fitting the scaler once; only the 3 folds and
+      # the refit add cache entries
+    assert grid.cache_info_ == {'n_fits': 13, 'n_misses': 4, 'n_hits': 9}
+
+
+def test_import_doesnt_load_sklearn():
+    import subprocess
+    import sys
+
+    code = 'import sys, capstone_functions; print("sklearn" in sys.modules)'
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    assert result.stdout.strip() == 'False'
+
+
+def test_dedup_classifier_pickles():
+    import pickle
+    from sklearn.tree import DecisionTreeClassifier
+
+    import capstone_functions
+    from capstone_functions import get_dedup_classifier
+
+    DedupClassifier = get_dedup_classifier()
+    assert capstone_functions.DedupClassifier is DedupClassifier
+
+    X = np.array([[0, 1], [0, 1], [1, 0], [1, 1]] * 5)
+    y = np.array(['Vote', 'Vote', 'No Vote', 'Vote'] * 5)
+    dedup_clf = DedupClassifier(DecisionTreeClassifier(random_state=0)).fit(X, y)
+
+    assert dedup_clf.n_unique_ == 3
+    loaded = pickle.loads(pickle.dumps(dedup_clf))
+    assert type(loaded) is DedupClassifier
+    np.testing.assert_array_equal(loaded.predict_proba(X), dedup_clf.predict_proba(X))
+
+
+## Imbalanced turnout data with repeated categorical rows
+def make_categorical_xy(n=3000, seed=0):
+    import pandas as pd
+
+    rng = np.random.RandomState(seed)
+    X = pd.DataFrame({'party_grp': rng.choice(['Dem', 'Rep', 'Other'], size=n),
+                      'gen_grp': rng.choice(['GenX', 'GenZ', 'Boomer', 'Millennial'], size=n),
+                      'drivers_lic': rng.choice(['License', 'No License'], size=n)})
+    p_vote = 0.15 + 0.2 * (X['party_grp'] != 'Other') + 0.1 * (X['gen_grp'] == 'Boomer')
+    y = np.where(rng.rand(n) < p_vote, 'Vote', 'No Vote')
+
+    return X, y
+
+
+@pytest.mark.parametrize('class_weight', [None, 'balanced', {'Vote': 3, 'No Vote': 1}])
+def test_dedup_classifier_matches_full_fit(class_weight):
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import OneHotEncoder
+    from sklearn.tree import DecisionTreeClassifier
+
+    from capstone_functions import get_dedup_classifier
+
+    X, y = make_categorical_xy()
+    clf = Pipeline([('ohe', OneHotEncoder()),
+                    ('dt', DecisionTreeClassifier(max_depth=4, class_weight=class_weight,
+                                                  random_state=0))])
+
+    full = clf.fit(X, y).predict_proba(X)
+    dedup_clf = get_dedup_classifier()(clf).fit(X, y)
+
+    assert dedup_clf.n_unique_ <= 48
+    np.testing.assert_allclose(dedup_clf.predict_proba(X), full, atol=1e-12)
+    # The wrapped estimator's class_weight is left as it was
+    assert dedup_clf.estimator.named_steps['dt'].class_weight == class_weight
+
+
+def test_dedup_classifier_warns_for_row_sampling():
+    from sklearn.ensemble import RandomForestClassifier
+
+    from capstone_functions import get_dedup_classifier
+
+    X, y = make_categorical_xy()
+    X = X.apply(lambda col: col.astype('category').cat.codes)
+    DedupClassifier = get_dedup_classifier()
+
+    with pytest.warns(UserWarning, match='RandomForestClassifier samples training rows'):
+        DedupClassifier(RandomForestClassifier(n_estimators=5)).fit(X, y)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        DedupClassifier(RandomForestClassifier(n_estimators=5, bootstrap=False)).fit(X, y)
+
+
+@pytest.mark.parametrize('scoring', ['balanced_accuracy', 'roc_auc', 'neg_log_loss'])
+def test_grouped_permutation_importance_matches_sklearn(scoring):
+    from sklearn.inspection import permutation_importance
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.metrics import get_scorer
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import OneHotEncoder
+
+    from capstone_functions import grouped_permutation_importance
+
+    X, y = make_categorical_xy(n=4000)
+    # A column unrelated to turnout
+    X['birth_state'] = np.random.RandomState(1).choice(['NC', 'NY', 'FL'], size=len(X))
+    clf = Pipeline([('ohe', OneHotEncoder()),
+                    ('lr', LogisticRegression(class_weight='balanced'))]).fit(X, y)
+
+    importance = grouped_permutation_importance(clf, X, y, scoring=scoring, n_repeats=30,
+                                                n_jobs=1, random_state=0)
+    expected = permutation_importance(clf, X, y, scoring=scoring, n_repeats=30, random_state=0)
+
+    assert importance['baseline_score'].iloc[0] == pytest.approx(get_scorer(scoring)(clf, X, y))
+    np.testing.assert_allclose(importance.loc[list(X.columns), 'importance_mean'],
+                               expected.importances_mean, atol=0.01)
+
+    assert importance.index[0] == 'party_grp'
+    assert abs(importance.loc['birth_state', 'importance_mean']) < 0.005
+
+
+def fit_memmap_grid(params, memmap_dir=None):
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import OneHotEncoder
+    from sklearn.tree import DecisionTreeClassifier
+
+    from capstone_functions import fit_grid_clf
+
+    X, y = make_categorical_xy()
+    clf = Pipeline([('preprocessing', OneHotEncoder(sparse_output=False)),
+                    ('dt', DecisionTreeClassifier(random_state=0))])
+
+    return fit_grid_clf(clf, params, X[:2000], y[:2000], X[2000:], y[2000:], bin_target=True,
+                        score='balanced_accuracy', cv=3, plot=False, memmap_dir=memmap_dir,
+                        n_jobs=1)
+
+
+def test_memmap_search_matches_pickled_search(tmp_path):
+    pytest.importorskip('tzlocal')
+    params = {'dt__max_depth': [1, 2, 4], 'dt__class_weight': [None, 'balanced']}
+
+    grid = fit_memmap_grid(params)
+    memmap_grid = fit_memmap_grid(params, memmap_dir=str(tmp_path))
+
+    assert memmap_grid.best_params_ == grid.best_params_
+    np.testing.assert_allclose(memmap_grid.cv_results_['mean_test_score'],
+                               grid.cv_results_['mean_test_score'])
+    assert memmap_grid.best_estimator_.steps[0][0] == 'preprocessing'
+    np.testing.assert_allclose(memmap_grid.test_scores_['y_proba'], grid.test_scores_['y_proba'])
+    assert os.listdir(tmp_path) == []
+
+
+def test_memmap_file_removed_when_search_fails(tmp_path):
+    pytest.importorskip('tzlocal')
+
+    # Every candidate fails to fit, so the search raises
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        with pytest.raises(ValueError):
+            fit_memmap_grid({'dt__max_depth': [-1]}, memmap_dir=str(tmp_path))
+
+    assert os.listdir(tmp_path) == []
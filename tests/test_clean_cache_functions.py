@@ -0,0 +1,93 @@
+import os
+import time
+import zipfile
+
+import pandas as pd
+import pytest
+
+from clean_cache_functions import CleanCache, hash_file
+from clean_vreg_functions import get_vreg_read_kwargs
+
+
+## Raw registrations in the NCSBE format
+RAW_VREG_TEXT = (
+    'ncid\tvoter_status_desc\treason_cd\tres_city_desc\trace_code\tparty_cd\t'
+    'gender_code\tbirth_age\tbirth_state\tdrivers_lic\tregistr_dt\tbirth_year\n'
+    + ''.join('AA{}\tACTIVE\tAV\t{}\tW\t{}\tF\t47\tNC\tY\t04/25/2019\t1973\n'.format(
+        i, ['MONROE', 'WAXHAW', ''][i % 3], ['REP', 'DEM', 'UNA'][i % 3])
+        for i in range(300))
+)
+
+
+@pytest.fixture
+def archive_path(tmp_path):
+    path = str(tmp_path / 'ncvoter90.zip')
+    with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('ncvoter90.txt', RAW_VREG_TEXT.encode('ISO-8859-1'))
+    return path
+
+
+def list_entries(cache):
+    return sorted(name for name in os.listdir(cache.cache_dir) if name.endswith(cache.ext))
+
+
+def test_key_depends_on_engine_and_read_kwargs(tmp_path):
+    cache = CleanCache(str(tmp_path / 'cache'))
+    read_kwargs = get_vreg_read_kwargs()
+
+    pandas_key = cache.key('abc', engine='pandas', read_kwargs=read_kwargs)
+
+    assert pandas_key != cache.key('abc', engine='pyarrow', read_kwargs=read_kwargs)
+    assert pandas_key != cache.key('abc', engine='pandas', read_kwargs=get_vreg_read_kwargs(['ncid']))
+
+    # The order of the dtype dict doesn't matter
+    reordered = dict(read_kwargs, dtype=dict(reversed(list(read_kwargs['dtype'].items()))))
+    assert pandas_key == cache.key('abc', engine='pandas', read_kwargs=reordered)
+
+
+def test_clean_archive_caches_each_engine_separately(tmp_path, archive_path):
+    pytest.importorskip('pyarrow')
+    cache = CleanCache(str(tmp_path / 'cache'))
+
+    pandas_df = cache.clean_archive(archive_path, engine='pandas')
+    assert len(list_entries(cache)) == 1
+
+    arrow_df = cache.clean_archive(archive_path, engine='pyarrow')
+    assert len(list_entries(cache)) == 2
+
+    # A hit returns the entry written by the same engine
+    assert cache.clean_archive(archive_path, engine='pandas').dtypes.equals(pandas_df.dtypes)
+    assert cache.clean_archive(archive_path, engine='pyarrow').dtypes.equals(arrow_df.dtypes)
+    assert len(list_entries(cache)) == 2
+
+    pd.testing.assert_frame_equal(pandas_df.astype(object), arrow_df.astype(object))
+
+
+def test_clean_archive_uses_default_engine(tmp_path, archive_path, monkeypatch):
+    import stream_vreg_data
+
+    cache = CleanCache(str(tmp_path / 'cache'))
+    monkeypatch.setattr(stream_vreg_data, 'reader_engine', 'pandas')
+    cache.clean_archive(archive_path)
+
+    assert list_entries(cache) == [cache.key(
+        hash_file(archive_path), engine='pandas', read_kwargs=get_vreg_read_kwargs()
+    ) + cache.ext]
+
+
+def test_evict_removes_orphaned_tmp_files(tmp_path):
+    cache = CleanCache(str(tmp_path / 'cache'), max_tmp_age_hours=1)
+
+    stale = [os.path.join(cache.cache_dir, name) for name in ['a.zip.tmp', 'b.tmp']]
+    fresh = os.path.join(cache.cache_dir, 'c.zip.tmp')
+    for path in stale + [fresh]:
+        open(path, 'wb').close()
+
+    two_hours_ago = time.time() - 2 * 3600
+    for path in stale:
+        os.utime(path, (two_hours_ago, two_hours_ago))
+
+    cache.evict()
+
+    assert not any(os.path.exists(path) for path in stale)
+    assert os.path.exists(fresh)
@@ -0,0 +1,68 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from clean_vreg_functions import VREG_COLS_USED, VREG_DTYPES, clean_vreg, get_vreg_read_kwargs
+from validate_vreg_functions import validate_vreg
+
+
+## Raw registrations with more columns than clean_vreg uses, and a voter with
+  # missing birth_age and birth_year
+RAW_VREG_TEXT = (
+    'ncid\tlast_name\tvoter_status_desc\treason_cd\tres_city_desc\trace_code\tparty_cd\t'
+    'gender_code\tbirth_age\tbirth_state\tdrivers_lic\tregistr_dt\tbirth_year\tprecinct_abbrv\n'
+    'AA1\tSMITH\tACTIVE\tAV\tMONROE\tW\tREP\tF\t47\tNC\tY\t04/25/2019\t1973\t01\n'
+    'AA2\tJONES\tTEMPORARY\tIU\t\tM\tUNA\tU\t21\t\tN\t10/09/2020\t1999\t02\n'
+    'AA3\tBROWN\tACTIVE\tAV\tWAXHAW\tB\tDEM\tM\t\tNY\tY\t01/02/2008\t\t03\n'
+)
+
+
+def test_clean_vreg_reads_only_projected_columns():
+    # A KeyError here names a column clean_vreg reads that loaders don't project
+    raw_df = pd.read_table(io.StringIO(RAW_VREG_TEXT), **get_vreg_read_kwargs())
+
+    assert list(raw_df.columns) == VREG_COLS_USED
+    clean_df = clean_vreg(raw_df[VREG_COLS_USED].copy())
+
+    assert len(clean_df) == 3
+
+
+def test_projected_read_allows_missing_birth_values():
+    raw_df = pd.read_table(io.StringIO(RAW_VREG_TEXT), **get_vreg_read_kwargs())
+
+    assert raw_df['birth_year'].isna().tolist() == [False, False, True]
+    assert raw_df['birth_age'].isna().tolist() == [False, False, True]
+
+    clean_df = clean_vreg(raw_df.copy())
+
+    assert clean_df['gen_grp'].tolist() == ['GenX', 'GenZ', 'Missing']
+    assert np.isnan(clean_df['birth_age'].iloc[2])
+
+
+def test_projected_read_keeps_extra_cols():
+    raw_df = pd.read_table(io.StringIO(RAW_VREG_TEXT), **get_vreg_read_kwargs(['ncid']))
+
+    assert set(raw_df.columns) == set(VREG_COLS_USED + ['ncid'])
+
+
+def test_missing_birth_values_pass_range_rules():
+    raw_df = pd.read_table(io.StringIO(RAW_VREG_TEXT), **get_vreg_read_kwargs())
+
+    valid_df, quarantine_df, summary = validate_vreg(raw_df, ref_date='2021-01-04')
+
+    assert len(valid_df) == 3
+    assert summary.set_index('rule').loc['total', 'n_rows'] == 0
+
+
+def test_arrow_read_allows_missing_birth_values():
+    pytest.importorskip('pyarrow')
+    from stream_vreg_data import read_arrow_table
+
+    raw_df = read_arrow_table(io.BytesIO(RAW_VREG_TEXT.encode('ISO-8859-1')),
+                              **get_vreg_read_kwargs())
+
+    assert raw_df['birth_year'].dtype == VREG_DTYPES['birth_year']
+    assert raw_df['birth_year'].isna().tolist() == [False, False, True]
+    assert clean_vreg(raw_df.copy())['gen_grp'].tolist() == ['GenX', 'GenZ', 'Missing']
@@ -0,0 +1,97 @@
+import io
+import threading
+
+import pandas as pd
+import pytest
+
+import county_data_functions
+from clean_vreg_functions import clean_vreg, get_vreg_read_kwargs
+from county_data_functions import CountyStore
+
+
+## Raw registrations in the NCSBE format
+RAW_VREG_TEXT = (
+    'ncid\tvoter_status_desc\treason_cd\tres_city_desc\trace_code\tparty_cd\t'
+    'gender_code\tbirth_age\tbirth_state\tdrivers_lic\tregistr_dt\tbirth_year\n'
+    + ''.join('AA{}\tACTIVE\tAV\t{}\tW\t{}\tF\t47\tNC\tY\t{:02d}/25/2019\t1973\n'.format(
+        i, ['MONROE', 'WAXHAW'][i % 2], ['REP', 'DEM', 'UNA'][i % 3], i % 12 + 1)
+        for i in range(300))
+)
+
+
+@pytest.fixture
+def vreg_df():
+    raw_df = pd.read_table(io.StringIO(RAW_VREG_TEXT), **get_vreg_read_kwargs())
+    return clean_vreg(raw_df)
+
+
+@pytest.fixture
+def store(tmp_path, vreg_df):
+    store = CountyStore(str(tmp_path / 'counties'))
+    for county_id in [1, 2, 3]:
+        store.write_partition(county_id, vreg_df, '01/04/2021 10:00:00 EST')
+    return store
+
+
+def test_read_partition(store, vreg_df):
+    part_df, dt_retrieved = store._read_partition(1)
+
+    assert dt_retrieved == '01/04/2021 10:00:00 EST'
+    pd.testing.assert_frame_equal(part_df, vreg_df, check_dtype=False, check_categorical=False)
+    assert store._read_partition(4) is None
+
+    store.max_age_days = -1
+    assert store._read_partition(1) is None
+
+
+def test_get_evicts_least_recently_used(store):
+    data = store.get(1)
+    assert data.name == 'Alamance' and len(data.vreg_df) == 300
+
+    # Room for two counties
+    store.mem_budget = 2.5 * data.nbytes
+
+    store.get(2)
+    store.get(1)
+    store.get(3)
+
+    assert list(store.resident) == [1, 3]
+    assert store.get(1) is data
+
+    # The most recently requested county is kept even over budget
+    store.mem_budget = 0
+    store.get(2)
+    assert list(store.resident) == [2]
+
+
+def test_resident_counties_dont_wait_for_a_download(store, vreg_df, monkeypatch):
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def slow_read(county_id, clean_cache=None, quarantine_dir=None):
+        calls.append(county_id)
+        started.set()
+        assert release.wait(10)
+        return vreg_df, '01/11/2021 10:00:00 EST'
+
+    monkeypatch.setattr(county_data_functions, 'read_county_vreg', slow_read)
+    store.get(1)
+
+    # Two sessions request county 4, which has to be downloaded
+    loaders = [threading.Thread(target=store.get, args=(4,)) for _ in range(2)]
+    for thread in loaders:
+        thread.start()
+    assert started.wait(10)
+
+    # A resident county is returned while the download is still running
+    reader = threading.Thread(target=store.get, args=(1,))
+    reader.start()
+    reader.join(5)
+    assert not reader.is_alive()
+
+    release.set()
+    for thread in loaders:
+        thread.join(10)
+
+    assert calls == [4]
+    assert store.get(4).dt_retrieved == '01/11/2021 10:00:00 EST'
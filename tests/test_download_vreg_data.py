@@ -0,0 +1,124 @@
+import os
+import json
+import hashlib
+
+import pytest
+
+import download_vreg_data
+from download_vreg_data import RangeDownloader, get_remote_info
+
+
+## File larger than a few read blocks, with no repeating pattern
+FILE_DATA = b''.join(hashlib.sha256(str(i).encode()).digest() for i in range(20000))
+
+
+@pytest.fixture(autouse=True)
+def small_blocks(monkeypatch):
+    # Read and save progress in small blocks so segments span many of them
+    monkeypatch.setattr(download_vreg_data, 'block_size', 4096)
+    monkeypatch.setattr(download_vreg_data, 'save_every', 4 * 4096)
+
+
+@pytest.fixture
+def served_file(file_server):
+    with open(os.path.join(file_server.root, 'ncvoter_Statewide.zip'), 'wb') as f:
+        f.write(FILE_DATA)
+    return file_server.url + 'ncvoter_Statewide.zip'
+
+
+def get_ranges(server):
+    return [headers.get('Range') for method, name, headers in server.requests if method == 'GET']
+
+
+def write_partial(url, dest_path, n_segments=4, n_done=2):
+    """Leaves an interrupted download: the first n_done segments written and saved as done."""
+    size, _, validator = get_remote_info(url)
+    bounds = [size * i // n_segments for i in range(n_segments + 1)]
+    segments = [{'start': bounds[i], 'end': bounds[i + 1],
+                 'done': bounds[i + 1] - bounds[i] if i < n_done else 0}
+                for i in range(n_segments)]
+
+    with open(dest_path + '.part', 'wb') as f:
+        f.write(FILE_DATA[:bounds[n_done]])
+        f.truncate(size)
+    with open(dest_path + '.part.json', 'w') as f:
+        json.dump({'url': url, 'size': size, 'validator': validator, 'segments': segments}, f)
+
+    return bounds
+
+
+def test_download_in_segments(file_server, served_file, tmp_path):
+    dest_path = str(tmp_path / 'ncvoter_Statewide.zip')
+
+    sha256 = RangeDownloader(n_segments=4).download(served_file, dest_path)
+
+    with open(dest_path, 'rb') as f:
+        assert f.read() == FILE_DATA
+    assert sha256 == hashlib.sha256(FILE_DATA).hexdigest()
+    assert len(get_ranges(file_server)) == 4
+    assert not os.path.exists(dest_path + '.part')
+    assert not os.path.exists(dest_path + '.part.json')
+
+
+def test_download_resumes_saved_segments(file_server, served_file, tmp_path):
+    dest_path = str(tmp_path / 'ncvoter_Statewide.zip')
+    bounds = write_partial(served_file, dest_path)
+
+    RangeDownloader(n_segments=4).download(served_file, dest_path)
+
+    with open(dest_path, 'rb') as f:
+        assert f.read() == FILE_DATA
+
+    # Only the segments that weren't done were requested
+    assert sorted(get_ranges(file_server)) == [
+        'bytes={}-{}'.format(bounds[i], bounds[i + 1] - 1) for i in [2, 3]
+    ]
+
+
+def test_download_restarts_if_part_file_is_missing(file_server, served_file, tmp_path):
+    dest_path = str(tmp_path / 'ncvoter_Statewide.zip')
+    write_partial(served_file, dest_path)
+    os.remove(dest_path + '.part')
+
+    RangeDownloader(n_segments=4).download(served_file, dest_path)
+
+    with open(dest_path, 'rb') as f:
+        assert f.read() == FILE_DATA
+    assert len(get_ranges(file_server)) == 4
+
+
+def test_download_restarts_if_remote_file_changed(file_server, served_file, tmp_path):
+    dest_path = str(tmp_path / 'ncvoter_Statewide.zip')
+    write_partial(served_file, dest_path)
+
+    new_data = FILE_DATA[::-1]
+    with open(os.path.join(file_server.root, 'ncvoter_Statewide.zip'), 'wb') as f:
+        f.write(new_data)
+
+    RangeDownloader(n_segments=4).download(served_file, dest_path)
+
+    with open(dest_path, 'rb') as f:
+        assert f.read() == new_data
+
+
+def test_download_without_range_support(file_server, served_file, tmp_path):
+    file_server.ranges = False
+    dest_path = str(tmp_path / 'ncvoter_Statewide.zip')
+
+    RangeDownloader(n_segments=4).download(served_file, dest_path)
+
+    with open(dest_path, 'rb') as f:
+        assert f.read() == FILE_DATA
+    assert get_ranges(file_server) == [None]
+
+
+def test_download_sha256_mismatch(file_server, served_file, tmp_path):
+    dest_path = str(tmp_path / 'ncvoter_Statewide.zip')
+
+    with pytest.raises(IOError, match='SHA-256'):
+        RangeDownloader(n_segments=4).download(served_file, dest_path,
+                                               expected_sha256='0' * 64)
+
+    assert not os.path.exists(dest_path)
+    assert not os.path.exists(dest_path + '.part')
+    assert not os.path.exists(dest_path + '.part.json')
@@ -0,0 +1,140 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from sklearn.ensemble import (GradientBoostingClassifier, HistGradientBoostingClassifier,
+                              RandomForestClassifier)
+from sklearn.pipeline import Pipeline
+
+from capstone_functions import build_preprocessing
+from incremental_model_functions import get_snapshot_features, update_model, warm_start_fit
+from lookup_scorer_functions import MODEL_FEATURE_COLS
+from model_registry_functions import ModelRegistry
+from score_vreg_data import get_model_categories
+from vreg_snapshot_functions import VregSnapshotStore
+
+
+## Define function for generating raw registrations (as strings, like a snapshot)
+def make_registrations(ncids, rng):
+    n = len(ncids)
+    birth_year = rng.randint(1940, 2000, size=n)
+
+    return pd.DataFrame({
+        'ncid': ncids,
+        'voter_status_desc': 'ACTIVE',
+        'reason_cd': 'AV',
+        'res_city_desc': rng.choice(['MONROE', 'WAXHAW', 'INDIAN TRAIL'], size=n),
+        'race_code': rng.choice(['W', 'B', 'U'], size=n),
+        'party_cd': rng.choice(['REP', 'DEM', 'UNA'], size=n),
+        'gender_code': rng.choice(['F', 'M', 'U'], size=n),
+        'birth_age': (2020 - birth_year).astype(str),
+        'birth_state': rng.choice(['NC', 'NY'], size=n),
+        'drivers_lic': rng.choice(['Y', 'N'], size=n),
+        'registr_dt': '01/02/2018',
+        'birth_year': birth_year.astype(str)
+    })
+
+
+## Define function for the (noisy) turnout of each registration
+def get_labels(snap, rng):
+    p_vote = np.where(snap['party_cd'] == 'UNA', 0.3, 0.7)
+    return pd.Series((rng.rand(len(snap)) < p_vote).astype(int), index=snap['ncid'].values)
+
+
+@pytest.fixture
+def scenario(tmp_path):
+    """A model registered on a 10k-row snapshot, and a later snapshot with
+        1,500 party changes and 1,000 new registrations."""
+
+    rng = np.random.RandomState(0)
+    old_snap = make_registrations(['AA{}'.format(i) for i in range(10000)], rng)
+
+    new_snap = old_snap.copy()
+    changed = rng.choice(len(new_snap), size=1500, replace=False)
+    new_snap.loc[changed, 'party_cd'] = np.where(new_snap.loc[changed, 'party_cd'] == 'UNA',
+                                                 'REP', 'UNA')
+    new_snap = pd.concat([new_snap, make_registrations(['BB{}'.format(i) for i in range(1000)],
+                                                       rng)], ignore_index=True)
+
+    snapshot_store = VregSnapshotStore(str(tmp_path / 'snapshots'))
+    snapshot_store.add_snapshot(old_snap, date='2020-01-01')
+    snapshot_store.add_snapshot(new_snap, date='2020-06-01')
+
+    labels = get_labels(new_snap, rng)
+    holdout_ids = labels.index[:1000]
+
+    # Features as clean_vreg names them, with the three cities kept apart
+    clean_categories = {col: [] for col in MODEL_FEATURE_COLS}
+    clean_categories.update({'city_grp': ['Monroe', 'Waxhaw', 'Indian Trail'],
+                             'drivers_lic': ['License', 'No License']})
+    old_features = get_snapshot_features(snapshot_store.as_of('2020-01-01'), clean_categories)
+
+    model = Pipeline([('preprocessing', build_preprocessing(MODEL_FEATURE_COLS)),
+                      ('rf', RandomForestClassifier(n_estimators=10, max_depth=4,
+                                                    random_state=0))])
+    model.fit(old_features, labels.reindex(old_features.index).values)
+
+    new_features = get_snapshot_features(snapshot_store.latest(), get_model_categories(model))
+    X_holdout = new_features.loc[holdout_ids]
+    y_holdout = labels.loc[holdout_ids]
+
+    registry = ModelRegistry(str(tmp_path / 'models'))
+    registry.register('union_rf_bin', model, {'balanced_accuracy': 0.0},
+                      X_train=old_features, snapshot_date='2020-01-01')
+    registry.pin('union_rf_bin', 1)
+
+    return registry, snapshot_store, labels.drop(holdout_ids), X_holdout, y_holdout
+
+
+def test_update_model_warm_starts_on_changed_rows(scenario):
+    registry, snapshot_store, labels, X_holdout, y_holdout = scenario
+
+    result = update_model(registry, 'union_rf_bin', snapshot_store, labels, X_holdout, y_holdout,
+                          n_new=5, churn_threshold=0.5)
+
+    assert result['action'] == 'warm_start'
+    assert result['drift']['churn'] == pytest.approx(0.25)
+    # Only the changed and new registrations outside the holdout set
+    assert 2000 < result['n_rows'] < 2500
+
+    model = registry.load('union_rf_bin', result['new_version'], mmap=False)
+    assert len(model.named_steps['rf'].estimators_) == 15
+    assert registry.pinned('union_rf_bin') == result['new_version'] == 2
+    assert result['new_balanced_accuracy'] > 0.6
+
+
+def test_update_model_refits_past_a_drift_threshold(scenario):
+    registry, snapshot_store, labels, X_holdout, y_holdout = scenario
+
+    result = update_model(registry, 'union_rf_bin', snapshot_store, labels, X_holdout, y_holdout,
+                          n_new=5, churn_threshold=0.5, psi_threshold=0)
+
+    assert result['action'] == 'full_refit'
+    # Every labeled registration of the latest snapshot
+    assert result['n_rows'] == len(labels) == 10000
+
+    model = registry.load('union_rf_bin', result['new_version'], mmap=False)
+    assert len(model.named_steps['rf'].estimators_) == 10
+    assert registry.pinned('union_rf_bin') == 2
+    assert result['new_balanced_accuracy'] > 0.6
+
+
+def test_warm_start_fit_adds_gradient_boosting_stages():
+    X = pd.DataFrame(np.random.RandomState(0).randint(0, 2, size=(200, 2)), columns=['a', 'b'])
+    y = X['a'].values
+    model = Pipeline([('scale', 'passthrough'),
+                      ('gb', GradientBoostingClassifier(n_estimators=5))]).fit(X, y)
+
+    warm_start_fit(model, X, y, n_new=3)
+
+    assert model.named_steps['gb'].n_estimators_ == 8
+
+
+def test_warm_start_fit_rejects_estimators_without_n_estimators():
+    X = pd.DataFrame(np.random.RandomState(0).randint(0, 2, size=(200, 2)), columns=['a', 'b'])
+    y = X['a'].values
+    model = Pipeline([('scale', 'passthrough'),
+                      ('hgb', HistGradientBoostingClassifier(max_iter=5))]).fit(X, y)
+
+    with pytest.raises(ValueError, match='HistGradientBoostingClassifier does not support'):
+        warm_start_fit(model, X, y)
@@ -0,0 +1,146 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.pipeline import Pipeline
+
+from capstone_functions import build_preprocessing
+from model_registry_functions import NATIVE_MODEL_FILES, PIPELINE_FILE, ModelRegistry
+
+
+FEATURE_COLS = ['party_grp', 'gen_grp', 'drivers_lic']
+
+
+## Define function for generating model features and (noisy) turnout
+def make_xy(n=1000, seed=0):
+    rng = np.random.RandomState(seed)
+    X = pd.DataFrame({'party_grp': rng.choice(['Democrat', 'Republican', 'Other'], size=n),
+                      'gen_grp': rng.choice(['GenX', 'Millennial', 'Boomer'], size=n),
+                      'drivers_lic': rng.choice(['License', 'No License'], size=n)})
+    p_vote = np.where(X['party_grp'] == 'Other', 0.3, 0.7)
+    y = (rng.rand(n) < p_vote).astype(int)
+
+    return X, y
+
+
+def fit_rf(X, y, **params):
+    model = Pipeline([('preprocessing', build_preprocessing(FEATURE_COLS)),
+                      ('rf', RandomForestClassifier(n_estimators=10, random_state=0, **params))])
+    return model.fit(X, y)
+
+
+@pytest.fixture
+def registry(tmp_path):
+    return ModelRegistry(str(tmp_path / 'models'))
+
+
+def test_register_load_round_trip(registry):
+    X, y = make_xy()
+    model = fit_rf(X, y, max_depth=4)
+
+    version = registry.register('union_rf_bin', model, {'balanced_accuracy': 0.6, 'report': {}},
+                                X_train=X, snapshot_date='2020-01-01')
+    assert version == 1
+
+    for mmap in [True, False]:
+        loaded = registry.load('union_rf_bin', mmap=mmap)
+        np.testing.assert_array_equal(loaded.predict_proba(X), model.predict_proba(X))
+
+    meta = registry.load_meta('union_rf_bin')
+    assert meta['metrics'] == {'balanced_accuracy': 0.6}
+    assert meta['classes'] == [0, 1]
+    assert meta['snapshot_date'] == '2020-01-01T00:00:00'
+    assert meta['data_hash'] is not None
+    assert meta['native_file'] is None
+
+
+def test_xgboost_saved_natively(registry):
+    xgb = pytest.importorskip('xgboost')
+    X, y = make_xy()
+    model = Pipeline([('preprocessing', build_preprocessing(FEATURE_COLS)),
+                      ('xgb', xgb.XGBClassifier(n_estimators=10, max_depth=3))]).fit(X, y)
+
+    registry.register('union_xgb_bin', model)
+    version_dir = os.path.join(registry.registry_dir, 'union_xgb_bin', 'v0001')
+    assert os.path.exists(os.path.join(version_dir, NATIVE_MODEL_FILES['xgboost']))
+    assert registry.load_meta('union_xgb_bin')['native_file'] == NATIVE_MODEL_FILES['xgboost']
+
+    # Only an unfitted copy of the booster is pickled
+    import joblib
+    pickled = joblib.load(os.path.join(version_dir, PIPELINE_FILE))
+    assert not hasattr(pickled.steps[-1][1], '_Booster')
+
+    loaded = registry.load('union_xgb_bin')
+    np.testing.assert_allclose(loaded.predict_proba(X), model.predict_proba(X))
+
+
+def test_pin_unpin_resolve(registry):
+    X, y = make_xy()
+    with pytest.raises(ValueError, match='No versions of union_rf_bin'):
+        registry.resolve('union_rf_bin')
+
+    for max_depth in [2, 3, 4]:
+        registry.register('union_rf_bin', fit_rf(X, y, max_depth=max_depth))
+
+    assert registry.resolve('union_rf_bin') == 3
+    assert registry.resolve('union_rf_bin', 1) == 1
+
+    registry.pin('union_rf_bin', 2)
+    assert registry.pinned('union_rf_bin') == 2
+    assert registry.resolve('union_rf_bin') == 2
+    assert registry.load('union_rf_bin').steps[-1][1].max_depth == 3
+    assert registry.list_versions('union_rf_bin')['pinned'].tolist() == [False, True, False]
+
+    with pytest.raises(ValueError, match='has no version 5'):
+        registry.pin('union_rf_bin', 5)
+    assert registry.pinned('union_rf_bin') == 2
+
+    registry.unpin('union_rf_bin')
+    assert registry.pinned('union_rf_bin') is None
+    assert registry.resolve('union_rf_bin') == 3
+    # Unpinning again is a no-op
+    registry.unpin('union_rf_bin')
+
+
+def test_register_skips_version_taken_meanwhile(registry, monkeypatch):
+    X, y = make_xy()
+    model = fit_rf(X, y)
+    assert [registry.register('union_rf_bin', model) for _ in range(2)] == [1, 2]
+
+    # Another process registers version 3 after this one has listed the versions
+    os.makedirs(os.path.join(registry.registry_dir, 'union_rf_bin', 'v0003', 'taken'))
+    monkeypatch.setattr(registry, 'versions', lambda name: [1, 2])
+
+    assert registry.register('union_rf_bin', model) == 4
+    assert os.listdir(os.path.join(registry.registry_dir, 'union_rf_bin', 'v0003')) == ['taken']
+    assert not [entry for entry in os.listdir(os.path.join(registry.registry_dir, 'union_rf_bin'))
+                if entry.startswith('.tmp_')]
+
+
+def test_load_lookup_and_shap_need_their_tables(registry):
+    X, y = make_xy()
+    registry.register('union_rf_bin', fit_rf(X, y))
+
+    with pytest.raises(ValueError, match='no lookup table'):
+        registry.load_lookup('union_rf_bin')
+    with pytest.raises(ValueError, match='no SHAP table'):
+        registry.load_shap('union_rf_bin')
+    with pytest.raises(ValueError, match='shap_table requires lookup_cols'):
+        registry.register('union_rf_bin', fit_rf(X, y), shap_table=True)
+
+
+def test_compare_keeps_only_differing_params(registry):
+    X, y = make_xy()
+    registry.register('union_rf_bin', fit_rf(X, y, max_depth=2), {'balanced_accuracy': 0.6})
+    registry.register('union_rf_bin', fit_rf(X, y, max_depth=4), {'balanced_accuracy': 0.65})
+
+    comparison = registry.compare('union_rf_bin')
+
+    assert comparison.columns.tolist() == ['v1', 'v2']
+    assert comparison.loc['balanced_accuracy'].tolist() == [0.6, 0.65]
+    assert comparison.loc['param: max_depth'].tolist() == ['2', '4']
+    assert [row for row in comparison.index if row.startswith('param: ')] == ['param: max_depth']
+    assert comparison.loc['model_class'].tolist() == ['RandomForestClassifier'] * 2
@@ -0,0 +1,100 @@
+import os
+import asyncio
+import zipfile
+
+import pandas as pd
+import pytest
+
+pytest.importorskip('aiohttp')
+
+from county_data_functions import CountyStore
+from refresh_county_data import CountyRefresher
+
+
+## Raw registrations in the NCSBE format
+RAW_VREG_TEXT = (
+    'ncid\tvoter_status_desc\treason_cd\tres_city_desc\trace_code\tparty_cd\t'
+    'gender_code\tbirth_age\tbirth_state\tdrivers_lic\tregistr_dt\tbirth_year\n'
+    + ''.join('AA{}\tACTIVE\tAV\tMONROE\tW\tREP\tF\t47\tNC\tY\t04/25/2019\t1973\n'.format(i)
+              for i in range(100))
+)
+
+
+def serve_zip(server, name, text=RAW_VREG_TEXT):
+    with zipfile.ZipFile('{}/{}'.format(server.root, name), 'w',
+                         compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr(name.replace('.zip', '.txt'), text.encode('ISO-8859-1'))
+
+
+def serve_bytes(server, name, data):
+    with open('{}/{}'.format(server.root, name), 'wb') as f:
+        f.write(data)
+
+
+def get_refresher(server, tmp_path, county_ids):
+    return CountyRefresher(data_dir=str(tmp_path / 'raw'), store_dir=str(tmp_path / 'counties'),
+                           county_ids=county_ids, base_url=server.url, max_retries=1,
+                           backoff_base=0.01, clean_workers=1)
+
+
+def conditional_gets(server, name):
+    return ['If-None-Match' in headers for method, file_name, headers in server.requests
+            if method == 'GET' and file_name == name]
+
+
+def test_refresh_downloads_cleans_and_skips_unchanged(file_server, tmp_path):
+    for kind in ['ncvoter', 'ncvhis']:
+        serve_zip(file_server, '{}1.zip'.format(kind))
+    refresher = get_refresher(file_server, tmp_path, [1])
+
+    assert asyncio.run(refresher.refresh_all()) == 2
+    vreg_df, _ = CountyStore(refresher.store_dir)._read_partition(1)
+    assert len(vreg_df) == 100
+
+    # The validation summary is saved with the partition
+    summary = pd.read_csv(os.path.join(refresher.store_dir, '001', 'quality_summary.csv'))
+    assert summary.set_index('rule').loc['total', 'n_rows'] == 0
+
+    # Unchanged files get a 304 Not Modified and aren't cleaned again
+    assert asyncio.run(refresher.refresh_all()) == 0
+    assert conditional_gets(file_server, 'ncvoter1.zip') == [False, True]
+    assert refresher.state['ncvoter1.zip']['n_rows'] == 100
+
+
+def test_failed_clean_is_downloaded_again(file_server, tmp_path):
+    serve_bytes(file_server, 'ncvoter1.zip', b'not a zip archive')
+    refresher = get_refresher(file_server, tmp_path, [1])
+    refresher.kinds = ['ncvoter']
+
+    assert asyncio.run(refresher.refresh_all()) == 0
+    file_state = refresher.state['ncvoter1.zip']
+    assert file_state.get('etag') is None
+    assert 'Not a zip' in file_state['last_error']
+
+    # The validators weren't saved, so the next refresh downloads and cleans it again
+    serve_zip(file_server, 'ncvoter1.zip')
+    assert asyncio.run(refresher.refresh_all()) == 1
+    assert conditional_gets(file_server, 'ncvoter1.zip') == [False, False]
+    assert refresher.state['ncvoter1.zip']['last_error'] is None
+    assert refresher.state['ncvoter1.zip']['etag'] is not None
+
+
+def test_one_failed_file_doesnt_stop_the_others(file_server, tmp_path):
+    serve_zip(file_server, 'ncvoter1.zip')
+    serve_bytes(file_server, 'ncvoter2.zip', b'not a zip archive')
+    serve_zip(file_server, 'ncvoter3.zip')
+    file_server.fail.add('ncvoter3.zip')
+
+    refresher = get_refresher(file_server, tmp_path, [1, 2, 3])
+    refresher.kinds = ['ncvoter']
+
+    assert asyncio.run(refresher.refresh_all()) == 1
+
+    status = refresher.status().set_index('county_id')
+    assert pd.isna(status.loc[1, 'last_error'])
+    assert 'Not a zip' in status.loc[2, 'last_error']
+    assert '500' in status.loc[3, 'last_error']
+    assert status.loc[3, 'n_failures'] == 2
+
+    # Errors are kept across restarts
+    assert get_refresher(file_server, tmp_path, [2]).state['ncvoter2.zip']['n_failures'] == 1
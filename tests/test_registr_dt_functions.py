@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from registr_dt_functions import RegistrTimeSeries
+
+
+## pandas frequency equivalent to each query freq: periods labeled by the day they start
+GROUPER_FREQS = {'D': 'D', 'W': 'W-MON', 'M': 'MS'}
+
+
+@pytest.fixture
+def registrations():
+    """Registrations over 2020 with quiet spells, where 'Other' only registers in
+        spring, and a voter with no registration date."""
+
+    rng = np.random.RandomState(0)
+    days = pd.to_datetime('2020-01-01') + pd.to_timedelta(rng.randint(0, 366, size=2000), 'D')
+    days = days[(days.month != 7)]
+    party = rng.choice(['Dem', 'Rep'], size=len(days)).astype(object)
+
+    spring = pd.to_datetime(['2020-04-02', '2020-04-02', '2020-05-20'])
+    df = pd.DataFrame({'registr_dt': days.append(spring),
+                       'party_grp': np.append(party, ['Other'] * 3)})
+
+    return pd.concat([df, pd.DataFrame({'registr_dt': [pd.NaT], 'party_grp': ['Dem']})],
+                     ignore_index=True)
+
+
+def count_by_hand(df, group_col, start, end, freq):
+    in_range = df[(df['registr_dt'] >= start) & (df['registr_dt'] <= end)]
+    counts = in_range.groupby([pd.Grouper(key='registr_dt', freq=GROUPER_FREQS[freq],
+                                          closed='left', label='left'),
+                               group_col]).size()
+
+    return counts.unstack(fill_value=0)
+
+
+@pytest.mark.parametrize('freq', ['D', 'W', 'M'])
+def test_query_matches_groupby(registrations, freq):
+    series = RegistrTimeSeries(registrations, group_cols=['party_grp'])
+    start, end = pd.Timestamp('2020-02-12'), pd.Timestamp('2020-10-20')
+
+    counts = series.query('party_grp', start, end, freq)
+    expected = count_by_hand(registrations, 'party_grp', start, end, freq)
+
+    # Every period in the range is returned, including those without registrations
+    periods = pd.date_range(expected.index[0], end, freq=GROUPER_FREQS[freq])
+    assert counts.index.equals(periods)
+    expected = expected.reindex(periods, fill_value=0).set_axis(counts.index)
+    assert (expected.sum(axis=1) == 0).any()
+
+    pd.testing.assert_frame_equal(counts, expected, check_names=False, check_dtype=False,
+                                  check_freq=False, check_column_type=False)
+
+
+@pytest.mark.parametrize('freq', ['D', 'W', 'M'])
+def test_cumulative_query_matches_groupby(registrations, freq):
+    series = RegistrTimeSeries(registrations, group_cols=['party_grp'])
+    start, end = pd.Timestamp('2020-02-12'), pd.Timestamp('2020-10-20')
+
+    counts = series.query('party_grp', start, end, freq, cumulative=True)
+
+    # Totals from the first registration up to the end of each period (or end)
+    all_counts = count_by_hand(registrations, 'party_grp', registrations['registr_dt'].min(),
+                               end, 'D').cumsum()
+    period_ends = [min(label - pd.Timedelta(days=1), end)
+                   for label in list(counts.index[1:]) + [end + pd.Timedelta(days=1)]]
+    expected = all_counts.reindex(pd.date_range(all_counts.index[0], end)).ffill()
+    expected = expected.loc[period_ends].set_axis(counts.index)
+
+    pd.testing.assert_frame_equal(counts, expected, check_names=False, check_dtype=False,
+                                  check_freq=False, check_column_type=False)
+
+
+def test_query_all_and_missing_dates(registrations):
+    series = RegistrTimeSeries(registrations, group_cols=['party_grp'])
+
+    assert series.n_missing == 1
+    assert series.query(freq='M')['All'].sum() == len(registrations) - 1
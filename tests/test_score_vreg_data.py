@@ -0,0 +1,51 @@
+import zipfile
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('pyarrow')
+
+import stream_vreg_data
+from lookup_scorer_functions import LookupScorer
+from score_vreg_data import score_vreg_file
+
+
+## Raw registrations in the NCSBE format, alternating between two parties
+RAW_VREG_TEXT = (
+    'ncid\tvoter_status_desc\treason_cd\tres_city_desc\trace_code\tparty_cd\t'
+    'gender_code\tbirth_age\tbirth_state\tdrivers_lic\tregistr_dt\tbirth_year\n'
+    + ''.join('AA{}\tACTIVE\tAV\tMONROE\tW\t{}\tF\t47\tNC\tY\t04/25/2019\t1973\n'.format(
+        i, ['REP', 'DEM'][i % 2]) for i in range(50))
+)
+
+
+@pytest.fixture
+def archive_path(tmp_path):
+    path = str(tmp_path / 'ncvoter90.zip')
+    with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('ncvoter90.txt', RAW_VREG_TEXT.encode('ISO-8859-1'))
+    return path
+
+
+@pytest.fixture
+def model_path(tmp_path):
+    # Republicans vote with probability 0.8, Democrats 0.6
+    scorer = LookupScorer(['party_grp'], [['Dem', 'Rep']],
+                          np.array([[0.4, 0.6], [0.2, 0.8]]), ['No Vote', 'Vote'])
+    path = str(tmp_path / 'model.npz')
+    scorer.save(path)
+    return path
+
+
+def test_score_vreg_file_with_pyarrow_default(tmp_path, archive_path, model_path, monkeypatch):
+    # Chunked scoring reads with pandas even when pyarrow is the default engine
+    monkeypatch.setattr(stream_vreg_data, 'reader_engine', 'pyarrow')
+    out_path = str(tmp_path / 'scores.parquet')
+
+    stats = score_vreg_file(archive_path, model_path, out_path, chunksize=20, workers=1)
+
+    assert (stats['n_read'], stats['n_scored'], stats['n_quarantined']) == (50, 50, 0)
+    scores = pd.read_parquet(out_path)
+    assert scores['ncid'].tolist() == ['AA{}'.format(i) for i in range(50)]
+    np.testing.assert_allclose(scores['p_vote'], [0.8, 0.6] * 25)
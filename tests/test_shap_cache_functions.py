@@ -0,0 +1,71 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+shap = pytest.importorskip('shap')
+
+from sklearn.tree import DecisionTreeClassifier
+
+from shap_cache_functions import ShapCache
+
+
+## One-hot style features with repeated rows
+X = pd.DataFrame(np.random.RandomState(0).randint(0, 2, size=(200, 3)),
+                 columns=['party_Rep', 'race_W', 'drivers_lic_Y']).astype(float)
+Y = (X['party_Rep'] + X['race_W'] > 0).astype(int)
+
+
+@pytest.fixture
+def model():
+    return DecisionTreeClassifier(max_depth=3, random_state=0).fit(X, Y)
+
+
+def list_entries(cache):
+    return sorted(name for name in os.listdir(cache.cache_dir) if name.endswith('.npz'))
+
+
+class ConstantExplainer:
+    """Explainer of a type the cache can't describe."""
+
+    expected_value = 0.5
+
+    def shap_values(self, X):
+        return np.ones(np.shape(X))
+
+
+def test_default_explainer_shares_entry(tmp_path, model):
+    cache = ShapCache(str(tmp_path))
+
+    default = cache.shap_values(model, X)
+    explicit = cache.shap_values(model, X, explainer=shap.TreeExplainer(model))
+
+    assert len(list_entries(cache)) == 1
+    np.testing.assert_array_equal(np.asarray(default.values), np.asarray(explicit.values))
+
+
+def test_explainer_settings_are_keyed(tmp_path, model):
+    cache = ShapCache(str(tmp_path))
+
+    raw = cache.shap_values(model, X)
+    proba = cache.shap_values(model, X, explainer=shap.TreeExplainer(
+        model, X.iloc[:20], model_output='probability'))
+
+    assert len(list_entries(cache)) == 2
+    assert not np.allclose(np.asarray(raw.values), np.asarray(proba.values))
+
+    # A different background dataset is a different entry
+    cache.shap_values(model, X, explainer=shap.TreeExplainer(
+        model, X.iloc[20:40], model_output='probability'))
+    assert len(list_entries(cache)) == 3
+
+
+def test_other_explainers_are_not_cached(tmp_path, model):
+    cache = ShapCache(str(tmp_path))
+
+    shap_values = cache.shap_values(model, X, explainer=ConstantExplainer())
+
+    assert list_entries(cache) == []
+    assert shap_values.expected_value == 0.5
+    np.testing.assert_array_equal(shap_values.values, np.ones(X.shape))
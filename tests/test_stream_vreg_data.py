@@ -0,0 +1,166 @@
+import io
+import struct
+import zipfile
+
+import pandas as pd
+import pytest
+
+from stream_vreg_data import iter_unzip, stream_vreg_table
+
+
+## Small tab-delimited file in the NCSBE format, with a non-ASCII character
+VREG_TEXT = ''.join(
+    ['ncid\tlast_name\tparty_cd\tbirth_year\n']
+    + ['AA{}\tMU\xd1OZ\t{}\t{}\n'.format(i, ['DEM', 'REP', 'UNA'][i % 3], 1940 + i % 60)
+       for i in range(5000)]
+).encode('ISO-8859-1')
+
+
+## Zip writer target without seek/tell, which makes zipfile write data descriptors
+class UnseekableBuffer(io.RawIOBase):
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.data += b
+        return len(b)
+
+
+def make_zip(data, method=zipfile.ZIP_DEFLATED, descriptor=False):
+    """Returns the bytes of a zip archive holding data as its only file."""
+    target = UnseekableBuffer() if descriptor else io.BytesIO()
+
+    with zipfile.ZipFile(target, 'w', compression=method) as zf:
+        with zf.open('ncvoter90.txt', 'w') as f:
+            f.write(data)
+
+    return bytes(target.data) if descriptor else target.getvalue()
+
+
+def split_blocks(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def serve(server, name, data):
+    with open('{}/{}'.format(server.root, name), 'wb') as f:
+        f.write(data)
+    return server.url + name
+
+
+@pytest.mark.parametrize('method', [zipfile.ZIP_DEFLATED, zipfile.ZIP_STORED])
+@pytest.mark.parametrize('block_size', [1, 7, 4096])
+def test_iter_unzip_without_descriptor(method, block_size):
+    archive = make_zip(VREG_TEXT, method)
+    assert not struct.unpack('<H', archive[6:8])[0] & 0x08
+
+    assert b''.join(iter_unzip(split_blocks(archive, block_size))) == VREG_TEXT
+
+
+@pytest.mark.parametrize('block_size', [1, 7, 4096])
+def test_iter_unzip_with_data_descriptor(block_size):
+    archive = make_zip(VREG_TEXT, descriptor=True)
+    assert struct.unpack('<H', archive[6:8])[0] & 0x08
+
+    assert b''.join(iter_unzip(split_blocks(archive, block_size))) == VREG_TEXT
+
+
+def test_iter_unzip_rejects_stored_data_descriptor():
+    # Stored data followed by a descriptor has no length to stop at
+    archive = make_zip(VREG_TEXT, zipfile.ZIP_STORED, descriptor=True)
+
+    with pytest.raises(ValueError, match='Unsupported'):
+        list(iter_unzip([archive]))
+
+
+def test_iter_unzip_crc_mismatch_stored():
+    archive = make_zip(VREG_TEXT, zipfile.ZIP_STORED)
+
+    # Flip a byte of the stored data, just after the local header and file name
+    data_start = 30 + len('ncvoter90.txt')
+    corrupt = bytearray(archive)
+    corrupt[data_start + 100] ^= 0xFF
+
+    with pytest.raises(ValueError, match='CRC-32'):
+        list(iter_unzip([bytes(corrupt)]))
+
+
+def test_iter_unzip_crc_mismatch_in_descriptor():
+    archive = make_zip(VREG_TEXT, descriptor=True)
+
+    # The descriptor (signature, CRC, sizes) directly precedes the central directory
+    descriptor_start = archive.index(b'PK\x07\x08')
+    corrupt = bytearray(archive)
+    corrupt[descriptor_start + 4] ^= 0xFF
+
+    assert b''.join(iter_unzip([archive])) == VREG_TEXT
+    with pytest.raises(ValueError, match='CRC-32'):
+        list(iter_unzip([bytes(corrupt)]))
+
+
+def test_iter_unzip_truncated_archive():
+    archive = make_zip(VREG_TEXT)
+
+    with pytest.raises(ValueError, match='ended'):
+        list(iter_unzip([archive[:len(archive) // 2]]))
+
+
+def test_iter_unzip_not_a_zip():
+    with pytest.raises(ValueError, match='Not a zip'):
+        list(iter_unzip([VREG_TEXT]))
+
+
+@pytest.mark.parametrize('descriptor', [False, True])
+@pytest.mark.parametrize('engine', ['pandas', 'pyarrow'])
+def test_stream_vreg_table_over_http(file_server, descriptor, engine):
+    if engine == 'pyarrow':
+        pytest.importorskip('pyarrow')
+
+    url = serve(file_server, 'ncvoter90.zip', make_zip(VREG_TEXT, descriptor=descriptor))
+    dtype = {'ncid': str, 'last_name': str, 'party_cd': 'category', 'birth_year': 'int64'}
+
+    streamed = stream_vreg_table(url, block_size=1000, queue_blocks=2, engine=engine,
+                                 dtype=dtype)
+    expected = pd.read_table(io.BytesIO(VREG_TEXT), encoding='ISO-8859-1', dtype=dtype)
+
+    pd.testing.assert_frame_equal(streamed.astype(object), expected.astype(object))
+    assert streamed['last_name'].iloc[0] == 'MU\xd1OZ'
+
+
+def test_stream_vreg_table_chunks_over_http(file_server):
+    url = serve(file_server, 'ncvoter90.zip', make_zip(VREG_TEXT))
+
+    chunks = list(stream_vreg_table(url, engine='pandas', chunksize=1000))
+
+    assert [len(chunk) for chunk in chunks] == [1000] * 5
+    assert pd.concat(chunks)['ncid'].tolist() == ['AA{}'.format(i) for i in range(5000)]
+
+
+def test_stream_vreg_table_crc_error_over_http(file_server):
+    archive = make_zip(VREG_TEXT, descriptor=True)
+    corrupt = bytearray(archive)
+    corrupt[archive.index(b'PK\x07\x08') + 4] ^= 0xFF
+    url = serve(file_server, 'ncvoter90.zip', bytes(corrupt))
+
+    with pytest.raises(ValueError, match='CRC-32'):
+        stream_vreg_table(url, engine='pandas')
+
+
+def test_stream_vreg_table_http_error(file_server):
+    file_server.fail.add('ncvoter90.zip')
+
+    with pytest.raises(IOError):
+        stream_vreg_table(file_server.url + 'ncvoter90.zip', engine='pandas')
+
+
+def test_stream_vreg_table_pyarrow_rejects_chunksize(file_server):
+    url = serve(file_server, 'ncvoter90.zip', make_zip(VREG_TEXT))
+
+    with pytest.raises(ValueError, match="engine='pandas'"):
+        stream_vreg_table(url, engine='pyarrow', chunksize=1000)
+
+    # Rejected before any download starts
+    assert file_server.requests == []
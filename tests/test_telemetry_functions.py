@@ -0,0 +1,71 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+from telemetry_functions import ResourceSampler, parse_catboost_info, read_catboost_tsv
+
+
+## catboost_info directory committed with the repo: a main training run and the logs
+  # of a 3-fold catboost.cv, whose fold_0_learn_error.tsv has lines that ran together
+CATBOOST_INFO = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                             'catboost_info')
+
+
+def test_read_catboost_tsv():
+    log = read_catboost_tsv(os.path.join(CATBOOST_INFO, 'learn_error.tsv'))
+
+    first = log[log['iteration'] == 0].set_index('metric')['value']
+    assert first.to_dict() == {'Logloss': 0.6839225996,
+                               'Accuracy:use_weights=true': 0.6197796344,
+                               'Accuracy:use_weights=false': 0.7155448525}
+    assert log['iteration'].max() == 326
+
+
+def test_read_catboost_tsv_numbers_repeated_metrics():
+    log = read_catboost_tsv(os.path.join(CATBOOST_INFO, 'fold_0_test_error.tsv'))
+
+    # One Logloss column per fold's test set
+    first = log[(log['iteration'] == 0) & (log['metric'] == 'Logloss')]
+    assert first['set_idx'].tolist() == [0, 1, 2]
+    assert first['value'].tolist() == [0.690853969, 0.6908197294, 0.6908373978]
+
+
+def test_read_catboost_tsv_warns_about_malformed_rows():
+    with pytest.warns(UserWarning, match='Skipped 5 malformed rows of .*fold_0_learn_error.tsv'):
+        log = read_catboost_tsv(os.path.join(CATBOOST_INFO, 'fold_0_learn_error.tsv'))
+
+    # Only the well-formed rows are kept, with the values of their own iteration
+    iterations = log.loc[log['metric'] == 'Logloss', 'iteration']
+    assert len(iterations) == 15
+    assert iterations.is_monotonic_increasing
+    assert iterations.iloc[:5].tolist() == [0, 1, 2, 3, 4]
+    assert log.loc[(log['iteration'] == 3) & (log['metric'] == 'Logloss'),
+                   'value'].item() == 0.6840037162
+
+
+def test_parse_catboost_info():
+    with pytest.warns(UserWarning, match='Skipped 5 malformed rows'):
+        logs = parse_catboost_info(CATBOOST_INFO)
+
+    counts = logs.groupby([logs['fold'].fillna(-1), 'dataset']).size().to_dict()
+    assert counts == {(-1, 'learn'): 327 * 3, (-1, 'test'): 327 * 3, (-1, 'time'): 327 * 2,
+                      (0, 'learn'): 15 * 3, (0, 'test'): 1000 * 3, (0, 'test_1'): 1000 * 3,
+                      (0, 'test_2'): 1000 * 3, (0, 'time'): 1000 * 2}
+
+    # Times are converted from milliseconds to seconds
+    passed = logs[logs['fold'].isna() & (logs['metric'] == 'passed_s')]
+    assert passed['value'].iloc[0] == pytest.approx(0.099)
+
+
+def test_resource_sampler_without_psutil_or_resource(monkeypatch):
+    # As on Windows without psutil installed
+    monkeypatch.setitem(sys.modules, 'resource', None)
+    sampler = ResourceSampler()
+    sampler.psutil = None
+
+    costs = sampler.start().stop()
+
+    assert costs['wall_s'] >= 0 and costs['cpu_s'] >= 0
+    assert np.isnan(costs['peak_mb'])
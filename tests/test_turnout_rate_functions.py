@@ -0,0 +1,81 @@
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import turnout_rate_functions
+from turnout_rate_functions import get_turnout_rates, turnout_rates, wilson_ci
+
+
+@pytest.fixture
+def gen_elecs():
+    """Voters of three general elections, where Republicans only appear from
+        2016 on and some party values are missing."""
+
+    rng = np.random.RandomState(0)
+    n = 3000
+    df = pd.DataFrame({
+        'year': rng.choice([2012, 2016, 2020], size=n),
+        'party_grp': rng.choice(['Dem', 'Rep', 'Other', None], size=n),
+        'gender_code': rng.choice(['F', 'M', 'U'], size=n),
+        'vote_bin': rng.choice(['Y', 'N'], size=n, p=[0.6, 0.4])
+    })
+    df.loc[(df['year'] == 2012) & (df['party_grp'] == 'Rep'), 'party_grp'] = 'Dem'
+
+    return df
+
+
+def test_wilson_ci():
+    low, high = wilson_ci([5, 0, 10, 0], [10, 10, 10, 0])
+
+    # Wilson score interval: (p + z²/2n ± z sqrt(p(1-p)/n + z²/4n²)) / (1 + z²/n)
+    z = 1.96
+    for successes, n, lo, hi in zip([5, 0, 10], [10, 10, 10], low, high):
+        p = successes / n
+        center = (p + z**2 / (2 * n)) / (1 + z**2 / n)
+        half_width = z * np.sqrt(p * (1 - p) / n + z**2 / (4 * n**2)) / (1 + z**2 / n)
+        assert (lo, hi) == pytest.approx((center - half_width, center + half_width))
+
+    assert low[0] == pytest.approx(0.2366, abs=1e-4) and high[0] == pytest.approx(0.7634, abs=1e-4)
+    assert low[1] == pytest.approx(0) and high[2] == pytest.approx(1)
+    assert np.isnan(low[3]) and np.isnan(high[3])
+
+
+def test_turnout_rates_match_groupby(gen_elecs):
+    group_cols = ['party_grp', 'gender_code']
+    rates = turnout_rates(gen_elecs, group_cols=group_cols)
+
+    for col in group_cols:
+        by_hand = (gen_elecs.assign(**{col: gen_elecs[col].fillna('Missing'),
+                                       'voted': gen_elecs['vote_bin'] == 'Y'})
+                   .groupby(['year', col])['voted'].agg(['size', 'sum']))
+
+        col_rates = rates[rates['group_col'] == col].set_index(['year', 'subgroup'])
+        col_rates.index.names = ['year', col]
+
+        # Only cells with voters, e.g. no 2012 Republicans
+        assert col_rates.index.sort_values().equals(by_hand.index)
+        col_rates = col_rates.loc[by_hand.index]
+
+        np.testing.assert_array_equal(col_rates['n'], by_hand['size'])
+        np.testing.assert_array_equal(col_rates['n_voted'], by_hand['sum'])
+        np.testing.assert_allclose(col_rates['rate'], by_hand['sum'] / by_hand['size'])
+
+        low, high = wilson_ci(by_hand['sum'], by_hand['size'])
+        np.testing.assert_allclose(col_rates['ci_low'], low)
+        np.testing.assert_allclose(col_rates['ci_high'], high)
+
+
+def test_get_turnout_rates_keeps_recent_tables(gen_elecs, monkeypatch):
+    monkeypatch.setattr(turnout_rate_functions, '_rate_cache', OrderedDict())
+    monkeypatch.setattr(turnout_rate_functions, 'max_cached_rates', 2)
+
+    first = get_turnout_rates(gen_elecs, group_cols=['party_grp'])
+    assert get_turnout_rates(gen_elecs, group_cols=['party_grp']) is first
+
+    for year in [2012, 2016, 2020]:
+        get_turnout_rates(gen_elecs[gen_elecs['year'] != year], group_cols=['party_grp'])
+
+    assert len(turnout_rate_functions._rate_cache) == 2
+    assert get_turnout_rates(gen_elecs, group_cols=['party_grp']) is not first
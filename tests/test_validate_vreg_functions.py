@@ -0,0 +1,59 @@
+import os
+import logging
+
+import pandas as pd
+
+from validate_vreg_functions import report_validation, validate_vreg
+
+
+## Raw registrations: a valid voter, a voter registered before turning 16
+  # and a voter with an unknown gender code
+RAW_VREG = pd.DataFrame({
+    'ncid': ['AA1', 'AA2', 'AA3'],
+    'voter_status_desc': ['ACTIVE', 'ACTIVE', 'ACTIVE'],
+    'race_code': ['W', 'B', 'W'],
+    'gender_code': ['F', 'M', 'X'],
+    'birth_age': [47.0, 30.0, 60.0],
+    'birth_state': ['NC', 'NC', 'NY'],
+    'drivers_lic': ['Y', 'N', 'Y'],
+    'registr_dt': ['04/25/2019', '01/02/2000', '10/09/2020'],
+    'birth_year': [1973.0, 1990.0, 1960.0]
+})
+
+
+def test_validate_vreg_quarantines_violating_rows():
+    valid_df, quarantine_df, summary = validate_vreg(RAW_VREG, ref_date='2021-01-04')
+
+    assert valid_df['ncid'].tolist() == ['AA1']
+    assert quarantine_df['reasons'].tolist() == ['registr_too_young', 'gender_domain']
+    assert summary.set_index('rule').loc['total', 'n_rows'] == 2
+
+
+def test_report_validation_logs_and_saves(tmp_path, caplog):
+    quarantine_dir = str(tmp_path / 'quarantine')
+
+    with caplog.at_level(logging.INFO, logger='validate_vreg_functions'):
+        valid_df = report_validation(*validate_vreg(RAW_VREG, ref_date='2021-01-04'),
+                                     source='ncvoter90.zip', quarantine_dir=quarantine_dir)
+
+    assert valid_df['ncid'].tolist() == ['AA1']
+
+    [record] = caplog.records
+    assert record.levelno == logging.WARNING
+    assert record.getMessage() == ('Quarantined 2 of 3 rows (66.67%) of ncvoter90.zip, '
+                                   'registr_too_young: 1, gender_domain: 1')
+
+    saved = pd.read_csv(os.path.join(quarantine_dir, 'quarantine.csv.gz'))
+    assert saved['ncid'].tolist() == ['AA2', 'AA3']
+    summary = pd.read_csv(os.path.join(quarantine_dir, 'quality_summary.csv'))
+    assert summary.set_index('rule').loc['total', 'n_rows'] == 2
+
+
+def test_report_validation_clean_data_is_info(caplog):
+    with caplog.at_level(logging.INFO, logger='validate_vreg_functions'):
+        report_validation(*validate_vreg(RAW_VREG.iloc[:1], ref_date='2021-01-04'),
+                          source='ncvoter90.zip')
+
+    [record] = caplog.records
+    assert record.levelno == logging.INFO
+    assert record.getMessage() == 'Quarantined 0 of 1 rows (0.00%) of ncvoter90.zip'
@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from vreg_snapshot_functions import (CHANGED, INSERTED, REMOVED, VregSnapshotStore, apply_delta,
+                                     prep_snapshot)
+
+
+COLS = ['ncid', 'party_cd', 'res_city_desc', 'birth_year']
+DATES = ['2020-01-06', '2020-01-13', '2020-01-20', '2020-01-27']
+
+
+@pytest.fixture
+def snapshots():
+    """Four weekly registration files with new, removed and changed voters, and
+        values that become or stop being missing."""
+
+    rng = np.random.RandomState(0)
+    snap = pd.DataFrame({'ncid': ['AA{}'.format(i) for i in range(200)],
+                         'party_cd': rng.choice(['REP', 'DEM', 'UNA', None], size=200),
+                         'res_city_desc': rng.choice(['MONROE', 'WAXHAW', np.nan], size=200),
+                         'birth_year': rng.randint(1940, 2000, size=200).astype(float)})
+    snap.loc[::17, 'birth_year'] = np.nan
+
+    snaps = [snap]
+    for week in range(1, len(DATES)):
+        snap = snap.drop(index=rng.choice(snap.index, size=5, replace=False))
+        changed = rng.choice(snap.index, size=20, replace=False)
+        snap.loc[changed, 'party_cd'] = rng.choice(['REP', 'DEM', None], size=20)
+        snap.loc[changed[:5], 'res_city_desc'] = np.nan
+        new = pd.DataFrame({'ncid': ['W{}_{}'.format(week, i) for i in range(8)],
+                            'party_cd': 'UNA', 'res_city_desc': [np.nan, 'MONROE'] * 4,
+                            'birth_year': 2002.0})
+        # Files aren't sorted by ncid
+        snap = pd.concat([new, snap], ignore_index=True)
+        snaps.append(snap)
+
+    return snaps
+
+
+@pytest.fixture
+def store(tmp_path, snapshots):
+    store = VregSnapshotStore(str(tmp_path / 'snapshots'), cols=COLS)
+    for snap, date in zip(snapshots, DATES):
+        store.add_snapshot(snap, date=date)
+    return store
+
+
+def test_as_of_round_trips_every_snapshot(store, snapshots):
+    # Reopen, so every snapshot is rebuilt from the files
+    store = VregSnapshotStore(store.store_dir)
+
+    for snap, date in zip(snapshots, DATES):
+        rebuilt = store.as_of(date)
+        assert rebuilt.equals(prep_snapshot(snap, COLS))
+
+    # Dates between snapshots get the latest one before them
+    assert store.as_of('2020-01-15').equals(store.as_of(DATES[1]))
+    assert store.latest().equals(prep_snapshot(snapshots[-1], COLS))
+
+    with pytest.raises(ValueError):
+        store.as_of('2019-12-31')
+
+
+def test_diff_between_non_adjacent_snapshots(store):
+    delta = store.diff(DATES[0], DATES[3])
+
+    old, new = store.as_of(DATES[0]), store.as_of(DATES[3])
+    assert apply_delta(old, delta, COLS[1:]).equals(new)
+
+    counts = delta['change'].value_counts()
+    assert counts[INSERTED] == 24
+    assert counts[REMOVED] == 15
+    assert set(delta.loc[delta['change'] == INSERTED, 'ncid']) == set(new['ncid']) - set(old['ncid'])
+    assert set(delta.loc[delta['change'] == REMOVED, 'ncid']) == set(old['ncid']) - set(new['ncid'])
+
+    # Adjacent snapshots are read from their stored delta
+    assert apply_delta(store.as_of(DATES[1]), store.diff(DATES[1], DATES[2]),
+                       COLS[1:]).equals(store.as_of(DATES[2]))
+
+
+def test_churn(store):
+    churn = store.churn()
+
+    assert churn['date'].tolist() == list(pd.to_datetime(DATES))
+    assert churn['n_rows'].tolist() == [200, 203, 206, 209]
+    assert churn['n_inserted'].tolist() == [200, 8, 8, 8]
+    assert churn['n_removed'].tolist() == [0, 5, 5, 5]
+    assert (churn['n_changed'].iloc[1:] > 0).all()
+    assert (churn['n_changed'].iloc[1:] <= 20).all()
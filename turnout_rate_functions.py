@@ -0,0 +1,152 @@
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+
+## Demographic columns of the general elections data to compute turnout rates for
+TURNOUT_GROUP_COLS = [
+    'gen_grp', 'party_grp', 'gender_code', 'race_grp',
+    'birth_reg_other', 'drivers_lic', 'city_grp'
+]
+
+## Cache of computed rate tables, keyed by dataset version and rate arguments,
+  # keeping only the most recently used tables
+_rate_cache = OrderedDict()
+max_cached_rates = 4
+
+
+## Define function for computing Wilson score confidence intervals
+def wilson_ci(successes, n, z=1.96):
+    """Takes arrays of success counts and totals and returns the lower and
+        upper bounds of the Wilson score interval for each proportion.
+        Cells with n=0 get NaN bounds.
+
+    Args:
+        successes (array): Number of successes (e.g. voters who voted) per cell.
+        n (array): Number of trials (e.g. registered voters) per cell.
+        z (float, optional): Standard normal quantile for the desired confidence
+            level. Defaults to 1.96 (95% interval).
+
+    Returns:
+        tuple: Arrays of lower and upper interval bounds.
+    """
+
+    successes = np.asarray(successes, dtype=np.float64)
+    n = np.asarray(n, dtype=np.float64)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        p = successes / n
+        denom = 1 + z**2 / n
+        center = (p + z**2 / (2 * n)) / denom
+        half_width = z * np.sqrt(p * (1 - p) / n + z**2 / (4 * n**2)) / denom
+
+    return center - half_width, center + half_width
+
+
+## Define function for identifying the contents of a DataFrame
+def get_dataset_version(df):
+    """Returns a hex digest that changes whenever the values of df change."""
+
+    row_hashes = pd.util.hash_pandas_object(df, index=False).values
+
+    return hashlib.sha1(row_hashes.tobytes()).hexdigest()
+
+
+## Define function for computing turnout rates for every year, group and subgroup
+def turnout_rates(df, group_cols=TURNOUT_GROUP_COLS, target_col='vote_bin',
+                  positive='Y', year_col='year', z=1.96):
+    """Computes the turnout rate and its Wilson confidence interval for every
+        (year x group column x subgroup) cell in a single pass.
+
+        Each group column's categories are given their own block of codes, so a
+        row contributes one code per group column. All codes for all rows are
+        offset by year and counted with a single np.bincount for the number of
+        registered voters and one for the number who voted.
+
+    Args:
+        df (DataFrame): General elections DataFrame with one row per registered
+            voter per election year.
+        group_cols (list of str, optional): Columns to break turnout down by.
+            Defaults to TURNOUT_GROUP_COLS.
+        target_col (str, optional): Column indicating whether the voter voted.
+            Defaults to 'vote_bin'.
+        positive (str, optional): Value of target_col counted as voting.
+            Defaults to 'Y'.
+        year_col (str, optional): Election year column. Defaults to 'year'.
+        z (float, optional): Standard normal quantile for the confidence
+            interval. Defaults to 1.96 (95% interval).
+
+    Returns:
+        DataFrame: One row per cell with columns 'year', 'group_col',
+            'subgroup', 'n', 'n_voted', 'rate', 'ci_low' and 'ci_high'.
+            Cells with no registered voters are omitted.
+    """
+
+    year_codes, years = pd.factorize(df[year_col], sort=True)
+    voted = (df[target_col].values == positive).astype(np.float64)
+
+    # Give each group column's categories their own block of codes
+    sub_codes = []
+    group_labels = []
+    subgroup_labels = []
+    offset = 0
+    for col in group_cols:
+        codes, cats = pd.factorize(df[col].fillna('Missing'), sort=True)
+        sub_codes.append(codes + offset)
+        group_labels.extend([col] * len(cats))
+        subgroup_labels.extend(cats)
+        offset += len(cats)
+
+    n_cells = len(years) * offset
+    cell_codes = (year_codes * offset)[np.newaxis, :] + np.vstack(sub_codes)
+
+    n = np.bincount(cell_codes.ravel(), minlength=n_cells)
+    n_voted = np.bincount(cell_codes.ravel(),
+                          weights=np.tile(voted, len(group_cols)),
+                          minlength=n_cells)
+
+    ci_low, ci_high = wilson_ci(n_voted, n, z=z)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rate = n_voted / n
+
+    rates = pd.DataFrame({
+        'year': np.repeat(np.asarray(years), offset),
+        'group_col': np.tile(group_labels, len(years)),
+        'subgroup': np.tile(np.asarray(subgroup_labels, dtype=object), len(years)),
+        'n': n,
+        'n_voted': n_voted.astype(np.int64),
+        'rate': rate,
+        'ci_low': ci_low,
+        'ci_high': ci_high
+    })
+
+    return rates[rates['n'] > 0].reset_index(drop=True)
+
+
+## Define function for getting turnout rates, reusing them while df is unchanged
+def get_turnout_rates(df, group_cols=TURNOUT_GROUP_COLS, target_col='vote_bin',
+                      positive='Y', year_col='year', z=1.96):
+    """Returns turnout_rates(df, ...), only recomputing the rate table when
+        the contents of df (or the arguments) have changed since the last call.
+        The most recent max_cached_rates tables are kept. Identifying df means
+        hashing every row, which takes most of the time of recomputing the
+        table, so callers that run repeatedly (like the app) should cache the
+        result by the file df was read from instead. See turnout_rates for
+        argument descriptions.
+    """
+
+    key = (get_dataset_version(df), tuple(group_cols),
+           target_col, positive, year_col, z)
+
+    if key in _rate_cache:
+        _rate_cache.move_to_end(key)
+    else:
+        _rate_cache[key] = turnout_rates(df, group_cols, target_col,
+                                         positive, year_col, z)
+        while len(_rate_cache) > max_cached_rates:
+            _rate_cache.popitem(last=False)
+
+    return _rate_cache[key]
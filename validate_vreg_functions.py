@@ -0,0 +1,240 @@
+import os
+import logging
+
+import numpy as np
+import pandas as pd
+
+
+## Logger for quarantine reports (warnings are shown even if logging isn't configured)
+logger = logging.getLogger(__name__)
+
+## Earliest plausible birth year and registration date, and NC's minimum
+  # (pre-)registration age
+MIN_BIRTH_YEAR = 1900
+MIN_REGISTR_DT = '1900-01-01'
+MIN_REGISTR_AGE = 16
+MAX_BIRTH_AGE = 125
+
+## Valid values of the coded voter registration columns
+BIRTH_STATES = [
+    'AL', 'AK', 'AZ', 'AR', 'CA', 'CO', 'CT', 'DE', 'DC', 'FL',
+    'GA', 'HI', 'ID', 'IL', 'IN', 'IA', 'KS', 'KY', 'LA', 'ME',
+    'MD', 'MA', 'MI', 'MN', 'MS', 'MO', 'MT', 'NE', 'NV', 'NH',
+    'NJ', 'NM', 'NY', 'NC', 'ND', 'OH', 'OK', 'OR', 'PA', 'RI',
+    'SC', 'SD', 'TN', 'TX', 'UT', 'VT', 'VA', 'WA', 'WV', 'WI',
+    'WY', 'AS', 'GU', 'MP', 'PR', 'VI', 'OC'
+]
+GENDER_CODES = ['F', 'M', 'U']
+RACE_CODES = ['A', 'B', 'I', 'M', 'O', 'P', 'U', 'W']
+DRIVERS_LIC_CODES = ['Y', 'N']
+VOTER_STATUSES = ['ACTIVE', 'INACTIVE', 'TEMPORARY', 'DENIED', 'REMOVED']
+
+
+## Define function for flagging non-null values outside a set of valid values
+def not_in_domain(series, domain):
+
+    # For categoricals, check the (few) categories rather than every row
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        bad_cats = ~series.cat.categories.isin(domain)
+        codes = series.cat.codes.values
+        return (codes >= 0) & bad_cats[np.maximum(codes, 0)]
+
+    return series.notna().values & ~series.isin(domain).values
+
+
+## Define function for parsing NCSBE registration dates (mm/dd/yyyy)
+def parse_registr_dt(registr_dt):
+
+    if isinstance(registr_dt.dtype, pd.CategoricalDtype):
+        registr_dt = registr_dt.astype(object)
+
+    return pd.to_datetime(registr_dt, format='%m/%d/%Y', errors='coerce')
+
+
+## Validation rules for raw voter registration data: reason code mapped to
+  # (columns needed, description, function of (df, ref_date) returning a
+  # boolean array of the rows that violate the rule)
+VREG_RULES = {
+    'birth_year_range': (
+        ['birth_year'],
+        'birth_year before {} or less than {} years ago'.format(MIN_BIRTH_YEAR, MIN_REGISTR_AGE),
+        lambda df, ref_date: ((df['birth_year'].values < MIN_BIRTH_YEAR)
+                              | (df['birth_year'].values > ref_date.year - MIN_REGISTR_AGE))
+    ),
+    'birth_age_range': (
+        ['birth_age'],
+        'birth_age under {} or over {}'.format(MIN_REGISTR_AGE, MAX_BIRTH_AGE),
+        lambda df, ref_date: ((df['birth_age'].values < MIN_REGISTR_AGE)
+                              | (df['birth_age'].values > MAX_BIRTH_AGE))
+    ),
+    'birth_state_domain': (
+        ['birth_state'],
+        'birth_state is not a U.S. state, territory or OC (out of country)',
+        lambda df, ref_date: not_in_domain(df['birth_state'], BIRTH_STATES)
+    ),
+    'registr_dt_invalid': (
+        ['registr_dt'],
+        'registr_dt missing, unparseable, before {} or in the future'.format(MIN_REGISTR_DT[:4]),
+        lambda df, ref_date: (df['_registr_dt'].isna().values
+                              | (df['_registr_dt'].values < np.datetime64(MIN_REGISTR_DT))
+                              | (df['_registr_dt'].values > np.datetime64(ref_date)))
+    ),
+    'registr_too_young': (
+        ['registr_dt', 'birth_year'],
+        'registered before turning {}'.format(MIN_REGISTR_AGE),
+        lambda df, ref_date: (df['_registr_dt'].dt.year.values - df['birth_year'].values
+                              < MIN_REGISTR_AGE)
+    ),
+    'gender_domain': (
+        ['gender_code'],
+        'gender_code not in {}'.format(GENDER_CODES),
+        lambda df, ref_date: not_in_domain(df['gender_code'], GENDER_CODES)
+    ),
+    'race_domain': (
+        ['race_code'],
+        'race_code not in {}'.format(RACE_CODES),
+        lambda df, ref_date: not_in_domain(df['race_code'], RACE_CODES)
+    ),
+    'drivers_lic_domain': (
+        ['drivers_lic'],
+        'drivers_lic not Y or N',
+        lambda df, ref_date: not_in_domain(df['drivers_lic'], DRIVERS_LIC_CODES)
+    ),
+    'voter_status_domain': (
+        ['voter_status_desc'],
+        'voter_status_desc not in {}'.format(VOTER_STATUSES),
+        lambda df, ref_date: not_in_domain(df['voter_status_desc'], VOTER_STATUSES)
+    ),
+    'duplicate_ncid': (
+        ['ncid'],
+        'ncid appears on more than one registration record',
+        lambda df, ref_date: df['ncid'].duplicated(keep=False).values
+    )
+}
+
+## Validation rules for raw voter history data
+VHIS_RULES = {
+    'duplicate_vote': (
+        ['ncid', 'election_lbl'],
+        'ncid recorded as voting more than once in the same election',
+        lambda df, ref_date: df.duplicated(['ncid', 'election_lbl'], keep=False).values
+    )
+}
+
+
+## Define function for applying validation rules and quarantining violating rows
+def quarantine_rows(df, rules, ref_date=None):
+    """Applies each rule whose columns are present in df as a vectorized
+        check over all rows, then splits df into the rows that pass every rule
+        and a quarantine table of the rows that violate at least one.
+
+    Args:
+        df (DataFrame): Raw data to validate.
+        rules (dict): Reason code mapped to (columns needed, description,
+            rule function), e.g. VREG_RULES or VHIS_RULES.
+        ref_date (str or datetime, optional): Date the data was retrieved,
+            for checks against the present. Defaults to now.
+
+    Returns:
+        tuple: (valid_df, quarantine_df, summary), where quarantine_df holds
+            the violating rows plus a 'reasons' column of ';'-separated reason
+            codes, and summary is a DataFrame with the number and percentage
+            of rows violating each rule (and any rule, as 'total').
+    """
+
+    ref_date = pd.Timestamp.now() if ref_date is None else pd.Timestamp(ref_date)
+    ref_date = ref_date.tz_localize(None) if ref_date.tz is not None else ref_date
+
+    checked = df
+    if 'registr_dt' in df.columns:
+        # Parse dates once for every rule that uses them
+        checked = df.assign(_registr_dt=parse_registr_dt(df['registr_dt']))
+
+    n_rows = len(df)
+    violations = {}
+    for code, (cols, descr, rule) in rules.items():
+        if all(col in df.columns for col in cols):
+            violations[code] = np.asarray(rule(checked, ref_date), dtype=bool)
+
+    any_violation = np.zeros(n_rows, dtype=bool)
+    for mask in violations.values():
+        any_violation |= mask
+
+    # Reason codes are only built for the (few) quarantined rows
+    quarantine_df = df[any_violation].copy()
+    reasons = np.full(len(quarantine_df), '', dtype=object)
+    for code, mask in violations.items():
+        hit = mask[any_violation]
+        reasons[hit] = reasons[hit] + np.where(reasons[hit] == '', '', ';') + code
+    quarantine_df['reasons'] = reasons
+
+    summary = pd.DataFrame({
+        'rule': list(violations) + ['total'],
+        'description': [rules[code][1] for code in violations] + ['violates any rule'],
+        'n_rows': [int(mask.sum()) for mask in violations.values()] + [int(any_violation.sum())]
+    })
+    summary['pct_rows'] = 100 * summary['n_rows'] / max(n_rows, 1)
+
+    return df[~any_violation], quarantine_df, summary
+
+
+## Define function for reporting (and saving) the rows quarantined by a validation
+def report_validation(valid_df, quarantine_df, summary, source, quarantine_dir=None):
+    """Logs how many rows of source were quarantined and which rules they
+        violated (as a warning if any were), and if quarantine_dir is given
+        writes the quarantined rows to quarantine.csv.gz and the summary to
+        quality_summary.csv there, replacing those of an earlier validation.
+
+    Args:
+        valid_df (DataFrame): Rows that passed validation.
+        quarantine_df (DataFrame): Quarantined rows, as from quarantine_rows.
+        summary (DataFrame): Violations per rule, as from quarantine_rows.
+        source (str): Name of the validated data (e.g. its URL) for the log.
+        quarantine_dir (str, optional): Directory to save the quarantined rows
+            and summary to. Defaults to None (only logged).
+
+    Returns:
+        DataFrame: valid_df, so the output of validate_vreg can be passed
+            straight through.
+
+    Example:
+        >>> valid_df = report_validation(*validate_vreg(raw_df), source=url)
+    """
+
+    n_quarantined = len(quarantine_df)
+    n_rows = len(valid_df) + n_quarantined
+    violated = summary[(summary['rule'] != 'total') & (summary['n_rows'] > 0)]
+
+    logger.log(
+        logging.WARNING if n_quarantined else logging.INFO,
+        'Quarantined %s of %s rows (%.2f%%) of %s%s',
+        '{:,}'.format(n_quarantined), '{:,}'.format(n_rows), 100 * n_quarantined / max(n_rows, 1),
+        source,
+        ''.join(', {}: {:,}'.format(rule, n) for rule, n in zip(violated['rule'], violated['n_rows']))
+    )
+
+    if quarantine_dir is not None:
+        os.makedirs(quarantine_dir, exist_ok=True)
+        quarantine_df.to_csv(os.path.join(quarantine_dir, 'quarantine.csv.gz'), index=False)
+        summary.to_csv(os.path.join(quarantine_dir, 'quality_summary.csv'), index=False)
+
+    return valid_df
+
+
+## Define function for validating raw voter registration data before clean_vreg
+def validate_vreg(df, ref_date=None):
+    """Checks raw voter registration data for out-of-range birth years, ages
+        and registration dates, codes outside their valid values, and
+        duplicated ncids (if the ncid column was read), quarantining the
+        violating rows. See quarantine_rows.
+    """
+    return quarantine_rows(df, VREG_RULES, ref_date)
+
+
+## Define function for validating raw voter history data
+def validate_vhis(df, ref_date=None):
+    """Checks raw voter history data for voters recorded as voting more than
+        once in the same election, quarantining the violating rows. See
+        quarantine_rows.
+    """
+    return quarantine_rows(df, VHIS_RULES, ref_date)
@@ -0,0 +1,308 @@
+import os
+import json
+
+import numpy as np
+import pandas as pd
+
+from clean_vreg_functions import VREG_COLS_USED
+
+
+## Raw columns kept in each snapshot (the unique voter ID plus what clean_vreg uses)
+SNAPSHOT_COLS = ['ncid'] + VREG_COLS_USED
+
+## Codes for the kind of change recorded for an ncid in a delta
+INSERTED = 'I'
+REMOVED = 'R'
+CHANGED = 'C'
+
+
+## Define function for preparing a raw registration DataFrame for snapshotting
+def prep_snapshot(df, cols=SNAPSHOT_COLS):
+    """Selects cols from a raw voter registration DataFrame, keeps the last
+        record for any duplicated ncid, converts all values to strings (as they
+        are read back from the archive, leaving nulls as NaN) and sorts the
+        rows by ncid.
+
+    Args:
+        df (DataFrame): Raw voter registration DataFrame with an 'ncid' column.
+        cols (list of str, optional): Columns to keep. Defaults to SNAPSHOT_COLS.
+
+    Returns:
+        DataFrame: Snapshot DataFrame sorted by ncid with a default index.
+    """
+
+    snap = df[cols].drop_duplicates(subset='ncid', keep='last')
+
+    for col in cols:
+        values = snap[col].astype(object)
+        snap[col] = values.where(values.isna(), values.astype(str))
+
+    return snap.sort_values('ncid', kind='mergesort').reset_index(drop=True)
+
+
+## Define function for storing every value of a snapshot as an object with NaN
+  # for nulls, as prep_snapshot does (reading, indexing and concatenating can
+  # otherwise leave None or pandas string columns)
+def normalize_snapshot(snap):
+
+    snap = snap.astype(object)
+
+    return snap.where(snap.notna(), np.nan)
+
+
+## Define function for comparing column values, treating two nulls as equal
+def values_differ(old_vals, new_vals):
+
+    old_vals = np.asarray(old_vals, dtype=object)
+    new_vals = np.asarray(new_vals, dtype=object)
+    both_null = pd.isna(old_vals) & pd.isna(new_vals)
+
+    return (old_vals != new_vals) & ~both_null
+
+
+## Define function for finding the per-ncid changes between two snapshots
+def diff_snapshots(old, new, cols=None):
+    """Finds the ncids inserted, removed and changed between two snapshots
+        (as returned by prep_snapshot) with a sorted merge on ncid.
+
+    Args:
+        old (DataFrame): Earlier snapshot, sorted by unique ncid.
+        new (DataFrame): Later snapshot, sorted by unique ncid.
+        cols (list of str, optional): Columns to compare. Defaults to every
+            column of new other than 'ncid'.
+
+    Returns:
+        DataFrame: Delta with one row per inserted, removed or changed ncid and
+            columns 'ncid', 'change' (INSERTED, REMOVED or CHANGED), 'changed'
+            (bitmask of which of cols changed) and cols. Inserted rows hold all
+            of their values, changed rows hold only their new values for the
+            changed columns, and removed rows hold no values.
+    """
+
+    if cols is None:
+        cols = [col for col in new.columns if col != 'ncid']
+
+    old_ids = old['ncid'].values.astype(str)
+    new_ids = new['ncid'].values.astype(str)
+
+    # Both snapshots are sorted and unique on ncid, so this is a merge join
+    _, old_pos, new_pos = np.intersect1d(old_ids, new_ids, assume_unique=True,
+                                         return_indices=True)
+    removed = np.setdiff1d(np.arange(len(old_ids)), old_pos, assume_unique=True)
+    inserted = np.setdiff1d(np.arange(len(new_ids)), new_pos, assume_unique=True)
+
+    changed_mask = np.zeros(len(old_pos), dtype=np.int64)
+    for bit, col in enumerate(cols):
+        differ = values_differ(old[col].values[old_pos], new[col].values[new_pos])
+        changed_mask |= differ.astype(np.int64) << bit
+
+    is_changed = changed_mask > 0
+    changed_pos = new_pos[is_changed]
+    changed_mask = changed_mask[is_changed]
+
+    changed_rows = new.iloc[changed_pos][['ncid'] + cols].copy()
+    for bit, col in enumerate(cols):
+        unchanged = (changed_mask >> bit) & 1 == 0
+        changed_rows[col] = changed_rows[col].astype(object).where(~unchanged)
+    changed_rows.insert(1, 'change', CHANGED)
+    changed_rows.insert(2, 'changed', changed_mask)
+
+    inserted_rows = new.iloc[inserted][['ncid'] + cols].copy()
+    inserted_rows.insert(1, 'change', INSERTED)
+    inserted_rows.insert(2, 'changed', (1 << len(cols)) - 1)
+
+    removed_rows = pd.DataFrame({'ncid': old['ncid'].values[removed],
+                                 'change': REMOVED,
+                                 'changed': 0})
+
+    delta = pd.concat([inserted_rows, removed_rows, changed_rows],
+                      ignore_index=True, sort=False)
+
+    return delta.sort_values('ncid', kind='mergesort').reset_index(drop=True)
+
+
+## Define function for applying a delta to a snapshot
+def apply_delta(snap, delta, cols=None):
+    """Returns the snapshot that results from applying delta (as returned by
+        diff_snapshots) to snap. Both are sorted by ncid.
+    """
+
+    if cols is None:
+        cols = [col for col in snap.columns if col != 'ncid']
+
+    state = snap.set_index('ncid')
+
+    drop_ids = delta.loc[delta['change'].isin([REMOVED, CHANGED]), 'ncid']
+    state = state.drop(index=drop_ids.values)
+
+    # Changed rows take their new values for changed fields, old values otherwise
+    changed = delta[delta['change'] == CHANGED].set_index('ncid')
+    changed_rows = snap.set_index('ncid').loc[changed.index, cols].copy()
+    for bit, col in enumerate(cols):
+        col_changed = ((changed['changed'].values >> bit) & 1) == 1
+        changed_rows[col] = changed_rows[col].astype(object).where(
+            ~col_changed, changed[col].values
+        )
+
+    inserted = delta[delta['change'] == INSERTED].set_index('ncid')[cols]
+
+    state = pd.concat([state, changed_rows.astype(state.dtypes.to_dict()),
+                       inserted.astype(state.dtypes.to_dict())])
+
+    return normalize_snapshot(state.sort_index(kind='mergesort').reset_index())
+
+
+
+
+## Class for archiving voter registration snapshots as a base plus deltas
+class VregSnapshotStore:
+    """Archives every retrieved voter registration file as per-ncid deltas
+        (inserted, removed and changed fields) against the previous snapshot,
+        with only the first snapshot stored in full. Storage therefore grows
+        with registration churn rather than with the number of snapshots.
+
+    Args:
+        store_dir (str): Directory to store the base, deltas and manifest in.
+        cols (list of str, optional): Columns to archive. Defaults to
+            SNAPSHOT_COLS.
+    """
+
+    def __init__(self, store_dir, cols=SNAPSHOT_COLS):
+        self.store_dir = store_dir
+        self.manifest_path = os.path.join(store_dir, 'manifest.json')
+        os.makedirs(store_dir, exist_ok=True)
+
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f)
+        else:
+            self.manifest = {'cols': list(cols), 'snapshots': []}
+
+        self.cols = self.manifest['cols']
+        self._latest = None
+
+
+    def _write_manifest(self):
+        with open(self.manifest_path, 'w') as f:
+            json.dump(self.manifest, f, indent=1)
+
+
+    def _read(self, file_name):
+        # Keep everything but the counts/ bitmask as plain values
+        df = pd.read_csv(os.path.join(self.store_dir, file_name),
+                         dtype=object, keep_default_na=False, na_values=[''])
+        if 'changed' in df.columns:
+            df['changed'] = df['changed'].astype(np.int64)
+
+        return df
+
+
+    def dates(self):
+        """Returns the dates of all archived snapshots, oldest first."""
+        return [pd.Timestamp(snap['date']) for snap in self.manifest['snapshots']]
+
+
+    def add_snapshot(self, df, date=None):
+        """Archives a newly retrieved raw voter registration DataFrame.
+
+        Args:
+            df (DataFrame): Raw voter registration DataFrame including the
+                archived columns.
+            date (str or datetime, optional): Date of the snapshot. Must be
+                later than the latest archived snapshot. Defaults to now.
+
+        Returns:
+            dict: Manifest entry for the snapshot, including the number of
+                inserted, removed and changed ncids.
+        """
+
+        date = pd.Timestamp.now() if date is None else pd.Timestamp(date)
+        snaps = self.manifest['snapshots']
+
+        if snaps and date <= pd.Timestamp(snaps[-1]['date']):
+            raise ValueError('Snapshot date must be after {}'.format(snaps[-1]['date']))
+
+        snap = prep_snapshot(df, self.cols)
+        file_stem = date.strftime('%Y%m%d_%H%M%S')
+
+        if not snaps:
+            file_name = 'base_{}.gz'.format(file_stem)
+            snap.to_csv(os.path.join(self.store_dir, file_name), index=False)
+            entry = {'n_inserted': len(snap), 'n_removed': 0, 'n_changed': 0}
+
+        else:
+            delta = diff_snapshots(self.latest(), snap, self.cols[1:])
+            file_name = 'delta_{}.gz'.format(file_stem)
+            delta.to_csv(os.path.join(self.store_dir, file_name), index=False)
+            counts = delta['change'].value_counts()
+            entry = {'n_inserted': int(counts.get(INSERTED, 0)),
+                     'n_removed': int(counts.get(REMOVED, 0)),
+                     'n_changed': int(counts.get(CHANGED, 0))}
+
+        entry.update({'date': date.isoformat(), 'file': file_name, 'n_rows': len(snap)})
+        snaps.append(entry)
+        self._write_manifest()
+        self._latest = snap
+
+        return entry
+
+
+    def latest(self):
+        """Returns the most recently archived snapshot."""
+        if self._latest is None:
+            self._latest = self.as_of(None)
+
+        return self._latest
+
+
+    def as_of(self, date=None):
+        """Reconstructs the registration snapshot as it was on date by applying
+            deltas to the base snapshot.
+
+        Args:
+            date (str or datetime, optional): Date to reconstruct. Uses the
+                latest snapshot on or before date. Defaults to the latest snapshot.
+
+        Returns:
+            DataFrame: Snapshot sorted by ncid.
+        """
+
+        snaps = self.manifest['snapshots']
+        if date is not None:
+            snaps = [snap for snap in snaps if pd.Timestamp(snap['date']) <= pd.Timestamp(date)]
+
+        if not snaps:
+            raise ValueError('No snapshot archived on or before {}'.format(date))
+
+        state = normalize_snapshot(self._read(snaps[0]['file']))
+        for snap in snaps[1:]:
+            state = apply_delta(state, self._read(snap['file']), self.cols[1:])
+
+        return state
+
+
+    def diff(self, date_a, date_b):
+        """Returns the per-ncid changes (as from diff_snapshots) between the
+            snapshots as of date_a and date_b. Adjacent snapshots are read
+            directly from the stored delta.
+        """
+
+        dates = pd.DatetimeIndex(self.dates())
+        idx_a = dates.searchsorted(pd.Timestamp(date_a), side='right') - 1
+        idx_b = dates.searchsorted(pd.Timestamp(date_b), side='right') - 1
+
+        if idx_b == idx_a + 1 and idx_a >= 0:
+            return self._read(self.manifest['snapshots'][idx_b]['file'])
+
+        return diff_snapshots(self.as_of(date_a), self.as_of(date_b), self.cols[1:])
+
+
+    def churn(self):
+        """Returns a DataFrame of the number of inserted, removed and changed
+            registrations at each archived snapshot, for a registration churn view.
+        """
+
+        churn = pd.DataFrame(self.manifest['snapshots'])
+        churn['date'] = pd.to_datetime(churn['date'])
+
+        return churn[['date', 'n_rows', 'n_inserted', 'n_removed', 'n_changed']]